@@ -0,0 +1,109 @@
+"""
+Database routing of Journaling and reporting reads.
+
+`JOURNALING_DATABASE` is the alias where Journaling is written, the rest of
+the models live in the default database. Reads of the reporting models
+(Journaling and archived sessions lists) go to the replica of their database
+from `DATABASE_REPLICAS`, unless the current request has already written
+something: then they go to the primary and see the request's own writes.
+
+Journaling doesn't join other tables in its queries, the related rows are
+fetched by `prefetch_related` from their own database.
+"""
+import threading
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, models
+
+REPORTING_MODELS = ('journaling.journaling', 'proctoring.archivedeventsession')
+
+_state = threading.local()
+
+
+def pin_primary():
+    """
+    Send the next reads of the current thread to the primary databases
+    until `unpin_primary`
+    """
+    _state.pinned = True
+
+
+def unpin_primary(**kwargs):
+    _state.pinned = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def journaling_database():
+    return getattr(settings, 'JOURNALING_DATABASE', DEFAULT_DB_ALIAS)
+
+
+def journaling_relation_options():
+    """
+    Options of the foreign keys of Journaling: rows are deleted with the referred
+    ones, unless Journaling is in its own database where neither constraints
+    nor cascades are possible, then rows outlive the referred ones
+    """
+    if journaling_database() == DEFAULT_DB_ALIAS:
+        return {'on_delete': models.CASCADE}
+    return {'on_delete': models.DO_NOTHING, 'db_constraint': False}
+
+
+class PinPrimaryMiddleware(object):
+    """
+    Every request starts reading the reporting models from the replicas,
+    writes pin the rest of the request to the primary databases.
+    Writes outside of requests (commands, the daemons) don't pin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unpin_primary()
+        _state.in_request = True
+        try:
+            return self.get_response(request)
+        finally:
+            _state.in_request = False
+            unpin_primary()
+
+
+# also for responses streamed after the middleware
+request_finished.connect(unpin_primary, dispatch_uid='db_router.unpin_primary')
+
+
+class JournalingRouter(object):
+
+    def _primary(self, model):
+        if model._meta.app_label == 'journaling':
+            return journaling_database()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        primary = self._primary(model)
+        if model._meta.label_lower in REPORTING_MODELS and not is_pinned():
+            return getattr(settings, 'DATABASE_REPLICAS', {}).get(primary, primary)
+        return primary
+
+    def db_for_write(self, model, **hints):
+        if getattr(_state, 'in_request', False):
+            pin_primary()
+        return self._primary(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Journaling refers to the rows of the default database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        journaling_db = journaling_database()
+        if journaling_db == DEFAULT_DB_ALIAS:
+            return None
+        if app_label == 'journaling':
+            return db == journaling_db
+        if db == journaling_db:
+            return False
+        return None
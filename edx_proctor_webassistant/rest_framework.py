@@ -1,6 +1,111 @@
-from rest_framework.pagination import PageNumberPagination
+import csv
+import json
+from collections import OrderedDict
 
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
-class PaginationBy25(PageNumberPagination):
+# rows are sent to the client in pieces of about this size
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pagination by the opaque cursor over `-pk`, pages are fetched by
+    `pk < last pk` without OFFSET and COUNT over the whole filtered table.
+
+    The number of rows is counted only if `?count=1` is passed, and not
+    further than `count_limit`; `count_limited` is true when there are more rows.
+    """
     page_size = 25
     page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-pk'
+    count_query_param = 'count'
+    count_limit = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.order_by()[:self.count_limit + 1].count()
+        return super(KeysetPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = min(self.count, self.count_limit)
+            response['count_limited'] = self.count > self.count_limit
+        response['results'] = data
+        return Response(response)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Lets `?format=csv` pass the content negotiation, the views
+    stream CSV themselves with `stream_csv`
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # error responses
+        return json.dumps(data, cls=JSONEncoder)
+
+
+def _buffered(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_json(rows):
+    """
+    JSON array of the serialized rows, piece by piece
+    :param rows: iterable of dicts
+    """
+    def pieces():
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(row, cls=JSONEncoder)
+            separator = ','
+        yield ']'
+    return _buffered(pieces())
+
+
+class _Echo(object):
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """
+    CSV with the header of the keys of the first row, nested values are JSON
+    :param rows: iterable of dicts
+    """
+    def pieces():
+        writer = csv.writer(_Echo())
+        fields = None
+        for row in rows:
+            if fields is None:
+                fields = list(row)
+                yield writer.writerow(fields)
+            yield writer.writerow([
+                json.dumps(row[field], cls=JSONEncoder) if isinstance(row[field], (dict, list)) else row[field]
+                for field in fields
+            ])
+    return _buffered(pieces())
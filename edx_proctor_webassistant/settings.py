@@ -64,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'edx_proctor_webassistant.db_router.PinPrimaryMiddleware',
 ]
 
 ROOT_URLCONF = 'edx_proctor_webassistant.urls'
@@ -97,6 +98,12 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['edx_proctor_webassistant.db_router.JournalingRouter']
+# alias of the database for Journaling, its tables are migrated only there
+JOURNALING_DATABASE = 'default'
+# reads of Journaling and archived sessions, e.g. {'default': 'replica'}
+DATABASE_REPLICAS = {}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -257,6 +264,10 @@ SPA_CONFIG = {
 
 FINAL_ATTEMPT_STATUSES = ['error', 'verified', 'rejected', 'deleted_in_edx', 'declined', 'timed_out']
 
+# `archive_journaling` command moves older Journaling rows into this directory
+JOURNALING_ARCHIVE_DIR = os.path.join(BASE_DIR, 'journaling_archive')
+JOURNALING_ARCHIVE_DAYS = 180
+
 NOTIFICATIONS = {
     'DAEMON_ID': '1',
     'WEB_URL': '/notifications'
@@ -274,6 +285,20 @@ LOGGING = {
         'verbose': {
             'format': '%(levelname)s %(asctime)s %(module)s %(process)d %(thread)d %(message)s'
         },
+        # key=value pairs with the fields passed by `extra`, long values are truncated
+        'kv': {
+            '()': 'notifications.logs.KeyValueFormatter',
+            'max_length': 200,
+        },
+    },
+    'filters': {
+        # one of 10 debug records of the hot paths (every message and connection)
+        'sample_debug': {
+            '()': 'notifications.logs.SamplingFilter',
+            'name': 'notifications',
+            'rate': 0.1,
+            'level': 'INFO',
+        },
     },
     'handlers': {
         'console': {
@@ -286,16 +311,25 @@ LOGGING = {
             'mode': 'w',
             'formatter': 'standard'
         },
+        # writes to the console from the background thread
+        'background': {
+            'class': 'notifications.logs.BackgroundHandler',
+            'handler_class': 'logging.StreamHandler',
+            'queue_size': 10000,
+            'formatter': 'kv',
+            'filters': ['sample_debug'],
+        },
     },
     'loggers': {
         'django': {
-            'handlers': ['console'],
+            'handlers': ['background'],
             'level': 'INFO',
             'propagate': True
         },
+        # debug records of every message reach `sample_debug` of the handler
         'notifications': {
-            'handlers': ['console'],
-            'level': 'INFO',
+            'handlers': ['background'],
+            'level': 'DEBUG',
             'propagate': True
         }
     },
@@ -316,6 +350,10 @@ except ImportError:
     from .settings_docker import *    
 #    exit()
 
+if TESTING and 'journaling' not in DATABASES:
+    # the second database of the routing tests
+    DATABASES['journaling'] = dict(DATABASES['default'], NAME=DATABASES['default']['NAME'] + '_journaling')
+
 
 INSTALLED_APPS = INSTALLED_APPS + (
     'raven.contrib.django.raven_compat',
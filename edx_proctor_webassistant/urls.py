@@ -25,7 +25,7 @@ from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.contrib.admin import site as admin_site
 
-from journaling.api_views import JournalingViewSet
+from journaling.api_views import JournalingArchiveViewSet, JournalingViewSet
 from person.api_views import PermissionViewSet
 from proctoring import api_edx_views, api_ui_views
 from sso_auth.decorators import set_token_cookie
@@ -51,6 +51,8 @@ router.register(r'archived_event_session_all',
                 base_name="archived-event-session-all")
 router.register(r'journaling', JournalingViewSet,
                 base_name="journaling")
+router.register(r'journaling_archive', JournalingArchiveViewSet,
+                base_name="journaling-archive")
 router.register(r'permission', PermissionViewSet,
                 base_name="permission")
 
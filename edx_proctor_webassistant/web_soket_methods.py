@@ -12,3 +12,16 @@ def send_notification(data, channel, action=None):
     res['course_event_id'] = int(channel)
     res['action'] = action if action else 'change_status'
     ProctorNotificator.notify(res)
+
+
+def send_cache_bust(codes=None, course_id=None):
+    """
+    Ask notification daemons to forget cached exams and courses
+    which were changed by the web assistant
+    """
+    res = {'action': 'cache_bust'}
+    if codes:
+        res['codes'] = list(codes)
+    if course_id:
+        res['course_id'] = course_id
+    ProctorNotificator.notify(res)
@@ -9,11 +9,19 @@ class JournalingAdmin(admin.ModelAdmin):
     Journaling admin
     """
     list_display = (
-        'id', 'journaling_type', 'datetime', 'event', 'proctor', 'exam'
+        'id', 'journaling_type', 'datetime', 'event', 'proctor', 'exam',
+        'http_method', 'endpoint', 'status_code', 'duration_ms'
     )
-    list_filter = ('journaling_type', 'event', 'proctor', 'datetime')
-    search_fields = ('note', 'proctor_ip')
-    readonly_fields = ('journaling_type', 'event', 'exam', 'proctor', 'datetime', 'proctor_ip')
+    list_filter = ('journaling_type', 'event', 'proctor', 'datetime', 'http_method', 'status_code')
+    search_fields = ('note', 'proctor_ip', 'endpoint')
+    # no joins, the related rows may be in another database
+    list_select_related = ()
+    readonly_fields = ('journaling_type', 'event', 'exam', 'proctor', 'datetime', 'proctor_ip',
+                       'endpoint', 'http_method', 'status_code', 'duration_ms', 'payload')
+
+    def get_queryset(self, request):
+        return super(JournalingAdmin, self).get_queryset(request).prefetch_related(
+            'proctor', 'event__course', 'exam')
 
     def has_add_permission(self, request):
         return False
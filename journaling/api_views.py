@@ -3,15 +3,23 @@ Views for UI application
 """
 from datetime import datetime, timedelta
 
-from rest_framework import mixins, viewsets
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Max
+
+from rest_framework import mixins, status, viewsets
 from rest_framework.authentication import BasicAuthentication
+from rest_framework.decorators import list_route
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from edx_proctor_webassistant.auth import SsoTokenAuthentication, \
     CsrfExemptSessionAuthentication, IsProctor
-from edx_proctor_webassistant.rest_framework import PaginationBy25
+from edx_proctor_webassistant.rest_framework import KeysetPagination
+from journaling.archive import search_archive
 from journaling.models import Journaling
 from journaling.serializers import JournalingSerializer
+from proctoring.models import EventSession, Exam
 
 
 class JournalingViewSet(mixins.ListModelMixin,
@@ -20,16 +28,25 @@ class JournalingViewSet(mixins.ListModelMixin,
     Return list of Journaling with pagiantion.
 
     You can filter results by `event_hash`, `proctor`,`exam_code`,
-    `type`, `date`
+    `type`, `date`, and calls to and from edX by `endpoint`, `method`,
+    `status_code` or its class `status` (`5` for 5xx)
 
     Add GET parameter in end of URL, for example:
 
     `?date=2015-12-04&type=8`
 
+    `stats/` groups calls by endpoint, method and status code with the same filters:
+
+    `stats/?date=2015-12-04&type=9&status=5`
+
+    Follow the `next` and `previous` links for other pages, `page_size`
+    is up to 100. Add `count=1` to get the number of results.
+
     """
     serializer_class = JournalingSerializer
-    queryset = Journaling.objects.order_by('-pk')
-    pagination_class = PaginationBy25
+    # the related rows may be in another database, see JOURNALING_DATABASE
+    queryset = Journaling.objects.prefetch_related('proctor', 'event', 'exam').order_by('-pk')
+    pagination_class = KeysetPagination
     authentication_classes = (
         SsoTokenAuthentication, CsrfExemptSessionAuthentication,
         BasicAuthentication)
@@ -44,13 +61,16 @@ class JournalingViewSet(mixins.ListModelMixin,
         queryset = super(JournalingViewSet, self).get_queryset()
         params = self.request.query_params
         if "proctor" in params:
-            queryset = queryset.filter(proctor__username=params["proctor"])
+            queryset = queryset.filter(proctor_id__in=list(
+                User.objects.filter(username=params["proctor"]).values_list('id', flat=True)))
         if "exam_code" in params:
-            queryset = queryset.filter(exam__exam_code=params["exam_code"])
+            queryset = queryset.filter(exam_id__in=list(
+                Exam.objects.filter(exam_code=params["exam_code"]).values_list('id', flat=True)))
         if "type" in params:
             queryset = queryset.filter(journaling_type=params["type"])
         if "event_hash" in params:
-            queryset = queryset.filter(event__hash_key=params["event_hash"])
+            queryset = queryset.filter(event_id__in=list(
+                EventSession.objects.filter(hash_key=params["event_hash"]).values_list('id', flat=True)))
         if "date" in params:
             try:
                 query_date = datetime.strptime(params["date"], "%Y-%m-%d")
@@ -60,5 +80,71 @@ class JournalingViewSet(mixins.ListModelMixin,
                 )
             except ValueError:
                 pass
+        if "endpoint" in params:
+            queryset = queryset.filter(endpoint=params["endpoint"])
+        if "method" in params:
+            queryset = queryset.filter(http_method=params["method"].upper())
+        try:
+            if "status_code" in params:
+                queryset = queryset.filter(status_code=int(params["status_code"]))
+            if "status" in params:
+                status_class = int(params["status"])
+                queryset = queryset.filter(status_code__gte=status_class * 100,
+                                           status_code__lt=(status_class + 1) * 100)
+        except ValueError:
+            queryset = queryset.none()
 
         return queryset
+
+    @list_route(methods=['get'])
+    def stats(self, request):
+        """
+        Number of calls, average and max duration by endpoint, method and status code
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(status_code__isnull=False)
+        rows = queryset.order_by().values('endpoint', 'http_method', 'status_code').annotate(
+            count=Count('id'), avg_duration_ms=Avg('duration_ms'), max_duration_ms=Max('duration_ms')
+        ).order_by('endpoint', 'http_method', 'status_code')
+        return Response({'results': list(rows)})
+
+
+class JournalingArchiveViewSet(viewsets.ViewSet):
+    """
+    Return list of archived Journaling (see `archive_journaling` command)
+    for the dates, newest first. The dates are required:
+
+    `?date=2015-12-04` or `?date_from=2015-12-01&date_to=2015-12-04`,
+    up to 31 days.
+
+    You can filter results by `event_hash`, `proctor`, `exam_code`, `type`.
+    Follow the `next` link for other pages, `page_size` is up to 100.
+    """
+    authentication_classes = (
+        SsoTokenAuthentication, CsrfExemptSessionAuthentication,
+        BasicAuthentication)
+    permission_classes = (IsAuthenticated, IsProctor)
+    max_days = 31
+
+    def list(self, request):
+        params = request.query_params
+        try:
+            date_from = datetime.strptime(params.get('date') or params['date_from'], "%Y-%m-%d").date()
+            date_to = datetime.strptime(params.get('date') or params['date_to'], "%Y-%m-%d").date()
+            journaling_type = int(params['type']) if 'type' in params else None
+            before_id = int(params['before']) if 'before' in params else None
+            page_size = min(int(params.get('page_size', KeysetPagination.page_size)),
+                            KeysetPagination.max_page_size)
+        except (KeyError, ValueError):
+            return Response({'error': 'Dates are required, YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        if date_to < date_from or date_to - date_from > timedelta(days=self.max_days - 1):
+            return Response({'error': 'Dates are up to %d days' % self.max_days},
+                            status=status.HTTP_400_BAD_REQUEST)
+        rows = search_archive(
+            date_from, date_to, journaling_type=journaling_type, proctor=params.get('proctor'),
+            exam_code=params.get('exam_code'), event_hash=params.get('event_hash'),
+            before_id=before_id, limit=page_size + 1)
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', rows[-1]['id'])
+        return Response({'next': next_url, 'results': rows})
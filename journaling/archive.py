@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Cold storage of old Journaling rows.
+
+Rows are moved from the table into gzipped NDJSON segments, one JSON object
+per line, in the directory `JOURNALING_ARCHIVE_DIR`:
+
+    <dir>/2018-03-23/<journaling type>-<first pk>-<last pk>.ndjson.gz
+
+The path is the index: segments are found by the date (UTC) and the type
+of their rows, and by the range of primary keys.
+"""
+import datetime
+import gzip
+import heapq
+import json
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from journaling.models import Journaling
+
+SEGMENT_RE = re.compile(r'^(\d+)-(\d+)-(\d+)\.ndjson\.gz$')
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def archive_dir():
+    return settings.JOURNALING_ARCHIVE_DIR
+
+
+def _row(journaling):
+    """
+    Journaling as a dict with the related values, the related rows
+    may be deleted while the segment is kept
+    """
+    exam = journaling.exam
+    return {
+        'id': journaling.pk,
+        'journaling_type': journaling.journaling_type,
+        'datetime': journaling.datetime.isoformat() if journaling.datetime else None,
+        'note': journaling.note,
+        'proctor_ip': journaling.proctor_ip,
+        'proctor_id': journaling.proctor_id,
+        'proctor': journaling.proctor.username if journaling.proctor else None,
+        'event_id': journaling.event_id,
+        'event': journaling.event.hash_key if journaling.event else None,
+        'exam_id': journaling.exam_id,
+        'exam_code': exam.exam_code if exam else None,
+        'student': journaling.get_student(),
+        'endpoint': journaling.endpoint,
+        'http_method': journaling.http_method,
+        'status_code': journaling.status_code,
+        'duration_ms': journaling.duration_ms,
+        'payload': journaling.payload,
+    }
+
+
+def _row_date(journaling):
+    value = journaling.datetime
+    if value is None:
+        return datetime.date(1970, 1, 1)
+    if timezone.is_aware(value):
+        value = timezone.localtime(value, timezone.utc)
+    return value.date()
+
+
+def write_segment(directory, date, journaling_type, rows):
+    """
+    Write rows sorted by id into the new segment. The file appears
+    only when it is complete and flushed to disk.
+    :return: path of the segment
+    """
+    day_dir = os.path.join(directory, date.strftime(DATE_FORMAT))
+    os.makedirs(day_dir, exist_ok=True)
+    name = '%d-%d-%d.ndjson.gz' % (journaling_type, rows[0]['id'], rows[-1]['id'])
+    path = os.path.join(day_dir, name)
+    fd, tmp_path = tempfile.mkstemp(dir=day_dir, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(filename=name, mode='wb', fileobj=raw) as segment:
+                for row in rows:
+                    segment.write(json.dumps(row).encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def archive_journaling(before, chunk_size=1000, directory=None):
+    """
+    Move rows older than `before` into segments, chunk by chunk in the order
+    of primary keys; rows of a chunk are deleted after its segments are written.
+    A row archived twice (the process was killed before the delete) is read once.
+    :param before: aware datetime
+    :return: tuple (number of rows, number of segments)
+    """
+    directory = directory or archive_dir()
+    # not from a replica, the rows are deleted after
+    using = router.db_for_write(Journaling)
+    queryset = Journaling.objects.using(using).filter(datetime__lt=before).prefetch_related(
+        'proctor', 'event', 'exam').order_by('pk')
+    last_pk = 0
+    rows_count = segments_count = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        segments = {}
+        for journaling in chunk:
+            key = (_row_date(journaling), journaling.journaling_type)
+            segments.setdefault(key, []).append(_row(journaling))
+        for (date, journaling_type), rows in sorted(segments.items()):
+            write_segment(directory, date, journaling_type, rows)
+        pks = [journaling.pk for journaling in chunk]
+        with transaction.atomic(using=using):
+            Journaling.objects.using(using).filter(pk__in=pks).delete()
+        last_pk = pks[-1]
+        rows_count += len(chunk)
+        segments_count += len(segments)
+    return rows_count, segments_count
+
+
+def find_segments(date_from, date_to, journaling_type=None, before_id=None, directory=None):
+    """
+    :return: list of (first id, last id, path) of the segments
+        between the dates inclusive
+    """
+    directory = directory or archive_dir()
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for day in sorted(os.listdir(directory)):
+        try:
+            date = datetime.datetime.strptime(day, DATE_FORMAT).date()
+        except ValueError:
+            continue
+        if not date_from <= date <= date_to:
+            continue
+        for name in os.listdir(os.path.join(directory, day)):
+            match = SEGMENT_RE.match(name)
+            if not match:
+                continue
+            segment_type, first_id, last_id = (int(value) for value in match.groups())
+            if journaling_type is not None and segment_type != journaling_type:
+                continue
+            if before_id is not None and first_id >= before_id:
+                continue
+            segments.append((first_id, last_id, os.path.join(directory, day, name)))
+    return segments
+
+
+def read_segment(path):
+    with gzip.open(path, 'rb') as segment:
+        for line in segment:
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+
+def search_archive(date_from, date_to, journaling_type=None, proctor=None, exam_code=None,
+                   event_hash=None, before_id=None, limit=None, directory=None):
+    """
+    Archived rows between the dates inclusive, newest first (by id) as
+    the Journaling list API returns them. Segments are read from the newest
+    one until `limit` rows are found and the rest can't contain newer rows.
+    :return: list of dicts
+    """
+    segments = find_segments(date_from, date_to, journaling_type, before_id, directory)
+    # by the last id, newest first
+    segments.sort(key=lambda segment: segment[1], reverse=True)
+    found = {}
+    for first_id, last_id, path in segments:
+        if limit is not None and len(found) >= limit and heapq.nlargest(limit, found)[-1] > last_id:
+            break
+        for row in read_segment(path):
+            if before_id is not None and row['id'] >= before_id:
+                continue
+            if proctor is not None and row['proctor'] != proctor:
+                continue
+            if exam_code is not None and row['exam_code'] != exam_code:
+                continue
+            if event_hash is not None and row['event'] != event_hash:
+                continue
+            found[row['id']] = row
+    ids = sorted(found, reverse=True)
+    if limit is not None:
+        ids = ids[:limit]
+    type_names = dict(Journaling.TYPE_CHOICES)
+    results = []
+    for row_id in ids:
+        row = found[row_id]
+        row['type_name'] = str(type_names.get(row['journaling_type'], ''))
+        results.append(row)
+    return results
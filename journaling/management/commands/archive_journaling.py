@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from journaling.archive import archive_dir, archive_journaling
+
+
+class Command(BaseCommand):
+    help = 'Move old Journaling rows into compressed segments of the archive directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.JOURNALING_ARCHIVE_DAYS,
+                            help='archive rows older than this number of days')
+        parser.add_argument('--before', help='archive rows older than this date, YYYY-MM-DD (UTC)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='rows per transaction')
+        parser.add_argument('--dir', help='archive directory, JOURNALING_ARCHIVE_DIR by default')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                raise CommandError('--before must be YYYY-MM-DD')
+        else:
+            before = timezone.now() - timedelta(days=options['days'])
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        directory = options['dir'] or archive_dir()
+        rows, segments = archive_journaling(before, options['chunk_size'], directory)
+        self.stdout.write('Archived %d rows older than %s into %d segments in %s' % (
+            rows, before.isoformat(), segments, directory))
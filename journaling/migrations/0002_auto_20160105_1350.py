@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 from django.db import migrations, models
 from django.conf import settings
 
+from edx_proctor_webassistant.db_router import journaling_relation_options
+
 
 class Migration(migrations.Migration):
 
@@ -17,16 +19,16 @@ class Migration(migrations.Migration):
         migrations.AddField(
             model_name='journaling',
             name='event',
-            field=models.ForeignKey(blank=True, to='proctoring.EventSession', null=True, on_delete=models.CASCADE),
+            field=models.ForeignKey(blank=True, to='proctoring.EventSession', null=True, **journaling_relation_options()),
         ),
         migrations.AddField(
             model_name='journaling',
             name='exam',
-            field=models.ForeignKey(blank=True, to='proctoring.Exam', null=True, on_delete=models.CASCADE),
+            field=models.ForeignKey(blank=True, to='proctoring.Exam', null=True, **journaling_relation_options()),
         ),
         migrations.AddField(
             model_name='journaling',
             name='proctor',
-            field=models.ForeignKey(blank=True, to=settings.AUTH_USER_MODEL, null=True, on_delete=models.CASCADE),
+            field=models.ForeignKey(blank=True, to=settings.AUTH_USER_MODEL, null=True, **journaling_relation_options()),
         ),
     ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.0.3 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journaling', '0002_auto_20160105_1350'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journaling',
+            index=models.Index(fields=['datetime'], name='journaling_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journaling',
+            index=models.Index(fields=['journaling_type', 'datetime'], name='journaling_type_datetime_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.0.3 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journaling', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journaling',
+            name='endpoint',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='journaling',
+            name='http_method',
+            field=models.CharField(blank=True, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='journaling',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journaling',
+            name='duration_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='journaling',
+            name='payload',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='journaling',
+            index=models.Index(fields=['status_code', 'datetime'], name='journaling_status_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journaling',
+            index=models.Index(fields=['endpoint', 'datetime'], name='journaling_endpoint_dt_idx'),
+        ),
+    ]
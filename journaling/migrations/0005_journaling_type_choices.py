@@ -0,0 +1,26 @@
+# Generated by Django 2.0.3 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+from edx_proctor_webassistant.db_router import journaling_relation_options
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('journaling', '0004_http_call_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journaling',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, to='proctoring.EventSession', verbose_name='Session',
+                                    **journaling_relation_options()),
+        ),
+        migrations.AlterField(
+            model_name='journaling',
+            name='journaling_type',
+            field=models.IntegerField(choices=[(1, "Proctor's login"), (2, "Proctor's logout"), (3, 'Start event session'), (4, 'Event session status change'), (5, 'Exam attempt'), (6, 'Exam status change'), (7, "Proctor's comment"), (8, 'Bulk exam status change'), (9, 'Call to edX API'), (10, 'API Request from edX'), (11, 'Exam status acknowledgement')], db_index=True, verbose_name='Type'),
+        ),
+    ]
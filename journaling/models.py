@@ -2,11 +2,15 @@
 """
 Model for loging every events
 """
+import json
+
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 
+from edx_proctor_webassistant.db_router import journaling_relation_options
+
 
 class Journaling(models.Model):
     """
@@ -22,6 +26,7 @@ class Journaling(models.Model):
     BULK_EXAM_STATUS_CHANGE = 8
     EDX_API_CALL = 9
     API_REQUESTS = 10
+    EXAM_STATUS_ACK = 11
 
     TYPE_CHOICES = [
         (PROCTOR_ENTER, _("Proctor's login")),
@@ -34,15 +39,65 @@ class Journaling(models.Model):
         (BULK_EXAM_STATUS_CHANGE, _("Bulk exam status change")),
         (EDX_API_CALL, _("Call to edX API")),
         (API_REQUESTS, _("API Request from edX")),
+        (EXAM_STATUS_ACK, _("Exam status acknowledgement")),
     ]
     journaling_type = models.IntegerField(choices=TYPE_CHOICES, db_index=True, verbose_name='Type')
-    event = models.ForeignKey("proctoring.EventSession", blank=True, null=True,
-                              db_index=True, on_delete=models.CASCADE, verbose_name='Session')
-    exam = models.ForeignKey("proctoring.Exam", blank=True, null=True, db_index=True, on_delete=models.CASCADE)
-    proctor = models.ForeignKey(User, blank=True, null=True, db_index=True, on_delete=models.CASCADE)
+    # the table may be in another database, see JOURNALING_DATABASE
+    event = models.ForeignKey("proctoring.EventSession", blank=True, null=True, db_index=True,
+                              verbose_name='Session', **journaling_relation_options())
+    exam = models.ForeignKey("proctoring.Exam", blank=True, null=True, db_index=True,
+                             **journaling_relation_options())
+    proctor = models.ForeignKey(User, blank=True, null=True, db_index=True,
+                                **journaling_relation_options())
     note = models.TextField(blank=True, null=True)
     proctor_ip = models.GenericIPAddressField(blank=True, null=True)
     datetime = models.DateTimeField(auto_now=True)
+    # HTTP calls to and from edX
+    endpoint = models.CharField(max_length=255, blank=True, null=True)
+    http_method = models.CharField(max_length=8, blank=True, null=True)
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    duration_ms = models.PositiveIntegerField(blank=True, null=True)
+    payload = models.TextField(blank=True, null=True)
+
+    # max length of the stored payload
+    PAYLOAD_LIMIT = 4000
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['datetime'], name='journaling_datetime_idx'),
+            models.Index(fields=['journaling_type', 'datetime'], name='journaling_type_datetime_idx'),
+            models.Index(fields=['status_code', 'datetime'], name='journaling_status_dt_idx'),
+            models.Index(fields=['endpoint', 'datetime'], name='journaling_endpoint_dt_idx'),
+        ]
+
+    @classmethod
+    def create_http_call(cls, journaling_type, endpoint, http_method, status_code, duration,
+                         sent=None, received=None, url=None):
+        """
+        Journaling of the HTTP call
+        :param endpoint: url pattern, e.g. without attempt codes, for grouping
+        :param duration: seconds
+        :param sent: data of the request
+        :param received: content of the response
+        :param url: called url, endpoint by default
+        :return: Journaling instance
+        """
+        payload = json.dumps({'sent': sent, 'received': received}, default=str, ensure_ascii=False)
+        if len(payload) > cls.PAYLOAD_LIMIT:
+            # still valid JSON: the beginnings of the encoded values
+            sent = json.dumps(sent, default=str, ensure_ascii=False)[:cls.PAYLOAD_LIMIT // 2]
+            received = json.dumps(received, default=str, ensure_ascii=False)[:cls.PAYLOAD_LIMIT - len(sent)]
+            payload = json.dumps({'truncated': True, 'sent': sent, 'received': received}, ensure_ascii=False)
+        http_method = http_method.upper()
+        return cls.objects.create(
+            journaling_type=journaling_type,
+            endpoint=endpoint[:255],
+            http_method=http_method,
+            status_code=status_code,
+            duration_ms=int(round(duration * 1000)),
+            payload=payload,
+            note='%s %s -> %s' % (http_method, url or endpoint, status_code),
+        )
 
     def get_student(self):
         """
@@ -3,6 +3,7 @@ Tests for Journaling's API endpoints
 """
 import json
 from datetime import datetime
+from unittest.mock import patch
 
 from rest_framework.test import APIRequestFactory, force_authenticate
 from rest_framework import status
@@ -10,6 +11,7 @@ from rest_framework import status
 from django.contrib.auth.models import User
 from django.test import TestCase
 
+from edx_proctor_webassistant.rest_framework import KeysetPagination
 from journaling import api_views
 from journaling.models import Journaling
 from person.models import Permission
@@ -92,3 +94,63 @@ class JournalingTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         data = json.loads(str(response.content, 'utf-8'))
         self.assertEqual(len(data.get('results')), 0)
+
+    def _get(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        response = api_views.JournalingViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(str(response.content, 'utf-8'))
+
+    def test_pages(self):
+        Journaling.objects.bulk_create(
+            Journaling(journaling_type=Journaling.EXAM_COMMENT, note=str(i)) for i in range(7))
+        expected = list(Journaling.objects.filter(
+            journaling_type=Journaling.EXAM_COMMENT).order_by('-pk').values_list('pk', flat=True))
+
+        data = self._get('/api/journaling/?type=%s&page_size=3' % Journaling.EXAM_COMMENT)
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+        pks = [row['id'] for row in data['results']]
+        while data['next']:
+            # rows added after the first page don't shift the next pages
+            Journaling.objects.create(journaling_type=Journaling.EXAM_COMMENT)
+            data = self._get(data['next'])
+            pks.extend(row['id'] for row in data['results'])
+        self.assertEqual(pks, expected)
+
+    def test_page_size_limit(self):
+        Journaling.objects.bulk_create(Journaling(journaling_type=Journaling.EXAM_COMMENT) for _ in range(120))
+        data = self._get('/api/journaling/?page_size=1000')
+        self.assertEqual(len(data['results']), 100)
+
+    def test_count(self):
+        Journaling.objects.bulk_create(Journaling(journaling_type=Journaling.EXAM_COMMENT) for _ in range(5))
+        data = self._get('/api/journaling/?type=%s&count=1' % Journaling.EXAM_COMMENT)
+        self.assertEqual(data['count'], 5)
+        self.assertFalse(data['count_limited'])
+
+        with patch.object(KeysetPagination, 'count_limit', 3):
+            data = self._get('/api/journaling/?count=1')
+        self.assertEqual(data['count'], 3)
+        self.assertTrue(data['count_limited'])
+
+    def test_http_calls(self):
+        for endpoint, status_code, duration in (('api/a/', 200, 0.1), ('api/a/', 502, 2), ('api/a/', 503, 3),
+                                                ('api/b/', 500, 1)):
+            Journaling.create_http_call(Journaling.EDX_API_CALL, endpoint, 'get', status_code, duration)
+        data = self._get('/api/journaling/?status=5&endpoint=api/a/')
+        self.assertEqual(sorted(row['status_code'] for row in data['results']), [502, 503])
+        data = self._get('/api/journaling/?status_code=500&method=get')
+        self.assertEqual([row['endpoint'] for row in data['results']], ['api/b/'])
+        data = self._get('/api/journaling/?status=wrong')
+        self.assertEqual(data['results'], [])
+
+        request = APIRequestFactory().get('/api/journaling/stats/?type=%s&status=5' % Journaling.EDX_API_CALL)
+        force_authenticate(request, user=self.user)
+        response = api_views.JournalingViewSet.as_view({'get': 'stats'})(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['endpoint'], row['status_code'], row['count'], row['max_duration_ms'])
+                          for row in response.data['results']],
+                         [('api/a/', 502, 1, 2000), ('api/a/', 503, 1, 3000), ('api/b/', 500, 1, 1000)])
@@ -0,0 +1,135 @@
+"""
+Tests for the archive of Journaling
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from journaling import api_views
+from journaling.archive import archive_journaling, find_segments, search_archive
+from journaling.models import Journaling
+from person.models import Permission
+from proctoring.models import Course, InProgressEventSession
+from proctoring.tests.test_models import _create_exam
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(JOURNALING_ARCHIVE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('test', 'test@test.com', 'password')
+        Permission.objects.create(user=self.user, object_type="*", object_id="*",
+                                  role=Permission.ROLE_PROCTOR)
+        event = InProgressEventSession()
+        event.testing_center = "test center"
+        event.course = Course.create_by_course_run('org1/course1/run1')
+        event.course_event_id = 'id'
+        event.proctor = self.user
+        event.save()
+        self.event = event
+        self.exam = _create_exam('test', 'org1/course1/run1')
+
+    def create(self, day, journaling_type=Journaling.EDX_API_CALL, **kwargs):
+        journaling = Journaling.objects.create(journaling_type=journaling_type, note='note', **kwargs)
+        # datetime is set on every save
+        Journaling.objects.filter(pk=journaling.pk).update(
+            datetime=datetime(2018, 3, day, 12, tzinfo=timezone.utc))
+        return journaling.pk
+
+    def test_archive(self):
+        old = [self.create(1), self.create(1, Journaling.EXAM_COMMENT, proctor=self.user, event=self.event,
+                                           exam=self.exam),
+               self.create(2), self.create(2)]
+        recent = self.create(20)
+        rows, segments = archive_journaling(datetime(2018, 3, 10, tzinfo=timezone.utc), chunk_size=3,
+                                            directory=self.directory)
+        self.assertEqual(rows, 4)
+        # the chunks are split at the third row
+        self.assertEqual(segments, 4)
+        self.assertEqual(list(Journaling.objects.values_list('pk', flat=True)), [recent])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['2018-03-01', '2018-03-02'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, '2018-03-01'))), [
+            '%d-%d-%d.ndjson.gz' % (Journaling.EXAM_COMMENT, old[1], old[1]),
+            '%d-%d-%d.ndjson.gz' % (Journaling.EDX_API_CALL, old[0], old[0]),
+        ])
+        path = os.path.join(self.directory, '2018-03-01', '%d-%d-%d.ndjson.gz' % (
+            Journaling.EXAM_COMMENT, old[1], old[1]))
+        with gzip.open(path, 'rt') as segment:
+            row = json.loads(segment.readline())
+        self.assertEqual(row['proctor'], 'test')
+        self.assertEqual(row['event'], self.event.hash_key)
+        self.assertEqual(row['exam_code'], 'examCode_test')
+
+        rows = search_archive(date(2018, 3, 1), date(2018, 3, 31))
+        self.assertEqual([row['id'] for row in rows], old[::-1])
+        self.assertEqual(rows[0]['type_name'], "Call to edX API")
+        rows = search_archive(date(2018, 3, 1), date(2018, 3, 1), journaling_type=Journaling.EDX_API_CALL)
+        self.assertEqual([row['id'] for row in rows], [old[0]])
+        rows = search_archive(date(2018, 3, 1), date(2018, 3, 2), proctor='test')
+        self.assertEqual([row['id'] for row in rows], [old[1]])
+        rows = search_archive(date(2018, 3, 1), date(2018, 3, 2), before_id=old[3], limit=2)
+        self.assertEqual([row['id'] for row in rows], [old[2], old[1]])
+
+    def test_archived_twice(self):
+        pk = self.create(1)
+        archive_journaling(datetime(2018, 3, 10, tzinfo=timezone.utc), directory=self.directory)
+        # the same row in another segment, as if the delete didn't happen
+        segment = find_segments(date(2018, 3, 1), date(2018, 3, 1), directory=self.directory)[0][2]
+        shutil.copy(segment, segment.replace('-%d.ndjson' % pk, '-%d.ndjson' % (pk + 1)))
+        self.assertEqual([row['id'] for row in search_archive(date(2018, 3, 1), date(2018, 3, 1))], [pk])
+
+    def test_command(self):
+        self.create(1)
+        out = StringIO()
+        call_command('archive_journaling', before='2018-03-10', stdout=out)
+        self.assertIn('Archived 1 rows', out.getvalue())
+        self.assertFalse(Journaling.objects.exists())
+        self.assertEqual(len(find_segments(date(2018, 3, 1), date(2018, 3, 1))), 1)
+
+    def _list(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        response = api_views.JournalingArchiveViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return response, json.loads(str(response.content, 'utf-8'))
+
+    def test_api(self):
+        pks = [self.create(day) for day in (1, 1, 2)]
+        archive_journaling(datetime(2018, 3, 10, tzinfo=timezone.utc))
+        response, data = self._list('/api/journaling_archive/?date_from=2018-03-01&date_to=2018-03-02&page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in data['results']], [pks[2], pks[1]])
+        response, data = self._list(data['next'])
+        self.assertEqual([row['id'] for row in data['results']], [pks[0]])
+        self.assertIsNone(data['next'])
+
+        response, data = self._list('/api/journaling_archive/?date=2018-03-02')
+        self.assertEqual([row['id'] for row in data['results']], [pks[2]])
+
+    def test_api_dates(self):
+        for url in ('/api/journaling_archive/', '/api/journaling_archive/?date=wrong',
+                    '/api/journaling_archive/?date_from=2018-01-01&date_to=2018-03-01',
+                    '/api/journaling_archive/?date_from=2018-03-02&date_to=2018-03-01'):
+            response, data = self._list(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+        day = datetime.now().date()
+        response, data = self._list('/api/journaling_archive/?date_from=%s&date_to=%s' % (
+            day - timedelta(days=30), day))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data, {'next': None, 'results': []})
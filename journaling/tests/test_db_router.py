@@ -0,0 +1,162 @@
+"""
+Tests for the routing of Journaling to its own database,
+two SQLite databases `default` and `journaling`
+"""
+import json
+import shutil
+import tempfile
+from datetime import datetime
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db import models, router
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from edx_proctor_webassistant.db_router import JournalingRouter, PinPrimaryMiddleware, is_pinned, \
+    journaling_relation_options, pin_primary, unpin_primary
+from journaling import api_views
+from journaling.archive import archive_journaling
+from journaling.models import Journaling
+from person.models import Permission
+from proctoring.models import ArchivedEventSession, Course, EventSession, InProgressEventSession
+from proctoring.tests.test_models import _create_exam
+
+
+@override_settings(JOURNALING_DATABASE='journaling', DATABASE_REPLICAS={})
+class JournalingRouterTestCase(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.user = User.objects.create_user('test', 'test@test.com', 'password')
+        Permission.objects.create(user=self.user, object_type="*", object_id="*",
+                                  role=Permission.ROLE_PROCTOR)
+        event = InProgressEventSession()
+        event.testing_center = "test center"
+        event.course = Course.create_by_course_run('org1/course1/run1')
+        event.course_event_id = 'id'
+        event.proctor = self.user
+        event.save()
+        self.event = event
+        self.exam = _create_exam('test', 'org1/course1/run1')
+        unpin_primary()
+        self.addCleanup(unpin_primary)
+
+    def test_write(self):
+        journaling = Journaling.objects.create(
+            journaling_type=Journaling.EXAM_COMMENT, proctor=self.user, event=self.event, exam=self.exam)
+        self.assertEqual(journaling._state.db, 'journaling')
+        self.assertTrue(Journaling.objects.using('journaling').filter(pk=journaling.pk).exists())
+        self.assertFalse(Journaling.objects.using('default').exists())
+        self.assertFalse(User.objects.using('journaling').exists())
+
+        journaling = Journaling.objects.get(pk=journaling.pk)
+        self.assertEqual(journaling.proctor, self.user)
+        self.assertEqual(journaling.event, self.event)
+        self.assertEqual(journaling.exam, self.exam)
+
+    def test_replica(self):
+        counts = []
+
+        def get_response(request):
+            # the replica lags behind
+            counts.append(Journaling.objects.count())
+            # read your writes
+            Journaling.objects.create(journaling_type=Journaling.EDX_API_CALL)
+            self.assertTrue(is_pinned())
+            counts.append(Journaling.objects.count())
+
+        with self.settings(DATABASE_REPLICAS={'journaling': 'default'}):
+            # written without the router, as by another request
+            Journaling.objects.using('journaling').create(journaling_type=Journaling.EDX_API_CALL)
+            PinPrimaryMiddleware(get_response)(RequestFactory().get('/'))
+        self.assertEqual(counts, [0, 2])
+
+    def test_write_outside_of_request(self):
+        # commands and the daemons don't stick to the primary
+        Journaling.objects.create(journaling_type=Journaling.EDX_API_CALL)
+        self.assertFalse(is_pinned())
+        pin_primary()
+        request_finished.send(sender=self.__class__)
+        self.assertFalse(is_pinned())
+
+    def test_reporting_models(self):
+        with self.settings(DATABASE_REPLICAS={'default': 'journaling'}):
+            self.assertEqual(router.db_for_read(ArchivedEventSession), 'journaling')
+            self.assertEqual(router.db_for_read(EventSession), 'default')
+            self.assertEqual(router.db_for_read(User), 'default')
+            pin_primary()
+            self.assertEqual(router.db_for_read(ArchivedEventSession), 'default')
+
+    def test_middleware(self):
+        pinned = []
+
+        def get_response(request):
+            pinned.append(is_pinned())
+            Journaling.objects.create(journaling_type=Journaling.PROCTOR_ENTER)
+            pinned.append(is_pinned())
+
+        pin_primary()
+        PinPrimaryMiddleware(get_response)(RequestFactory().get('/'))
+        self.assertEqual(pinned, [False, True])
+        self.assertFalse(is_pinned())
+
+    def test_allow_migrate(self):
+        db_router = JournalingRouter()
+        self.assertTrue(db_router.allow_migrate('journaling', 'journaling'))
+        self.assertFalse(db_router.allow_migrate('default', 'journaling'))
+        self.assertFalse(db_router.allow_migrate('journaling', 'proctoring'))
+        self.assertIsNone(db_router.allow_migrate('default', 'proctoring'))
+        with self.settings(JOURNALING_DATABASE='default'):
+            self.assertIsNone(db_router.allow_migrate('default', 'journaling'))
+
+    def _list(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        response = api_views.JournalingViewSet.as_view({'get': 'list'})(request)
+        response.render()
+        return json.loads(str(response.content, 'utf-8'))['results']
+
+    def test_api(self):
+        Journaling.objects.create(journaling_type=Journaling.EXAM_COMMENT, proctor=self.user,
+                                  event=self.event, exam=self.exam)
+        Journaling.objects.create(journaling_type=Journaling.EDX_API_CALL)
+        for url, count in (('/api/journaling/', 2), ('/api/journaling/?proctor=test', 1),
+                           ('/api/journaling/?exam_code=examCode_test', 1),
+                           ('/api/journaling/?event_hash=%s' % self.event.hash_key, 1),
+                           ('/api/journaling/?proctor=unknown', 0)):
+            self.assertEqual(len(self._list(url)), count, url)
+        row = self._list('/api/journaling/?proctor=test')[0]
+        self.assertEqual(row['proctor'], 'test')
+        self.assertEqual(row['event'], self.event.hash_key)
+        self.assertEqual(row['exam_code'], 'examCode_test')
+
+    def test_archive(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        journaling = Journaling.objects.create(journaling_type=Journaling.EXAM_COMMENT, proctor=self.user,
+                                               event=self.event, exam=self.exam)
+        Journaling.objects.filter(pk=journaling.pk).update(datetime=datetime(2018, 3, 1, tzinfo=timezone.utc))
+        unpin_primary()
+        with self.settings(DATABASE_REPLICAS={'journaling': 'default'}):
+            rows, segments = archive_journaling(datetime(2018, 3, 10, tzinfo=timezone.utc),
+                                                directory=directory)
+        self.assertEqual((rows, segments), (1, 1))
+        self.assertFalse(Journaling.objects.using('journaling').exists())
+
+
+class JournalingRelationsTestCase(TestCase):
+    def test_cascade(self):
+        # Journaling in the default database is deleted with the referred rows
+        user = User.objects.create_user('test', 'test@test.com', 'password')
+        Journaling.objects.create(journaling_type=Journaling.PROCTOR_ENTER, proctor=user)
+        user.delete()
+        self.assertFalse(Journaling.objects.exists())
+
+    def test_options(self):
+        self.assertEqual(journaling_relation_options(), {'on_delete': models.CASCADE})
+        with self.settings(JOURNALING_DATABASE='journaling'):
+            self.assertEqual(journaling_relation_options(),
+                             {'on_delete': models.DO_NOTHING, 'db_constraint': False})
@@ -6,8 +6,14 @@ import tornado
 import pika
 from pika import adapters
 
+from .sharding import SHARDED_EXCHANGE, SHARDED_EXCHANGE_TYPE
+
 logger = logging.getLogger('notifications.amqp')
 
+# reply codes of the closed channel
+NOT_FOUND = 404
+PRECONDITION_FAILED = 406
+
 
 class AMQPConsumer(object):
     """
@@ -20,12 +26,21 @@ class AMQPConsumer(object):
     QUEUE = 'edx.proctoring.event'
     ROUTING_KEY = 'edx.proctoring.event'
 
-    def __init__(self, application, daemon_id, broker_url):
+    def __init__(self, application, daemon_id, broker_url, shard_key=None, recorder=None,
+                 queue_ttl=None, queue_expires=None):
         """Create a new instance of the consumer class, passing in the AMQP
         URL used to connect to RabbitMQ.
 
         :param tornado.web.Application application
         :param str broker_url: The AMQP url to connect with
+        :param str shard_key: Routing key of the daemon's shard in the
+            sharded exchange, the queue is also bound to it if it is set
+        :param notifications.recording.TrafficRecorder recorder: Records
+            bodies of the received messages if it is set
+        :param int queue_ttl: Seconds the message may wait in the queue
+            while the daemon is stopped
+        :param int queue_expires: Seconds after which the queue without
+            consumers is deleted by the broker
 
         """
         self._application = application
@@ -34,7 +49,23 @@ class AMQPConsumer(object):
         self._closing = False
         self._consumer_tag = None
         self._url = broker_url
+        # the durable named queue keeps messages while the daemon restarts
         self._queue = '%s.%s' % (self.QUEUE, str(daemon_id))
+        self._queue_arguments = {}
+        if queue_ttl:
+            self._queue_arguments['x-message-ttl'] = int(queue_ttl * 1000)
+        if queue_expires:
+            self._queue_arguments['x-expires'] = int(queue_expires * 1000)
+        # (exchange, type, durable, routing key) to declare and bind the queue to
+        self._bindings = [(self.EXCHANGE, self.EXCHANGE_TYPE, False, self.ROUTING_KEY)]
+        if shard_key:
+            self._bindings.append((SHARDED_EXCHANGE, SHARDED_EXCHANGE_TYPE, True, shard_key))
+        self._setup_step = 0
+        # the queue exists with other parameters (e.g. non-durable queue of the
+        # previous versions), it is consumed as is until it is deleted
+        self._queue_passive = False
+        self._declaring_queue = False
+        self._recorder = recorder
 
     def connect(self):
         """This method connects to RabbitMQ, returning the connection handle.
@@ -107,6 +138,7 @@ class AMQPConsumer(object):
 
         """
         if not self._closing:
+            self._application.on_broker_reconnect()
             # Create a new connection
             self._connection = self.connect()
 
@@ -123,7 +155,8 @@ class AMQPConsumer(object):
         Channels are usually closed if you attempt to do something that
         violates the protocol, such as re-declare an exchange or queue with
         different parameters. In this case, we'll close the connection
-        to shutdown the object.
+        to shutdown the object. The queue declared with different parameters
+        is declared passively on the new channel and consumed as is.
 
         :param pika.channel.Channel: The closed channel
         :param int reply_code: The numeric reason the channel was closed
@@ -132,6 +165,17 @@ class AMQPConsumer(object):
         """
         logger.warning('Channel %i was closed: (%s) %s',
                        channel, reply_code, reply_text)
+        if self._declaring_queue and reply_code in (PRECONDITION_FAILED, NOT_FOUND):
+            self._declaring_queue = False
+            # PRECONDITION_FAILED: the queue exists with other parameters, use it as is;
+            # NOT_FOUND: that queue was deleted, declare it with our parameters
+            self._queue_passive = reply_code == PRECONDITION_FAILED
+            if self._queue_passive:
+                logger.warning('Queue %s exists with other parameters, it is used as is. Delete it to declare'
+                               ' the durable queue with arguments %s', self._queue, self._queue_arguments)
+            self._channel = None
+            self.open_channel()
+            return
         self._connection.close()
 
     def on_channel_open(self, channel):
@@ -146,30 +190,40 @@ class AMQPConsumer(object):
         logger.info('Channel opened')
         self._channel = channel
         self.add_on_channel_close_callback()
-        self.setup_exchange(self.EXCHANGE)
+        self._setup_step = 0
+        self.setup_exchange(*self._bindings[0][:3])
 
-    def setup_exchange(self, exchange_name):
+    def setup_exchange(self, exchange_name, exchange_type, durable=False):
         """Setup the exchange on RabbitMQ by invoking the Exchange.Declare RPC
         command. When it is complete, the on_exchange_declareok method will
         be invoked by pika.
 
         :param str exchange_name: The name of the exchange to declare
+        :param str exchange_type: The type of the exchange
+        :param bool durable: Whether the exchange survives the broker restart
 
         """
         logger.info('Declaring exchange %s', exchange_name)
         self._channel.exchange_declare(self.on_exchange_declareok,
                                        exchange_name,
-                                       self.EXCHANGE_TYPE)
+                                       exchange_type,
+                                       durable=durable)
 
     def on_exchange_declareok(self, unused_frame):
         """Invoked by pika when RabbitMQ has finished the Exchange.Declare RPC
-        command.
+        command. Declares the next exchange or the queue when all of them
+        are declared.
 
         :param pika.Frame.Method unused_frame: Exchange.DeclareOk response frame
 
         """
         logger.info('Exchange declared')
+        self._setup_step += 1
+        if self._setup_step < len(self._bindings):
+            self.setup_exchange(*self._bindings[self._setup_step][:3])
+            return
         self._application.on_broker_connected()
+        self._setup_step = 0
         self.setup_queue(self._queue)
 
     def setup_queue(self, queue_name):
@@ -181,7 +235,12 @@ class AMQPConsumer(object):
 
         """
         logger.info('Declaring queue %s', queue_name)
-        self._channel.queue_declare(self.on_queue_declareok, queue_name)
+        self._declaring_queue = True
+        if self._queue_passive:
+            self._channel.queue_declare(self.on_queue_declareok, queue_name, passive=True)
+        else:
+            self._channel.queue_declare(self.on_queue_declareok, queue_name, durable=True,
+                                        arguments=self._queue_arguments or None)
 
     def on_queue_declareok(self, method_frame):
         """Method invoked by pika when the Queue.Declare RPC call made in
@@ -192,11 +251,23 @@ class AMQPConsumer(object):
 
         :param pika.frame.Method method_frame: The Queue.DeclareOk frame
 
+        """
+        self._declaring_queue = False
+        self.bind_queue(self._bindings[0][0], self._bindings[0][3])
+
+    def bind_queue(self, exchange_name, routing_key):
+        """Bind the queue to the exchange with the routing key by issuing
+        the Queue.Bind RPC command. When this command is complete,
+        the on_bindok method will be invoked by pika.
+
+        :param str exchange_name: The name of the exchange
+        :param str routing_key: The routing key of the binding
+
         """
         logger.info('Binding %s to %s with %s',
-                    self.EXCHANGE, self._queue, self.ROUTING_KEY)
+                    exchange_name, self._queue, routing_key)
         self._channel.queue_bind(self.on_bindok, self._queue,
-                                 self.EXCHANGE, self.ROUTING_KEY)
+                                 exchange_name, routing_key)
 
     def add_on_cancel_callback(self):
         """Add a callback that will be invoked if RabbitMQ cancels the consumer
@@ -226,7 +297,7 @@ class AMQPConsumer(object):
         :param int delivery_tag: The delivery tag from the Basic.Deliver frame
 
         """
-        logger.info('Acknowledging message %s', delivery_tag)
+        logger.debug('Acknowledging message', extra={'delivery_tag': delivery_tag})
         self._channel.basic_ack(delivery_tag)
 
     def on_message(self, unused_channel, basic_deliver, properties, body):
@@ -243,9 +314,11 @@ class AMQPConsumer(object):
         :param str body: The message body
 
         """
-        logger.info('Received message # %s from %s: %s',
-                    basic_deliver.delivery_tag, properties.app_id, body)
+        logger.debug('Received message', extra={'delivery_tag': basic_deliver.delivery_tag,
+                                                'app_id': properties.app_id, 'body': body})
         self.acknowledge_message(basic_deliver.delivery_tag)
+        if self._recorder is not None:
+            self._recorder.record(body)
 
         try:
             json_body = json.loads(body.decode('utf-8'))
@@ -254,7 +327,7 @@ class AMQPConsumer(object):
                     raise ValueError('Message is not dictionary: %s' % type(json_body))
             self._application.notify(json_body)
         except (ValueError, TypeError, AttributeError, KeyError):
-            logger.exception("Message from AMQP isn't valid JSON or not dictionary: ", body)
+            logger.exception("Message from AMQP isn't valid JSON or not dictionary", extra={'body': body})
 
     def on_cancelok(self, unused_frame):
         """This method is invoked by pika when RabbitMQ acknowledges the
@@ -301,6 +374,11 @@ class AMQPConsumer(object):
 
         """
         logger.info('Queue bound')
+        self._setup_step += 1
+        if self._setup_step < len(self._bindings):
+            exchange_name, _, _, routing_key = self._bindings[self._setup_step]
+            self.bind_queue(exchange_name, routing_key)
+            return
         self.start_consuming()
 
     def close_channel(self):
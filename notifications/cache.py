@@ -0,0 +1,74 @@
+# encoding: utf-8
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded mapping which evicts the least recently used entry
+    when it grows over `maxsize`. Counts hits and misses of `get`.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def pop_matching(self, predicate):
+        """
+        Remove all entries which keys satisfy the predicate
+        :param predicate: callable receiving the key
+        :return: number of removed entries
+        """
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def items(self):
+        """
+        List of (key, value) pairs, doesn't change the order of use
+        """
+        return list(self._data.items())
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / total if total else 0.0,
+        }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -1,19 +1,325 @@
+import atexit
+import http.client
+import json
 import logging
+import os
+import queue
+import socket
+import threading
 import time
+from urllib.parse import urlparse
 
 from amqp.exceptions import NotFound
 
-from celery import Celery
-from kombu import Exchange
+from kombu import Connection, Exchange, Producer
+from kombu.exceptions import EncodeError
 
 from edx_proctor_webassistant.settings import NOTIFICATIONS
 
+from .sharding import HashRing, SHARDED_EXCHANGE, SHARDED_EXCHANGE_TYPE, shard_routing_key
+
 log = logging.getLogger(__name__)
 
 
+class NotificationPublisher(object):
+    """
+    Publishes messages from a background thread.
+
+    `publish` only puts the message into the bounded in-memory queue, so the
+    caller never waits for the transport. The thread takes all queued messages
+    (up to `batch_size`) at once and sends them over the long-lived connection.
+    If the transport is unavailable, messages wait in the queue while the thread
+    reconnects; when the queue is full new messages are dropped.
+    Subclasses implement `_send` and `_release`.
+    """
+    # errors after which the batch is dropped instead of retrying
+    fatal_errors = ()
+    # errors after which the messages which can't be serialized are dropped
+    serialization_errors = (EncodeError, TypeError, ValueError)
+
+    def __init__(self, queue_size=10000, batch_size=100, retry_interval_max=5):
+        self.batch_size = batch_size
+        self.retry_interval_max = retry_interval_max
+
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def publish(self, msg):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+            log.error('Notifications queue is full, message is dropped',
+                      extra={'action': msg.get('action'), 'room': msg.get('course_event_id')})
+
+    def flush(self, timeout=5):
+        """
+        Wait until all queued messages are handled
+        :return: True if the queue was drained in time
+        """
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() > deadline or not self._is_running():
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'published': self.published,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    def _is_running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_thread(self):
+        if self._is_running():
+            return
+        with self._lock:
+            if self._is_running():
+                return
+            if self._pid != os.getpid():
+                # Forked worker doesn't own the parent's thread and connection
+                self._reset()
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='notifications-publisher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            size = len(batch)
+            try:
+                self._publish_batch(batch)
+            finally:
+                for _ in range(size):
+                    self._queue.task_done()
+
+    def _publish_batch(self, batch):
+        interval = 0
+        while batch:
+            try:
+                self._send(batch)
+            except self.fatal_errors as e:
+                self.failed += len(batch)
+                log.error("Can't publish notifications: %s", e)
+                self._release()
+                return
+            except self.serialization_errors as e:
+                failed = self._unserializable(batch)
+                batch[:] = [msg for msg in batch if all(msg is not bad for bad in failed)]
+                self.failed += len(failed)
+                for msg in failed:
+                    log.error("Can't serialize notification, it is dropped: %s", e,
+                              extra={'action': msg.get('action'), 'room': msg.get('course_event_id')})
+            except Exception as e:
+                log.warning("Can't publish notifications, retry in %ss: %s", interval, e)
+                self._release()
+                time.sleep(interval)
+                # First retry immediately, then increase by 2s but don't exceed the max interval
+                interval = min(interval + 2, self.retry_interval_max)
+
+    def _send(self, batch):
+        """
+        Send messages and remove sent ones from the batch
+        """
+        raise NotImplementedError
+
+    def _release(self):
+        """
+        Close the connection, the next `_send` opens the new one
+        """
+        raise NotImplementedError
+
+    def _unserializable(self, batch):
+        """
+        :return: list of messages of the batch which failed to be serialized
+        """
+        raise NotImplementedError
+
+    def _reset(self):
+        """
+        Forget the connection inherited from the parent process without closing it
+        """
+        raise NotImplementedError
+
+
+class AMQPPublisher(NotificationPublisher):
+    """
+    Publishes messages to the exchange with publisher confirms.
+    Exchange is declared once per connection. `routing_key` may be
+    a callable returning the list of routing keys of the message.
+    """
+    fatal_errors = (NotFound,)
+
+    def __init__(self, broker_url, exchange, routing_key, **kwargs):
+        self.broker_url = broker_url
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self._connection = None
+        self._producer = None
+        # the first message of the batch and its routing keys which were already sent,
+        # the retry after the failure sends it only to the rest of them
+        self._head = None
+        self._head_sent = set()
+        super(AMQPPublisher, self).__init__(**kwargs)
+
+    def _send(self, batch):
+        producer = self._get_producer()
+        while batch:
+            if batch[0] is not self._head:
+                self._head = batch[0]
+                self._head_sent = set()
+            if callable(self.routing_key):
+                routing_keys = self.routing_key(batch[0])
+            else:
+                routing_keys = [self.routing_key]
+            for routing_key in routing_keys:
+                if routing_key in self._head_sent:
+                    continue
+                producer.publish(batch[0],
+                                 serializer='json',
+                                 exchange=self.exchange,
+                                 routing_key=routing_key,
+                                 retry=False)
+                self._head_sent.add(routing_key)
+            batch.pop(0)
+            self._head = None
+            self.published += 1
+
+    def _unserializable(self, batch):
+        # messages are sent one by one, the first one has failed
+        return batch[:1]
+
+    def _get_producer(self):
+        if self._producer is None:
+            connection = Connection(self.broker_url, transport_options={'confirm_publish': True})
+            channel = connection.channel()
+            self._connection = connection
+            try:
+                channel.exchange_declare(self.exchange.name, self.exchange.type, passive=True)
+            except NotFound:
+                raise NotFound("Exchange '%s' does not exist!" % self.exchange.name)
+            self._producer = Producer(channel)
+        return self._producer
+
+    def _release(self):
+        connection, self._connection, self._producer = self._connection, None, None
+        if connection is not None:
+            try:
+                connection.release()
+            except Exception:
+                pass
+
+    def _reset(self):
+        self._connection = None
+        self._producer = None
+
+
+class PushRejected(Exception):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over the Unix domain socket
+    """
+
+    def __init__(self, path, timeout=None):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class PushPublisher(NotificationPublisher):
+    """
+    Pushes batches of messages as JSON list directly to the notifications daemon
+    without the broker. Url is `unix:///path/to/socket` for the daemon's
+    `PUSH_SOCKET` or `http://host:port/push` for the daemon's web port.
+    """
+    fatal_errors = (PushRejected,)
+
+    def __init__(self, url, token=None, timeout=5, **kwargs):
+        parsed = urlparse(url)
+        if parsed.scheme == 'unix':
+            self.address = parsed.path
+            self.path = '/push'
+        elif parsed.scheme == 'http':
+            self.address = parsed.netloc
+            self.path = parsed.path or '/push'
+        else:
+            raise Exception('Unsupported push url: %s' % url)
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self._connection = None
+        super(PushPublisher, self).__init__(**kwargs)
+
+    def _send(self, batch):
+        if self._connection is None:
+            if self.url.startswith('unix:'):
+                self._connection = UnixHTTPConnection(self.address, timeout=self.timeout)
+            else:
+                self._connection = http.client.HTTPConnection(self.address, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['X-Notifications-Token'] = self.token
+        self._connection.request('POST', self.path, json.dumps(batch), headers)
+        response = self._connection.getresponse()
+        response.read()
+        if 400 <= response.status < 500:
+            raise PushRejected('%s rejected messages with status %d' % (self.url, response.status))
+        if response.status >= 300:
+            raise IOError('%s responded with status %d' % (self.url, response.status))
+        self.published += len(batch)
+        del batch[:]
+
+    def _release(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
+
+    def _unserializable(self, batch):
+        failed = []
+        for msg in batch:
+            try:
+                json.dumps(msg)
+            except (TypeError, ValueError):
+                failed.append(msg)
+        return failed or batch[:1]
+
+    def _reset(self):
+        self._connection = None
+
+
 class ProctorNotificator(object):
-    _celery_app = None
+    # list of (daemon id or None for all daemons, publisher)
+    _publishers = None
+    _publishers_lock = threading.Lock()
     _exchange = None
+    _ring = None
 
     _exchange_name = 'edx.proctoring.event'
     _routing_key = 'edx.proctoring.event'
@@ -23,40 +329,83 @@ class ProctorNotificator(object):
         msg['initiator'] = 'webassistant'
         msg['created'] = time.time()
 
-        log.info('Publish notification: %s' % str(msg))
+        log.debug('Publish notification', extra={'action': msg.get('action'), 'room': msg.get('course_event_id'),
+                                                 'code': msg.get('code')})
 
-        celery_app = cls._get_celery_app()
-        with celery_app.producer_or_acquire() as producer:
-            with celery_app.connection_or_acquire() as conn:
-                outgoing = conn.channel()
-                try:
-                    outgoing.exchange_declare(cls._exchange_name, "", passive=True)
-                    producer.publish(msg,
-                                     serializer='json',
-                                     exchange=cls._get_exchange(),
-                                     routing_key=cls._routing_key,
-                                     retry=True,
-                                     retry_policy={
-                                         'interval_start': 0,  # First retry immediately,
-                                         'interval_step': 2,  # then increase by 2s for every retry.
-                                         'interval_max': 5,  # but don't exceed 5s between retries.
-                                         'max_retries': 10
-                                     })
-                except NotFound:
-                    log.error("Can't publish message. Exchange '%s' does not exist!" % cls._exchange_name)
+        owner = cls._get_owner(msg)
+        for daemon_id, publisher in cls._get_publishers():
+            if daemon_id is None or owner is None or daemon_id == owner:
+                publisher.publish(msg)
+
+    @classmethod
+    def _get_owner(cls, msg):
+        """
+        Id of the daemon serving the message's room in the sharded mode
+        """
+        ring = cls._get_ring()
+        course_event_id = msg.get('course_event_id')
+        if ring is None or not course_event_id:
+            return None
+        return ring.node(int(course_event_id))
+
+    @classmethod
+    def _get_ring(cls):
+        if cls._ring is None and NOTIFICATIONS.get('SHARDS'):
+            cls._ring = HashRing(NOTIFICATIONS['SHARDS'])
+        return cls._ring
 
     @classmethod
-    def _get_celery_app(cls):
-        if cls._celery_app is None:
-            broker = NOTIFICATIONS.get('BROKER_URL', None)
-            if broker:
-                cls._celery_app = Celery('proctoring_notifications', broker=broker)
+    def _shard_routing_keys(cls, msg):
+        owner = cls._get_owner(msg)
+        daemons = [owner] if owner else cls._get_ring().nodes
+        return [shard_routing_key(daemon_id) for daemon_id in daemons]
+
+    @classmethod
+    def _get_publishers(cls):
+        if cls._publishers is not None:
+            return cls._publishers
+        with cls._publishers_lock:
+            if cls._publishers is not None:
+                return cls._publishers
+            options = {
+                'queue_size': NOTIFICATIONS.get('PUBLISH_QUEUE_SIZE', 10000),
+                'batch_size': NOTIFICATIONS.get('PUBLISH_BATCH_SIZE', 100),
+            }
+            transport = NOTIFICATIONS.get('TRANSPORT', 'amqp')
+            if transport == 'amqp':
+                broker = NOTIFICATIONS.get('BROKER_URL', None)
+                if not broker:
+                    raise Exception('BROKER_URL is not set!')
+                if cls._get_ring():
+                    publisher = AMQPPublisher(broker, cls._get_exchange(), cls._shard_routing_keys, **options)
+                else:
+                    publisher = AMQPPublisher(broker, cls._get_exchange(), cls._routing_key, **options)
+                publishers = [(None, publisher)]
+            elif transport == 'push':
+                urls = NOTIFICATIONS.get('PUSH_URL', None)
+                if not urls:
+                    raise Exception('PUSH_URL is not set!')
+                if isinstance(urls, str):
+                    urls = [urls]
+                # dict daemon id -> url sends messages only to the daemon of the room
+                if isinstance(urls, dict):
+                    daemon_urls = [(str(daemon_id), url) for daemon_id, url in urls.items()]
+                else:
+                    daemon_urls = [(None, url) for url in urls]
+                publishers = [(daemon_id, PushPublisher(url, NOTIFICATIONS.get('PUSH_TOKEN'), **options))
+                              for daemon_id, url in daemon_urls]
             else:
-                raise Exception('BROKER_URL is not set!')
-        return cls._celery_app
+                raise Exception('Unknown notifications transport: %s' % transport)
+            for _, publisher in publishers:
+                atexit.register(publisher.flush, NOTIFICATIONS.get('PUBLISH_FLUSH_TIMEOUT', 5))
+            cls._publishers = publishers
+        return cls._publishers
 
     @classmethod
     def _get_exchange(cls):
         if cls._exchange is None:
-            cls._exchange = Exchange(cls._exchange_name, type='fanout', durable=True)
+            if cls._get_ring():
+                cls._exchange = Exchange(SHARDED_EXCHANGE, type=SHARDED_EXCHANGE_TYPE, durable=True)
+            else:
+                cls._exchange = Exchange(cls._exchange_name, type='fanout', durable=True)
         return cls._exchange
@@ -0,0 +1,120 @@
+# encoding: utf-8
+"""
+Proctor commands sent over the SockJS connection.
+
+The client authenticates the connection with a short-living ticket issued by
+the web assistant and signed with `NOTIFICATIONS['COMMAND_SECRET']`, so the
+daemon checks it without DB queries. Commands of all connections are collected
+during a short window and forwarded to the web assistant by one HTTP request,
+which checks permissions and runs them.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+logger = logging.getLogger('notifications.web')
+
+# actions which are forwarded to the web assistant
+COMMANDS = ('comment', 'ack')
+
+
+def _signature(secret, payload):
+    return hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def sign_ticket(secret, user_id, ttl=300, now=None):
+    """
+    :return: ticket "<user id>:<expiration timestamp>:<signature>"
+    """
+    expires = int((now or time.time()) + ttl)
+    payload = '%d:%d' % (int(user_id), expires)
+    return '%s:%s' % (payload, _signature(secret, payload))
+
+
+def verify_ticket(secret, ticket, now=None):
+    """
+    :return: user id of the valid ticket or None
+    """
+    try:
+        user_id, expires, signature = str(ticket).split(':')
+        user_id, expires = int(user_id), int(expires)
+    except ValueError:
+        return None
+    # compare_digest takes only ASCII strings
+    expected = _signature(secret, '%d:%d' % (user_id, expires))
+    if not hmac.compare_digest(signature.encode('utf-8', 'replace'), expected.encode('utf-8')):
+        return None
+    if expires < (now or time.time()):
+        return None
+    return user_id
+
+
+class CommandForwarder(object):
+    """
+    Collects commands during `window` seconds (or until `batch_size` of them)
+    and posts them to the web assistant as one request:
+    {"commands": [{"user_id": ..., "action": ..., ...}, ...]}
+    The response {"results": [{"ok": true}, {"ok": false, "error": ...}, ...]}
+    has a result for every command in the same order.
+    """
+
+    def __init__(self, url, secret, window=0.01, batch_size=100, timeout=10, http_client=None):
+        self.url = url
+        self.secret = secret
+        self.window = window
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.http_client = http_client or AsyncHTTPClient()
+        # (command, future) waiting for the flush
+        self._pending = []
+        self._timer = None
+        self.counters = {'commands': 0, 'batches': 0, 'failed_batches': 0}
+
+    def authenticate(self, ticket):
+        return verify_ticket(self.secret, ticket)
+
+    def submit(self, user_id, command):
+        """
+        :return: Future resolved with the result of the command
+        """
+        future = Future()
+        self._pending.append((dict(command, user_id=user_id), future))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = IOLoop.current().call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        if self._timer is not None:
+            IOLoop.current().remove_timeout(self._timer)
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._send(batch)
+
+    @gen.coroutine
+    def _send(self, batch):
+        self.counters['commands'] += len(batch)
+        self.counters['batches'] += 1
+        results = []
+        try:
+            response = yield self.http_client.fetch(
+                self.url, method='POST', request_timeout=self.timeout,
+                headers={'Content-Type': 'application/json', 'X-Notifications-Token': self.secret},
+                body=json.dumps({'commands': [command for command, _ in batch]}))
+            results = json.loads(response.body.decode('utf-8'))['results']
+        except Exception:
+            self.counters['failed_batches'] += 1
+            logger.exception('Commands were not forwarded (%d commands)', len(batch))
+        for i, (_, future) in enumerate(batch):
+            result = results[i] if i < len(results) and isinstance(results[i], dict) else None
+            future.set_result(result or {'ok': False, 'error': 'Command was not processed'})
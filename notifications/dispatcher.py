@@ -0,0 +1,82 @@
+# encoding: utf-8
+
+import logging
+from collections import deque
+
+from tornado import gen
+from tornado.concurrent import Future
+
+logger = logging.getLogger('notifications.web')
+
+
+class KeyedDispatcher(object):
+    """
+    Runs coroutines with the same key one by one in order of submission,
+    while coroutines with different keys run concurrently, up to
+    `concurrency` at once.
+    """
+
+    def __init__(self, concurrency=10):
+        self.concurrency = concurrency
+        self.running = 0
+        self.queued = 0
+        # key -> deque of (func, args, future), present while the key has work
+        self._queues = {}
+        # keys which next task waits for the free slot
+        self._ready = deque()
+        self._scheduling = False
+
+    def submit(self, key, func, *args):
+        """
+        :return: Future resolved with the result of the coroutine
+            (or None if it raised an exception, which is logged)
+        """
+        future = Future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.append(key)
+        queue.append((func, args, future))
+        self.queued += 1
+        self._run_next()
+        return future
+
+    def _run_next(self):
+        # tasks finished synchronously call it again, the outer loop picks their followers
+        if self._scheduling:
+            return
+        self._scheduling = True
+        try:
+            while self.running < self.concurrency and self._ready:
+                key = self._ready.popleft()
+                func, args, future = self._queues[key].popleft()
+                self.queued -= 1
+                self.running += 1
+                self._run(key, func, args, future)
+        finally:
+            self._scheduling = False
+
+    @gen.coroutine
+    def _run(self, key, func, args, future):
+        try:
+            result = yield func(*args)
+        except Exception:
+            logger.exception('Task failed (key: %s)', key)
+            future.set_result(None)
+        else:
+            future.set_result(result)
+        finally:
+            self.running -= 1
+            if self._queues[key]:
+                self._ready.append(key)
+            else:
+                del self._queues[key]
+            self._run_next()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'keys': len(self._queues),
+            'concurrency': self.concurrency,
+        }
@@ -0,0 +1,173 @@
+# encoding: utf-8
+
+import io
+import json
+import logging
+import os
+import struct
+import time
+from collections import Counter
+
+logger = logging.getLogger('notifications.journal')
+
+
+class RetryJournal(object):
+    """
+    Append-only journal of messages which couldn't be written to DB.
+
+    Every record is a JSON document prefixed by its length (4 bytes, big-endian).
+    Records are read in order from the offset of the first not replayed one;
+    the file is truncated when all of them are replayed, and the rest of records
+    is moved to the new file when replayed ones take more than `compact_size`
+    bytes and the half of the file. Offset isn't persisted,
+    so after restart (or a crash during the replay) the journal is replayed from
+    the beginning: status updates are checked against `attempt_status_updated`
+    and a user session isn't inserted twice for the same exam.
+
+    The file is synced to disk by `sync`, at most once per `sync_interval` seconds,
+    so records of the last interval may be lost on the OS crash (not on the daemon's one).
+    Without the path records are kept in memory. New records are dropped
+    while not replayed ones take `size_limit` bytes.
+
+    `key` returns the key of the message (e.g. the exam code), `key in journal`
+    tells if messages of the key wait for replay.
+    """
+    HEADER = struct.Struct('>I')
+
+    def __init__(self, path=None, sync_interval=1.0, size_limit=64 * 1024 * 1024, compact_size=1024 * 1024,
+                 key=None):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.size_limit = size_limit
+        self.compact_size = compact_size
+        self.key = key or (lambda message: None)
+        self._offset = 0
+        self._next_size = None
+        self._next_key = None
+        self._records = 0
+        # key -> number of not replayed records
+        self._keys = Counter()
+        # bytes of not replayed records
+        self._size = 0
+        self._dirty = False
+        self._synced = time.time()
+        if path:
+            self._file = open(path, 'a+b')
+            self._recover()
+        else:
+            self._file = io.BytesIO()
+
+    def _recover(self):
+        """
+        Count records of the existing journal and cut the torn tail of the last write
+        """
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        offset = 0
+        while offset + self.HEADER.size <= end:
+            self._file.seek(offset)
+            size, = self.HEADER.unpack(self._file.read(self.HEADER.size))
+            if offset + self.HEADER.size + size > end:
+                break
+            self._keys[self.key(json.loads(self._file.read(size).decode('utf-8')))] += 1
+            offset += self.HEADER.size + size
+            self._records += 1
+        if offset != end:
+            logger.warning('Journal %s has incomplete record at %d, it is truncated', self.path, offset)
+            self._file.truncate(offset)
+        self._size = offset
+        if self._records:
+            logger.info('Journal %s has %d records to replay', self.path, self._records)
+
+    def append(self, message):
+        """
+        :return: False if the message is dropped because the journal is full
+        """
+        data = json.dumps(message).encode('utf-8')
+        record = self.HEADER.pack(len(data)) + data
+        if self._size + len(record) > self.size_limit:
+            return False
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(record)
+        self._file.flush()
+        self._records += 1
+        self._size += len(record)
+        self._keys[self.key(message)] += 1
+        if self.path:
+            self._dirty = True
+            if time.time() - self._synced >= self.sync_interval:
+                self.sync()
+        return True
+
+    def sync(self):
+        """
+        Flush appended records to disk, called periodically
+        """
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._synced = time.time()
+
+    def peek(self):
+        """
+        The first not replayed message or None
+        """
+        if not self._records:
+            return None
+        self._file.seek(self._offset)
+        self._next_size, = self.HEADER.unpack(self._file.read(self.HEADER.size))
+        message = json.loads(self._file.read(self._next_size).decode('utf-8'))
+        self._next_key = self.key(message)
+        return message
+
+    def commit(self):
+        """
+        Mark the message returned by `peek` as replayed
+        """
+        if self._next_size is None:
+            return
+        self._offset += self.HEADER.size + self._next_size
+        self._size -= self.HEADER.size + self._next_size
+        self._next_size = None
+        self._keys[self._next_key] -= 1
+        if not self._keys[self._next_key]:
+            del self._keys[self._next_key]
+        self._records -= 1
+        if not self._records:
+            self._offset = 0
+            self._file.seek(0)
+            self._file.truncate(0)
+            self._file.flush()
+        elif self._offset >= self.compact_size and self._offset >= self._size:
+            self._compact()
+
+    def _compact(self):
+        """
+        Move not replayed records to the beginning of the new file
+        """
+        self._file.seek(self._offset)
+        data = self._file.read()
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, self.path)
+            self._file.close()
+            self._file = open(self.path, 'a+b')
+            # appended records were synced with the new file
+            self._dirty = False
+        else:
+            self._file = io.BytesIO(data)
+        self._offset = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __len__(self):
+        return self._records
+
+    def __contains__(self, key):
+        return key in self._keys
@@ -0,0 +1,317 @@
+# encoding: utf-8
+"""
+Load test of the notifications daemon with simulated SockJS clients.
+
+The daemon's web application runs in the child process without DB: rooms
+snapshots are generated and edX status changes are broadcasted without writes.
+Messages are delivered to it by the stand-in of the broker (a pipe between the
+processes) and passed to `notify` the same way as `AMQPConsumer` does.
+The AMQP path itself isn't measured: neither the broker round trip nor pika's
+decoding and acknowledgements of `AMQPConsumer` are in the latencies and the CPU
+usage, compare `notifications.benchmark` for the cost of the AMQP publishing.
+Clients connect to the raw websocket endpoint of the SockJS router, the fan-out
+latency is measured from publishing of the status change till the client
+receives it. For every number of clients the report contains latency percentiles,
+CPU usage and RSS of the daemon:
+
+    python -m notifications.loadtest --clients 100,500,1000 --rooms 20 --rate 200 --duration 10 \\
+        --report loadtest.json
+
+`--port 0` takes a free port.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import threading
+import time
+
+import tornado
+from tornado import gen
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.websocket import websocket_connect
+
+from .benchmark import DB_SETTINGS, percentile
+from .webapp import NotificationWebApp
+
+STATUSES = ('ready_to_start', 'started', 'ready_to_submit', 'submitted')
+
+
+class LoadWebApp(NotificationWebApp):
+
+    def __init__(self, *args, **kwargs):
+        self.exams_per_room = kwargs.pop('exams_per_room', 50)
+        super(LoadWebApp, self).__init__(*args, **kwargs)
+
+    @gen.coroutine
+    def _load_room_snapshot(self, course_event_id):
+        raise gen.Return([{
+            'exam_code': exam_code(course_event_id, i),
+            'attempt_status': STATUSES[0],
+            'attempt_status_updated': None,
+            'actual_end_date': None,
+            'comments': 0,
+        } for i in range(self.exams_per_room)])
+
+    @gen.coroutine
+    def _apply_edx_message(self, message, received=None):
+        self._notify_participants(message, received)
+
+
+def exam_code(room, number):
+    return 'exam-%d-%d' % (room, number)
+
+
+def process_stats():
+    """
+    CPU seconds and current RSS of the process
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError):
+        # peak RSS, in kilobytes on Linux
+        rss = usage.ru_maxrss * 1024
+    return {'cpu': usage.ru_utime + usage.ru_stime, 'rss': rss}
+
+
+def run_daemon(port, broker, control, options, exams_per_room):
+    """
+    Daemon process: the web application, the consumer of the stand-in broker
+    and the thread answering requests of the process stats.
+    The listened port is sent to `control` first, port 0 takes a free one.
+    """
+    app = LoadWebApp(DB_SETTINGS, '/notifications', options=options, exams_per_room=exams_per_room)
+    sockets = bind_sockets(port, address='127.0.0.1')
+    HTTPServer(app).add_sockets(sockets)
+    control.send(sockets[0].getsockname()[1])
+    io_loop = IOLoop.current()
+
+    def deliver(body):
+        message = json.loads(body.decode('utf-8'))
+        if isinstance(message, dict):
+            app.notify(message)
+
+    def consume():
+        while True:
+            io_loop.add_callback(deliver, broker.get())
+
+    def answer():
+        while control.recv():
+            control.send(process_stats())
+
+    for target in (consume, answer):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+    io_loop.start()
+
+
+class LoadClient(object):
+
+    def __init__(self, room, latencies):
+        self.room = room
+        self.latencies = latencies
+        self.connection = None
+        self.greeted = None
+
+    @gen.coroutine
+    def connect(self, url):
+        self.greeted = gen.Future()
+        self.connection = yield websocket_connect('%s?course_event_id=%d' % (url, self.room),
+                                                  on_message_callback=self.on_message)
+        yield self.greeted
+
+    def on_message(self, data):
+        if data is None:
+            return
+        received = time.time()
+        msg = json.loads(data)
+        if msg.get('action') in ('hello', 'resync'):
+            if not self.greeted.done():
+                self.greeted.set_result(None)
+            return
+        for message in msg['messages'] if msg.get('action') == 'batch' else [msg]:
+            if 'sent' in message:
+                self.latencies.append(received - message['sent'])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class LoadTest(object):
+
+    def __init__(self, port, rooms, rate, duration, exams_per_room=50, options=None):
+        self.port = port
+        self.rooms = rooms
+        self.rate = rate
+        self.duration = duration
+        self.exams_per_room = exams_per_room
+        self.options = options or {}
+        self.broker = multiprocessing.Queue()
+        self.control, daemon_control = multiprocessing.Pipe()
+        self.daemon = multiprocessing.Process(target=run_daemon, args=(
+            port, self.broker, daemon_control, self.options, exams_per_room))
+        self.daemon.daemon = True
+
+    def start(self, timeout=10):
+        self.daemon.start()
+        if not self.control.poll(timeout):
+            raise Exception("Daemon didn't start in %ss" % timeout)
+        self.port = self.control.recv()
+
+    def stop(self):
+        self.control.send(False)
+        self.daemon.terminate()
+        self.daemon.join()
+
+    def daemon_stats(self):
+        self.control.send(True)
+        return self.control.recv()
+
+    @gen.coroutine
+    def wait_daemon(self, timeout=10):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                client = LoadClient(1, [])
+                yield client.connect(self.url)
+                client.close()
+                return
+            except (IOError, OSError):
+                if time.time() > deadline:
+                    raise
+                yield gen.sleep(0.1)
+
+    @property
+    def url(self):
+        return 'ws://127.0.0.1:%d/notifications/websocket' % self.port
+
+    @gen.coroutine
+    def run_step(self, clients_count):
+        latencies = []
+        clients = [LoadClient(i % self.rooms + 1, latencies) for i in range(clients_count)]
+        started = time.time()
+        for i in range(0, clients_count, 100):
+            yield [client.connect(self.url) for client in clients[i:i + 100]]
+        connect_time = time.time() - started
+        room_sizes = [0] * (self.rooms + 1)
+        for client in clients:
+            room_sizes[client.room] += 1
+
+        before = self.daemon_stats()
+        count = int(self.rate * self.duration)
+        expected = 0
+        started = time.time()
+        for i in range(count):
+            delay = started + i / float(self.rate) - time.time()
+            if delay > 0:
+                yield gen.sleep(delay)
+            room = i % self.rooms + 1
+            number = i // self.rooms
+            now = time.time()
+            self.broker.put(json.dumps({
+                'initiator': 'edx.proctoring', 'action': 'change_status', 'course_event_id': room,
+                'course_id': 'loadtest', 'code': exam_code(room, number % self.exams_per_room),
+                'status': STATUSES[number // self.exams_per_room % len(STATUSES)],
+                'created': now, 'sent': now,
+            }).encode('utf-8'))
+            expected += room_sizes[room]
+        deadline = time.time() + 10
+        while len(latencies) < expected and time.time() < deadline:
+            yield gen.sleep(0.05)
+        elapsed = time.time() - started
+        after = self.daemon_stats()
+        for client in clients:
+            client.close()
+        # let the daemon close the connections before the next step
+        yield gen.sleep(1)
+
+        latencies.sort()
+        result = {
+            'clients': clients_count,
+            'rooms': self.rooms,
+            'messages': count,
+            'expected_deliveries': expected,
+            'deliveries': len(latencies),
+            'connect_seconds': round(connect_time, 3),
+            'cpu_seconds': round(after['cpu'] - before['cpu'], 3),
+            'cpu_percent': round((after['cpu'] - before['cpu']) * 100 / elapsed, 1),
+            'rss_mb': round(after['rss'] / 1024.0 / 1024.0, 1),
+        }
+        for name, percent in (('p50', 50), ('p95', 95), ('p99', 99)):
+            result['latency_%s_ms' % name] = round(percentile(latencies, percent) * 1000, 2) if latencies else None
+        result['latency_max_ms'] = round(latencies[-1] * 1000, 2) if latencies else None
+        raise gen.Return(result)
+
+
+def run_load_test(clients, rooms=10, rate=100, duration=10, port=9190, exams_per_room=50, options=None):
+    """
+    :param clients: list of numbers of clients, every number is the separate step
+    :return: report dict
+    """
+    test = LoadTest(port, rooms, rate, duration, exams_per_room, options)
+    steps = []
+
+    @gen.coroutine
+    def run():
+        yield test.wait_daemon()
+        for clients_count in clients:
+            result = yield test.run_step(clients_count)
+            steps.append(result)
+
+    try:
+        # the daemon is forked before the IOLoop of this process is used
+        test.start()
+        IOLoop.current().run_sync(run)
+    finally:
+        test.stop()
+    return {
+        'created': int(time.time()),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'cpus': multiprocessing.cpu_count(),
+        'parameters': {'rooms': rooms, 'rate': rate, 'duration': duration, 'exams_per_room': exams_per_room,
+                       'options': options or {}},
+        'steps': steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the notifications daemon')
+    parser.add_argument('--clients', default='100,500,1000', help='comma separated numbers of clients')
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=100, help='status changes per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of publishing per step')
+    parser.add_argument('--port', type=int, default=9190)
+    parser.add_argument('--window-ms', type=int, default=0, help='BROADCAST_WINDOW_MS of the daemon')
+    parser.add_argument('--report', help='path of the JSON report')
+    args = parser.parse_args()
+
+    # every client takes a descriptor in both processes
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    report = run_load_test([int(value) for value in args.clients.split(',')], args.rooms, args.rate,
+                           args.duration, args.port, options={'BROADCAST_WINDOW_MS': args.window_ms})
+    print('%8s %10s %10s %9s %9s %9s %9s %7s %8s' % (
+        'clients', 'deliveries', 'expected', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'cpu %', 'rss MB'))
+    for step in report['steps']:
+        print('%8d %10d %10d %9s %9s %9s %9s %7.1f %8.1f' % (
+            step['clients'], step['deliveries'], step['expected_deliveries'], step['latency_p50_ms'],
+            step['latency_p95_ms'], step['latency_p99_ms'], step['latency_max_ms'], step['cpu_percent'],
+            step['rss_mb']))
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# encoding: utf-8
+"""
+Logging classes for the `LOGGING` setting of the web assistant and the daemon:
+key/value formatter with truncation of long values, sampling filter and
+the handler which writes records from the background thread.
+"""
+
+import copy
+import importlib
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+# attributes of every record, others are the fields passed by `extra`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Formats the record as key=value pairs followed by the fields passed by `extra`:
+
+        time="2018-03-23 20:36:00,123" level=INFO logger=notifications.web pid=1 msg="Exam was updated" exam=10
+
+    The message and the fields longer than `max_length` characters (e.g. message bodies) are truncated.
+    """
+
+    def __init__(self, fmt=None, datefmt=None, style='%', max_length=200):
+        super(KeyValueFormatter, self).__init__(fmt, datefmt, style)
+        self.max_length = max_length
+
+    def format(self, record):
+        fields = [
+            ('time', self.formatTime(record, self.datefmt)),
+            ('level', record.levelname),
+            ('logger', record.name),
+            ('pid', record.process),
+        ]
+        payload = [('msg', record.getMessage())]
+        payload.extend(sorted((key, value) for key, value in vars(record).items()
+                              if key not in _RECORD_ATTRS and not key.startswith('_')))
+        text = ' '.join(['%s=%s' % (key, self._format_value(value)) for key, value in fields] +
+                        ['%s=%s' % (key, self._format_value(value, self.max_length)) for key, value in payload])
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            text += '\n' + record.exc_text
+        return text
+
+    def _format_value(self, value, max_length=None):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        value = str(value)
+        if max_length and len(value) > max_length:
+            value = value[:max_length] + '...'
+        if not value or any(char in value for char in ' "=\n'):
+            value = '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return value
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes one of every `1 / rate` records below `level` of the `name` logger
+    and its children, rate 0 drops all of them. Records of other loggers
+    and records of `level` and above always pass.
+    """
+
+    def __init__(self, name='', rate=1.0, level='WARNING'):
+        super(SamplingFilter, self).__init__(name)
+        self.every = int(round(1.0 / rate)) if rate > 0 else 0
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= self.level or not super(SamplingFilter, self).filter(record):
+            return True
+        if not self.every:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    Puts records to the bounded queue, the background thread passes them
+    to the target handler, so the IOLoop and the request threads don't wait
+    for the log I/O. Records are dropped when the queue is full.
+    The target handler is created from `handler_class` and the rest of
+    the arguments and gets the formatter of this handler:
+
+        'background': {
+            'class': 'notifications.logs.BackgroundHandler',
+            'handler_class': 'logging.FileHandler',
+            'filename': 'server.log',
+            'formatter': 'kv',
+        }
+    """
+
+    def __init__(self, handler_class='logging.StreamHandler', queue_size=10000, **kwargs):
+        super(BackgroundHandler, self).__init__(queue.Queue(queue_size))
+        module_name, class_name = handler_class.rsplit('.', 1)
+        self.target = getattr(importlib.import_module(module_name), class_name)(**kwargs)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super(BackgroundHandler, self).setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def _start(self):
+        # the thread is started again in the forked workers
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # the message is formatted now, its arguments may be changed by the caller later
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super(BackgroundHandler, self).emit(record)
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            # writes the queued records
+            self._listener.stop()
+        self._listener = None
+        self._pid = None
+        self.target.close()
+        super(BackgroundHandler, self).close()
@@ -0,0 +1,112 @@
+# encoding: utf-8
+
+from collections import OrderedDict
+
+import tornado.web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics(object):
+    """
+    Counters and histograms of the daemon rendered in the Prometheus text format.
+    Values which are already counted elsewhere (caches, rooms, DB pool)
+    are passed to `render` as families collected at the scrape time:
+    (name, type, help, [(labels, value), ...]).
+    """
+
+    def __init__(self, prefix='notifications'):
+        self.prefix = prefix
+        # name -> [type, help, labels -> value, buckets]
+        self._families = OrderedDict()
+
+    def counter(self, name, help_text):
+        self._families[name] = ['counter', help_text, OrderedDict(), None]
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._families[name] = ['histogram', help_text, OrderedDict(), buckets]
+
+    def inc(self, name, value=1, **labels):
+        values = self._families[name][2]
+        key = tuple(sorted(labels.items()))
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        family = self._families[name]
+        key = tuple(sorted(labels.items()))
+        histogram = family[2].get(key)
+        if histogram is None:
+            histogram = family[2][key] = Histogram(family[3])
+        histogram.observe(value)
+
+    def get(self, name, **labels):
+        return self._families[name][2].get(tuple(sorted(labels.items())))
+
+    def render(self, collected=()):
+        lines = []
+        for name, (metric_type, help_text, values, _) in self._families.items():
+            self._render_family(lines, name, metric_type, help_text, values.items())
+        for name, metric_type, help_text, samples in collected:
+            self._render_family(lines, name, metric_type, help_text, samples)
+        return '\n'.join(lines) + '\n'
+
+    def _render_family(self, lines, name, metric_type, help_text, samples):
+        name = '%s_%s' % (self.prefix, name)
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels, value in samples:
+            labels = tuple(labels)
+            if metric_type == 'histogram':
+                cumulative = 0
+                for bound, count in zip(value.buckets, value.counts):
+                    cumulative += count
+                    lines.append(_sample(name + '_bucket', labels + (('le', _format(bound)),), cumulative))
+                lines.append(_sample(name + '_bucket', labels + (('le', '+Inf'),), value.count))
+                lines.append(_sample(name + '_sum', labels, value.sum))
+                lines.append(_sample(name + '_count', labels, value.count))
+            else:
+                lines.append(_sample(name, labels, value))
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{%s}' % ','.join('%s="%s"' % (key, _escape(val)) for key, val in labels)
+    return '%s %s' % (name, _format(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    if isinstance(value, bool) or isinstance(value, int):
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """
+    Metrics of the application in the Prometheus text format
+    """
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.application.metrics.render(self.application.collect_metrics()))
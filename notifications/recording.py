@@ -0,0 +1,52 @@
+# encoding: utf-8
+
+import logging
+import struct
+import time
+
+logger = logging.getLogger('notifications.amqp')
+
+
+class TrafficRecorder(object):
+    """
+    Append-only recording of the received message bodies for the replay
+    (see `notifications.replay`). Every record is the receiving timestamp
+    (8 bytes double) and the body length (4 bytes), big-endian, followed by
+    the body as it was received.
+    """
+    HEADER = struct.Struct('>dI')
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = open(path, 'ab')
+
+    def record(self, body, timestamp=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self._file.write(self.HEADER.pack(timestamp or time.time(), len(body)) + body)
+        # no fsync, the recording isn't worth slowing the consumer down
+        self._file.flush()
+        self.records += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_recording(path):
+    """
+    :return: generator of (timestamp, body) of the recording,
+        the incomplete last record is skipped
+    """
+    header = TrafficRecorder.HEADER
+    with open(path, 'rb') as recording:
+        while True:
+            data = recording.read(header.size)
+            if len(data) < header.size:
+                break
+            timestamp, size = header.unpack(data)
+            body = recording.read(size)
+            if len(body) < size:
+                logger.warning('Recording %s has incomplete record at the end', path)
+                break
+            yield timestamp, body
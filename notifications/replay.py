@@ -0,0 +1,150 @@
+# encoding: utf-8
+"""
+Replay of the AMQP traffic recorded by the daemon (`NOTIFICATIONS['RECORD_FILE']`).
+
+The daemon's web application is started in-process with the DB from the settings,
+recorded messages are published with the recorded intervals divided by `--speed`
+(0 is the maximum speed) and the end-to-end latency is measured from the publishing
+till the message is processed: written to DB and broadcasted.
+
+    python -m notifications.replay traffic.rec --speed 10 --transport inprocess
+    python -m notifications.replay traffic.rec --speed 0 --transport push --no-db
+
+`created` of the messages is set to the publishing time, so status changes
+aren't skipped as older than the ones already written to DB. Use a copy of the
+production DB, the replay changes statuses of the exams.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from tornado import gen
+
+from .benchmark import DB_SETTINGS, TRANSPORTS, make_publisher, percentile, run_daemon
+from .recording import read_recording
+from .webapp import NotificationWebApp
+
+
+class ReplayWebApp(NotificationWebApp):
+
+    def __init__(self, *args, **kwargs):
+        self.use_db = kwargs.pop('use_db', True)
+        self.latencies = []
+        self.expected = 0
+        self.ready = threading.Event()
+        self.finished = threading.Event()
+        super(ReplayWebApp, self).__init__(*args, **kwargs)
+
+    def notify(self, message):
+        if message.get('action') == 'replay_warmup':
+            self.ready.set()
+            return
+        super(ReplayWebApp, self).notify(message)
+        if not message.get('initiator') or message.get('action') == 'cache_bust':
+            self._complete(message)
+
+    @gen.coroutine
+    def _process_edx_message(self, message, received=None):
+        yield super(ReplayWebApp, self)._process_edx_message(message, received)
+        self._complete(message)
+
+    @gen.coroutine
+    def _apply_edx_message(self, message, received=None):
+        if self.use_db:
+            yield super(ReplayWebApp, self)._apply_edx_message(message, received)
+        else:
+            self._notify_participants(message, received)
+
+    def _notify_participants(self, message, received=None):
+        super(ReplayWebApp, self)._notify_participants(message, received)
+        if message.get('initiator') != 'edx.proctoring':
+            self._complete(message)
+
+    def _complete(self, message):
+        sent = message.get('replay_sent')
+        if sent is not None:
+            self.latencies.append(time.time() - sent)
+            if len(self.latencies) >= self.expected:
+                self.finished.set()
+
+
+def load_messages(path):
+    """
+    :return: list of (recording timestamp, message)
+    """
+    messages = []
+    for timestamp, body in read_recording(path):
+        try:
+            message = json.loads(body.decode('utf-8'))
+        except ValueError:
+            continue
+        if isinstance(message, dict):
+            messages.append((timestamp, message))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay of the recorded notifications traffic')
+    parser.add_argument('recording', help='file recorded by the daemon (NOTIFICATIONS[\'RECORD_FILE\'])')
+    parser.add_argument('--speed', type=float, default=1, help='speed of the replay, 0 is the maximum speed')
+    parser.add_argument('--transport', choices=TRANSPORTS, default='inprocess')
+    parser.add_argument('--broker', help='broker url for the amqp transport')
+    parser.add_argument('--no-db', action='store_true', help='broadcast edX messages without DB writes')
+    args = parser.parse_args()
+    if args.transport == 'amqp' and not args.broker:
+        parser.error('--broker is required for the amqp transport')
+
+    messages = load_messages(args.recording)
+    if not messages:
+        parser.error('recording has no messages')
+    if args.no_db:
+        db_settings = DB_SETTINGS
+    else:
+        from edx_proctor_webassistant.settings import DATABASES
+        db_settings = DATABASES['default']
+
+    app = ReplayWebApp(db_settings, '/notifications', use_db=not args.no_db)
+    app.expected = len(messages)
+    publisher, address = make_publisher(app, args.transport, args.broker)
+    daemon = threading.Thread(target=run_daemon, args=(app, args.transport, address))
+    daemon.daemon = True
+    daemon.start()
+
+    while not app.ready.is_set():
+        publisher.publish({'initiator': 'replay', 'action': 'replay_warmup'})
+        app.ready.wait(0.5)
+    publisher.flush()
+
+    first = messages[0][0]
+    started = time.time()
+    for timestamp, message in messages:
+        if args.speed:
+            delay = started + (timestamp - first) / args.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        message['created'] = message['replay_sent'] = time.time()
+        publisher.publish(message)
+    published = time.time() - started
+    if not app.finished.wait(max(60, published)):
+        print('Timeout: %d of %d messages processed' % (len(app.latencies), len(messages)))
+    total = time.time() - started
+
+    latencies = sorted(app.latencies)
+    commits = app.metrics.get('stage_latency_seconds', stage='db_commit')
+    commits = commits.count if commits else 0
+    print('recording: %d messages during %.1f s, speed: %s, transport: %s' % (
+        len(messages), messages[-1][0] - first, '%gx' % args.speed if args.speed else 'max', args.transport))
+    print('replay: %.1f s, processed: %d, dropped: %d, throughput: %.0f messages/s' % (
+        total, len(latencies), publisher.dropped, len(latencies) / total))
+    if latencies:
+        print('latency ms: p50 %.2f, p95 %.2f, p99 %.2f, max %.2f' % tuple(
+            value * 1000 for value in (percentile(latencies, 50), percentile(latencies, 95),
+                                       percentile(latencies, 99), latencies[-1])))
+    print('db: %d commits (%.0f/s), %d journaled' % (
+        commits, commits / total, app.metrics.get('journaled_messages_total') or 0))
+
+
+if __name__ == '__main__':
+    main()
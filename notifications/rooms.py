@@ -0,0 +1,225 @@
+# encoding: utf-8
+
+from collections import deque
+from itertools import islice
+
+
+class RoomHistory(object):
+    """
+    Ring buffer with the last messages broadcasted to the room.
+    Every message gets the sequence number which is unique inside the room
+    so reconnected clients could ask only for the missed messages.
+    """
+    __slots__ = ('seq', '_messages')
+
+    def __init__(self, maxlen):
+        self.seq = 0
+        self._messages = deque(maxlen=maxlen)
+
+    def append(self, message):
+        self.seq += 1
+        message['seq'] = self.seq
+        self._messages.append(message)
+        return self.seq
+
+    def since(self, last_seq):
+        """
+        Messages with sequence number greater than `last_seq`
+        :param last_seq: int
+        :return: list or None if some of the messages were already overwritten
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self._messages or self._messages[0]['seq'] > last_seq + 1:
+            return None
+        return list(islice(self._messages, last_seq + 1 - self._messages[0]['seq'], None))
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class ExamState(object):
+    """
+    Compact state of the exam attempt inside the room snapshot
+    """
+    __slots__ = ('status', 'updated', 'end_date', 'comments')
+
+    def __init__(self, status=None, updated=None, end_date=None, comments=0):
+        self.status = status
+        self.updated = updated
+        self.end_date = end_date
+        self.comments = comments
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'updated': self.updated,
+            'end_date': self.end_date,
+            'comments': self.comments,
+        }
+
+
+class RoomSnapshot(object):
+    """
+    Exam code -> ExamState of all attempts in the room.
+    Snapshot is loaded from DB once and then kept up to date by the broadcasted
+    messages. Messages received during the loading are applied after it.
+    """
+    __slots__ = ('exams', 'loaded', 'loading', '_pending')
+
+    def __init__(self):
+        self.exams = {}
+        self.loaded = False
+        self.loading = None
+        self._pending = []
+
+    def load(self, rows):
+        """
+        :param rows: iterable of dicts with `exam_code`, `attempt_status`,
+            `attempt_status_updated`, `actual_end_date` and `comments` keys
+        """
+        for row in rows:
+            self.exams[row['exam_code']] = ExamState(
+                row['attempt_status'],
+                _timestamp(row['attempt_status_updated']),
+                _isoformat(row['actual_end_date']),
+                row['comments'] or 0
+            )
+        self.loaded = True
+        pending, self._pending = self._pending, []
+        for message in pending:
+            self.apply(message)
+
+    def apply(self, message):
+        if not self.loaded:
+            self._pending.append(message)
+            return
+
+        action = message.get('action')
+        if action == 'new_comment':
+            exam = self.exams.get(message.get('exam_code'))
+            if exam:
+                exam.comments += 1
+            return
+
+        code = message.get('code')
+        if not code:
+            return
+        exam = self.exams.get(code)
+        if action == 'new_attempt':
+            if exam is None:
+                self.exams[code] = ExamState(message.get('status'), message.get('created'))
+        elif action == 'change_status' and exam and message.get('status'):
+            updated = message.get('created')
+            if not exam.updated or not updated or updated > exam.updated:
+                exam.status = message['status']
+                exam.updated = updated
+            if message.get('actual_end_date'):
+                exam.end_date = message['actual_end_date']
+
+    def to_dict(self):
+        return {code: exam.to_dict() for code, exam in self.exams.items()}
+
+    def __len__(self):
+        return len(self.exams)
+
+
+def _timestamp(value):
+    return value.timestamp() if value else None
+
+
+def _isoformat(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+class MessageBatch(object):
+    """
+    Messages collected for the room during the coalescing window.
+    Later status change of the exam supersedes the earlier one.
+    """
+    __slots__ = ('_messages', '_received', '_statuses', 'superseded')
+
+    def __init__(self):
+        self._messages = []
+        self._received = []
+        self._statuses = {}
+        self.superseded = 0
+
+    def add(self, message):
+        self._received.append(message)
+        code = message.get('code')
+        if code and message.get('action') == 'change_status':
+            prev = self._statuses.get(code)
+            if prev is not None:
+                self._messages[prev] = None
+                self.superseded += 1
+            self._statuses[code] = len(self._messages)
+        self._messages.append(message)
+
+    def messages(self):
+        return [msg for msg in self._messages if msg is not None]
+
+    def received_messages(self):
+        """
+        All added messages including superseded ones
+        """
+        return self._received
+
+    def __len__(self):
+        return len(self._received)
+
+
+class RoomRegistry(object):
+    """
+    Room id -> set of connections. Empty rooms are removed,
+    so the registry doesn't grow with every room ever seen.
+    """
+    __slots__ = ('_rooms', '_connections')
+
+    def __init__(self):
+        self._rooms = {}
+        self._connections = 0
+
+    def add(self, room, conn):
+        connections = self._rooms.get(room)
+        if connections is None:
+            connections = self._rooms[room] = set()
+        if conn not in connections:
+            connections.add(conn)
+            self._connections += 1
+
+    def remove(self, room, conn):
+        connections = self._rooms.get(room)
+        if connections is not None and conn in connections:
+            connections.remove(conn)
+            self._connections -= 1
+            if not connections:
+                del self._rooms[room]
+
+    def get(self, room, default=()):
+        return self._rooms.get(room, default)
+
+    def connections(self):
+        for connections in self._rooms.values():
+            for conn in connections:
+                yield conn
+
+    def rooms_sizes(self):
+        return {room: len(connections) for room, connections in self._rooms.items()}
+
+    def clear(self):
+        self._rooms.clear()
+        self._connections = 0
+
+    @property
+    def rooms_count(self):
+        return len(self._rooms)
+
+    @property
+    def connections_count(self):
+        return self._connections
+
+    def __contains__(self, room):
+        return room in self._rooms
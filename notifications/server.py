@@ -5,9 +5,13 @@ import logging.config
 
 from tornado import ioloop, gen
 from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_unix_socket
+from tornado.web import Application
 
 from .amqp_consumer import AMQPConsumer
-from .webapp import NotificationWebApp
+from .recording import TrafficRecorder
+from .sharding import shard_routing_key
+from .webapp import NotificationWebApp, PushHandler
 
 
 logger = logging.getLogger('notifications')
@@ -15,28 +19,43 @@ logger = logging.getLogger('notifications')
 
 class NotificationServer(object):
 
-    def __init__(self, webport, daemon_id, web_url, broker_url, db_settings=None, raven_dsn=None):
+    def __init__(self, webport, daemon_id, web_url, broker_url, db_settings=None, raven_dsn=None, options=None):
+        options = options or {}
         self.webport = webport
         self.broker_url = broker_url
+        self.push_socket = options.get('PUSH_SOCKET')
         self._ioloop_instance = ioloop.IOLoop.instance()
 
-        self.web_app = NotificationWebApp(db_settings, web_url, raven_dsn)
-        self.amqp_consumer = AMQPConsumer(self.web_app, daemon_id, broker_url)
+        self.web_app = NotificationWebApp(db_settings, web_url, raven_dsn, options=dict(options, DAEMON_ID=daemon_id))
+        # in the sharded mode the daemon receives web assistant's messages only for its rooms
+        shard_key = shard_routing_key(daemon_id) if options.get('SHARDS') else None
+        # received AMQP messages are recorded for the replay
+        self.recorder = TrafficRecorder(options['RECORD_FILE']) if options.get('RECORD_FILE') else None
+        # without the broker only messages pushed directly by the web assistant are received
+        self.amqp_consumer = AMQPConsumer(self.web_app, daemon_id, broker_url, shard_key,
+                                          recorder=self.recorder,
+                                          queue_ttl=options.get('AMQP_QUEUE_TTL'),
+                                          queue_expires=options.get('AMQP_QUEUE_EXPIRES')) if broker_url else None
         self.web_server = HTTPServer(self.web_app)
+        self.push_server = None
         self.is_alive = False
 
     def start(self):
-        self.web_app.listen(self.webport)
+        self.web_server.listen(self.webport)
         logger.info('Web server listening to %s', self.webport)
 
+        if self.push_socket:
+            self.push_server = HTTPServer(Application([(r'/push', PushHandler, {'notifier': self.web_app})]))
+            self.push_server.add_socket(bind_unix_socket(self.push_socket, mode=0o660))
+            logger.info('Push server listening to %s', self.push_socket)
+
         signal.signal(signal.SIGTERM, self.sig_handler)
         signal.signal(signal.SIGINT, self.sig_handler)
 
-        # timeout in 10 seconds because web frontend
-        # tries to reconnect sockjs connection every 3 seconds
-        # and to avoid miss events AMQP connection should be established
-        # only all listeners will be connected
-        self._ioloop_instance.call_later(10, self._run_amqp_consumer)
+        # consuming starts at once: messages which came while the daemon was stopped wait
+        # in the durable queue, clients connected later get the room's snapshot and history
+        if self.amqp_consumer:
+            self._ioloop_instance.add_callback(self._run_amqp_consumer)
 
         logger.info('IOLoop start')
         self.is_alive = True
@@ -53,10 +72,15 @@ class NotificationServer(object):
 
     @gen.coroutine
     def stop(self):
-        self.amqp_consumer.stop()
+        if self.amqp_consumer:
+            self.amqp_consumer.stop()
         while self.web_app.broker_connected:
             logger.info('Waiting until the AMQPConsumer will stop.')
             yield gen.sleep(0.1)
         self.web_server.stop()
+        if self.push_server:
+            self.push_server.stop()
+        if self.recorder:
+            self.recorder.close()
         self._ioloop_instance.stop()
         logger.info('Notifications stopped')
@@ -0,0 +1,93 @@
+# encoding: utf-8
+"""
+Sharding of rooms between notification daemons.
+
+Rooms (course_event_id) are assigned to daemons by consistent hashing, so
+adding a daemon moves only a part of rooms. The same ring is implemented
+in `ui/static/js/app/common/modules/websocket.js` to choose the daemon url.
+
+Print Nginx locations for the daemons from the `NOTIFICATIONS['SHARDS']` setting:
+
+    python -m notifications.sharding
+"""
+
+from bisect import bisect_left
+
+SHARDED_EXCHANGE = 'edx.proctoring.event.sharded'
+SHARDED_EXCHANGE_TYPE = 'direct'
+
+
+def ring_hash(value):
+    """
+    32-bit FNV-1a hash of the string mixed by the MurmurHash3 finalizer,
+    FNV alone spreads sequential ids unevenly
+    """
+    result = 0x811c9dc5
+    for byte in str(value).encode('utf-8'):
+        result ^= byte
+        result = (result * 0x01000193) & 0xffffffff
+    result ^= result >> 16
+    result = (result * 0x85ebca6b) & 0xffffffff
+    result ^= result >> 13
+    result = (result * 0xc2b2ae35) & 0xffffffff
+    result ^= result >> 16
+    return result
+
+
+class HashRing(object):
+    """
+    Consistent hashing ring of the daemon ids
+    """
+
+    def __init__(self, nodes, replicas=160):
+        self.nodes = sorted(str(node) for node in nodes)
+        if not self.nodes:
+            raise ValueError('Ring must have at least one node')
+        points = sorted((ring_hash('%s#%d' % (node, i)), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, node in points]
+        self._nodes = [node for point, node in points]
+
+    def node(self, key):
+        index = bisect_left(self._hashes, ring_hash(key))
+        if index == len(self._hashes):
+            index = 0
+        return self._nodes[index]
+
+
+def shard_routing_key(daemon_id):
+    return 'shard.%s' % daemon_id
+
+
+def shard_url(web_url, daemon_id):
+    return '%s/%s' % (web_url.rstrip('/'), daemon_id)
+
+
+def nginx_locations(web_url, shards):
+    """
+    Nginx locations which proxy every shard's url to its daemon
+    :param shards: dict daemon id -> daemon address (host:port)
+    """
+    blocks = []
+    for daemon_id in sorted(shards):
+        blocks.append(
+            'location %s {\n'
+            '    proxy_http_version 1.1;\n'
+            '    proxy_set_header Upgrade $http_upgrade;\n'
+            '    proxy_set_header Connection "upgrade";\n'
+            '    proxy_pass http://%s;\n'
+            '    proxy_buffers 8 32k;\n'
+            '    proxy_buffer_size 64k;\n'
+            '}\n' % (shard_url(web_url, daemon_id), shards[daemon_id]))
+    return '\n'.join(blocks)
+
+
+def main():
+    from edx_proctor_webassistant.settings import NOTIFICATIONS
+
+    if not NOTIFICATIONS.get('SHARDS'):
+        raise Exception('NOTIFICATIONS[\'SHARDS\'] is not set')
+    print(nginx_locations(NOTIFICATIONS['WEB_URL'], NOTIFICATIONS['SHARDS']))
+
+
+if __name__ == '__main__':
+    main()
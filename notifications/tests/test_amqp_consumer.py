@@ -0,0 +1,131 @@
+"""
+Tests for the declaration of the daemon's queue and the reconnection to the broker
+"""
+import logging
+from unittest import TestCase, skipIf
+from unittest.mock import Mock, patch
+
+try:
+    from notifications.amqp_consumer import AMQPConsumer, NOT_FOUND, PRECONDITION_FAILED
+except SyntaxError:
+    # pika 0.11 doesn't import on Python 3.7+ (`async` attribute), the daemon runs on 3.6
+    AMQPConsumer = None
+
+
+class FakeChannel(object):
+    """
+    Channel which answers every RPC at once, except the declarations of the queue
+    """
+    def __init__(self, number):
+        self.number = number
+        self.declared = []
+        self.bound = []
+        self.consumed = []
+
+    def __int__(self):
+        return self.number
+
+    def add_on_close_callback(self, callback):
+        pass
+
+    def add_on_cancel_callback(self, callback):
+        pass
+
+    def exchange_declare(self, callback, exchange, exchange_type, durable=False):
+        callback(None)
+
+    def queue_declare(self, callback, queue, **kwargs):
+        self.declared.append((queue, kwargs))
+        self.declare_ok = callback
+
+    def queue_bind(self, callback, queue, exchange, routing_key):
+        self.bound.append((queue, exchange, routing_key))
+        callback(None)
+
+    def basic_consume(self, callback, queue):
+        self.consumed.append(queue)
+        return 'tag'
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.channels = []
+        self.timeouts = []
+        self.closed = False
+
+    def channel(self, on_open_callback):
+        channel = FakeChannel(len(self.channels) + 1)
+        self.channels.append(channel)
+        on_open_callback(channel)
+
+    def add_timeout(self, deadline, callback):
+        self.timeouts.append((deadline, callback))
+
+    def close(self):
+        self.closed = True
+
+
+@skipIf(AMQPConsumer is None, 'pika 0.11 needs Python 3.6')
+class AMQPConsumerTestCase(TestCase):
+    def setUp(self):
+        self.app = Mock()
+        self.consumer = AMQPConsumer(self.app, 1, 'amqp://localhost', queue_ttl=60, queue_expires=3600)
+        self.connection = self.consumer._connection = FakeConnection()
+        self.logger = logging.getLogger('notifications.amqp')
+        self.log_level = self.logger.level
+        self.logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        self.logger.setLevel(self.log_level)
+
+    def test_declare(self):
+        self.consumer.open_channel()
+        channel = self.connection.channels[0]
+        self.assertEqual(channel.declared, [('edx.proctoring.event.1', {
+            'durable': True, 'arguments': {'x-message-ttl': 60000, 'x-expires': 3600000}})])
+        channel.declare_ok(None)
+        self.assertEqual(channel.bound, [('edx.proctoring.event.1', 'edx.proctoring.event', 'edx.proctoring.event')])
+        self.assertEqual(channel.consumed, ['edx.proctoring.event.1'])
+        self.app.on_broker_connected.assert_called_once_with()
+
+    def test_existing_queue_with_other_parameters(self):
+        self.consumer.open_channel()
+        channel = self.connection.channels[0]
+        self.consumer.on_channel_closed(channel, PRECONDITION_FAILED, 'PRECONDITION_FAILED - inequivalent arg')
+        self.assertFalse(self.connection.closed)
+        channel = self.connection.channels[1]
+        self.assertEqual(channel.declared, [('edx.proctoring.event.1', {'passive': True})])
+        channel.declare_ok(None)
+        self.assertEqual(channel.consumed, ['edx.proctoring.event.1'])
+
+        # the old queue was deleted
+        self.consumer.open_channel()
+        channel = self.connection.channels[2]
+        self.consumer.on_channel_closed(channel, NOT_FOUND, 'NOT_FOUND - no queue')
+        channel = self.connection.channels[3]
+        self.assertEqual(channel.declared[0][1]['durable'], True)
+        self.assertFalse(self.connection.closed)
+
+    def test_other_channel_errors(self):
+        self.consumer.open_channel()
+        channel = self.connection.channels[0]
+        channel.declare_ok(None)
+        # not during the declaration of the queue
+        self.consumer.on_channel_closed(channel, PRECONDITION_FAILED, 'unknown delivery tag')
+        self.assertTrue(self.connection.closed)
+
+    def test_reconnect(self):
+        self.consumer.on_connection_closed(self.connection, 320, 'CONNECTION_FORCED')
+        self.assertEqual(len(self.connection.timeouts), 1)
+        deadline, reconnect = self.connection.timeouts[0]
+        new_connection = FakeConnection()
+        with patch.object(self.consumer, 'connect', return_value=new_connection):
+            reconnect()
+        self.app.on_broker_reconnect.assert_called_once_with()
+        self.assertIs(self.consumer._connection, new_connection)
+
+    def test_no_reconnect_on_stop(self):
+        self.consumer._closing = True
+        self.consumer.on_connection_closed(self.connection, 200, 'Normal shutdown')
+        self.assertEqual(self.connection.timeouts, [])
+        self.app.on_broker_closed.assert_called_once_with()
@@ -0,0 +1,90 @@
+"""
+Tests for notification daemon caches
+"""
+from unittest import TestCase
+
+from notifications.cache import LRUCache
+from notifications.rooms import RoomSnapshot
+from notifications.webapp import NotificationWebApp
+
+DB_SETTINGS = {
+    'HOST': '127.0.0.1',
+    'PORT': '3306',
+    'USER': 'user',
+    'PASSWORD': 'password',
+    'NAME': 'db',
+}
+
+
+class LRUCacheTestCase(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_stats(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_pop_matching(self):
+        cache = LRUCache(10)
+        cache.set((1, 'code1'), {})
+        cache.set((1, 'code2'), {})
+        cache.set((2, 'code3'), {})
+        self.assertEqual(cache.pop_matching(lambda key: key[0] == 1), 2)
+        self.assertEqual(len(cache), 1)
+
+
+class CacheBustTestCase(TestCase):
+    def setUp(self):
+        self.app = NotificationWebApp(DB_SETTINGS, '/notifications')
+        self.app.courses.set('org/course/run', 1)
+        self.app.courses.set('org/course/run2', 2)
+        self.app.exams.set((1, 'code1'), {'id': 1})
+        self.app.exams.set((1, 'code2'), {'id': 2})
+        self.app.exams.set((2, 'code3'), {'id': 3})
+
+    def test_bust_codes(self):
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust', 'codes': ['code1', 'code3']})
+        self.assertNotIn((1, 'code1'), self.app.exams)
+        self.assertNotIn((2, 'code3'), self.app.exams)
+        self.assertIn((1, 'code2'), self.app.exams)
+        self.assertEqual(len(self.app.courses), 2)
+
+    def test_bust_course(self):
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust', 'course_id': 'org/course/run'})
+        self.assertNotIn('org/course/run', self.app.courses)
+        self.assertEqual(len(self.app.exams), 1)
+
+    def test_bust_all(self):
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust'})
+        self.assertEqual(len(self.app.courses), 0)
+        self.assertEqual(len(self.app.exams), 0)
+
+    def test_bust_snapshots(self):
+        snapshots = self.app.notifications_router.snapshots
+        for room, code in ((1, 'code1'), (2, 'code2')):
+            snapshot = RoomSnapshot()
+            snapshot.load([{'exam_code': code, 'attempt_status': 'started', 'attempt_status_updated': None,
+                            'actual_end_date': None, 'comments': 0}])
+            snapshots.set(room, snapshot)
+        # status polled by the web assistant, without messages to the room
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust', 'codes': ['code1']})
+        self.assertNotIn(1, snapshots)
+        self.assertIn(2, snapshots)
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust', 'course_id': 'org/course/run'})
+        self.assertIn(2, snapshots)
+        self.app.notify({'initiator': 'webassistant', 'action': 'cache_bust'})
+        self.assertEqual(len(snapshots), 0)
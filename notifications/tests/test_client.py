@@ -0,0 +1,138 @@
+"""
+Tests for the background notifications publisher
+"""
+import threading
+from unittest import TestCase, mock
+
+from kombu import Connection, Exchange, Queue
+
+from notifications.client import AMQPPublisher, ProctorNotificator
+
+BROKER_URL = 'memory://'
+
+
+class AMQPPublisherTestCase(TestCase):
+    def setUp(self):
+        self.exchange = Exchange('test.proctoring.event', type='fanout', durable=True)
+        self.connection = Connection(BROKER_URL)
+        self.queue = Queue('test.proctoring.queue', self.exchange)(self.connection.default_channel)
+        self.queue.declare()
+        self.queue.purge()
+
+    def tearDown(self):
+        self.connection.release()
+
+    def _received(self):
+        messages = []
+        while True:
+            message = self.queue.get(no_ack=True)
+            if message is None:
+                return messages
+            messages.append(message.decode())
+
+    def test_publish(self):
+        publisher = AMQPPublisher(BROKER_URL, self.exchange, 'test')
+        for i in range(5):
+            publisher.publish({'n': i})
+        self.assertTrue(publisher.flush())
+        self.assertEqual([msg['n'] for msg in self._received()], list(range(5)))
+        self.assertEqual(publisher.stats()['published'], 5)
+
+    def test_channel_is_reused(self):
+        publisher = AMQPPublisher(BROKER_URL, self.exchange, 'test')
+        publisher.publish({'n': 1})
+        publisher.flush()
+        producer = publisher._producer
+        publisher.publish({'n': 2})
+        publisher.flush()
+        self.assertIs(publisher._producer, producer)
+
+    def test_publish_does_not_block(self):
+        publisher = AMQPPublisher(BROKER_URL, self.exchange, 'test', queue_size=2)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_producer():
+            started.set()
+            release.wait(5)
+            return publisher.__class__._get_producer(publisher)
+
+        publisher._get_producer = slow_producer
+        publisher.publish({'n': 0})
+        started.wait(5)
+        # the thread is stuck on the broker, queue takes two more messages
+        for i in range(1, 5):
+            publisher.publish({'n': i})
+        self.assertEqual(publisher.dropped, 2)
+        release.set()
+        self.assertTrue(publisher.flush())
+        self.assertEqual([msg['n'] for msg in self._received()], [0, 1, 2])
+
+    def test_missing_exchange(self):
+        exchange = Exchange('test.missing.exchange', type='fanout')
+        publisher = AMQPPublisher(BROKER_URL, exchange, 'test')
+        publisher._get_producer = lambda: self._raise_not_found()
+        publisher.publish({'n': 1})
+        self.assertTrue(publisher.flush())
+        self.assertEqual(publisher.stats()['failed'], 1)
+
+    def test_retry_sends_to_the_rest_of_keys(self):
+        sent = []
+
+        class Producer(object):
+            failed = False
+
+            def publish(self, msg, routing_key, **kwargs):
+                # the connection is lost once, after the first key of the message
+                if routing_key == 'b' and not self.failed:
+                    self.failed = True
+                    raise IOError('connection lost')
+                sent.append((routing_key, msg['n']))
+
+        producer = Producer()
+        publisher = AMQPPublisher(BROKER_URL, self.exchange, lambda msg: ['a', 'b', 'c'])
+        publisher._get_producer = lambda: producer
+        publisher.publish({'n': 1})
+        publisher.publish({'n': 2})
+        self.assertTrue(publisher.flush())
+        self.assertEqual(sent, [('a', 1), ('b', 1), ('c', 1), ('a', 2), ('b', 2), ('c', 2)])
+        self.assertEqual(publisher.published, 2)
+
+    def test_unserializable_message(self):
+        publisher = AMQPPublisher(BROKER_URL, self.exchange, 'test')
+        with self.assertLogs('notifications.client', 'ERROR'):
+            publisher.publish({'n': 1})
+            publisher.publish({'n': 2, 'data': object()})
+            publisher.publish({'n': 3})
+            self.assertTrue(publisher.flush())
+        self.assertEqual([msg['n'] for msg in self._received()], [1, 3])
+        self.assertEqual(publisher.stats()['failed'], 1)
+        self.assertEqual(publisher.stats()['published'], 2)
+
+    @staticmethod
+    def _raise_not_found():
+        from amqp.exceptions import NotFound
+        raise NotFound('no exchange')
+
+
+class ProctorNotificatorTestCase(TestCase):
+    def test_publishers_are_created_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def get_publishers():
+            barrier.wait(5)
+            results.append(ProctorNotificator._get_publishers())
+
+        settings = {'TRANSPORT': 'push', 'PUSH_URL': ['http://127.0.0.1:9090/push', 'http://127.0.0.1:9091/push']}
+        with mock.patch.object(ProctorNotificator, '_publishers', None), \
+                mock.patch('notifications.client.NOTIFICATIONS', settings), \
+                mock.patch('notifications.client.atexit.register') as register:
+            threads = [threading.Thread(target=get_publishers) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(publishers is results[0] for publishers in results))
+        self.assertEqual(register.call_count, 2)
@@ -0,0 +1,125 @@
+"""
+Tests for the proctor commands sent over the notifications connection
+"""
+import json
+from unittest import TestCase
+
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from notifications.commands import CommandForwarder, sign_ticket, verify_ticket
+from notifications.webapp import NotificationsConnection, NotificationsRouter
+
+from .test_rooms import FakeSession
+
+
+class Response(object):
+    def __init__(self, body):
+        self.body = json.dumps(body).encode('utf-8')
+
+
+class FakeHTTPClient(object):
+    """
+    Answers every command with its action, or fails when `error` is set
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.error = None
+
+    def fetch(self, url, **kwargs):
+        self.requests.append(kwargs)
+        future = Future()
+        if self.error:
+            future.set_exception(self.error)
+        else:
+            commands = json.loads(kwargs['body'])['commands']
+            future.set_result(Response({'results': [{'ok': True, 'action': command['action']}
+                                                    for command in commands]}))
+        return future
+
+
+class TicketTestCase(TestCase):
+    def test_verify(self):
+        ticket = sign_ticket('secret', 7, ttl=60, now=1000)
+        self.assertEqual(verify_ticket('secret', ticket, now=1050), 7)
+        self.assertIsNone(verify_ticket('secret', ticket, now=1061))
+        self.assertIsNone(verify_ticket('other', ticket, now=1050))
+        self.assertIsNone(verify_ticket('secret', ticket.replace('7:', '8:', 1), now=1050))
+        self.assertIsNone(verify_ticket('secret', 'garbage'))
+        self.assertIsNone(verify_ticket('secret', None))
+        self.assertIsNone(verify_ticket('secret', '7:1060:\u00e9\ud800', now=1050))
+
+
+class CommandForwarderTestCase(AsyncTestCase):
+    def setUp(self):
+        super(CommandForwarderTestCase, self).setUp()
+        self.http_client = FakeHTTPClient()
+        self.forwarder = CommandForwarder('http://assistant/api/notifications_commands/', 'secret',
+                                          window=0.01, batch_size=3, http_client=self.http_client)
+
+    @gen_test
+    def test_batch(self):
+        first = self.forwarder.submit(1, {'action': 'comment', 'id': '1'})
+        second = self.forwarder.submit(2, {'action': 'ack', 'id': '1'})
+        results = yield [first, second]
+        self.assertEqual([result['action'] for result in results], ['comment', 'ack'])
+        self.assertEqual(len(self.http_client.requests), 1)
+        request = self.http_client.requests[0]
+        self.assertEqual(request['headers']['X-Notifications-Token'], 'secret')
+        self.assertEqual([(command['user_id'], command['action']) for command in json.loads(request['body'])['commands']],
+                         [(1, 'comment'), (2, 'ack')])
+
+    @gen_test
+    def test_batch_size(self):
+        futures = [self.forwarder.submit(1, {'action': 'ack'}) for _ in range(4)]
+        # the full batch is sent at once, the rest waits for the window
+        self.assertEqual(len(self.http_client.requests), 1)
+        yield futures
+        self.assertEqual(len(self.http_client.requests), 2)
+        self.assertEqual(self.forwarder.counters, {'commands': 4, 'batches': 2, 'failed_batches': 0})
+
+    @gen_test
+    def test_failure(self):
+        self.http_client.error = IOError('Connection refused')
+        result = yield self.forwarder.submit(1, {'action': 'ack'})
+        self.assertEqual(result, {'ok': False, 'error': 'Command was not processed'})
+        self.assertEqual(self.forwarder.counters['failed_batches'], 1)
+
+
+class ConnectionCommandsTestCase(AsyncTestCase):
+    def setUp(self):
+        super(ConnectionCommandsTestCase, self).setUp()
+        self.forwarder = CommandForwarder('http://assistant/', 'secret', window=0, http_client=FakeHTTPClient())
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications', commands=self.forwarder)
+        self.conn = NotificationsConnection(FakeSession(self.router))
+        self.sent = []
+        self.conn.send = self.sent.append
+
+    def command(self, **kwargs):
+        self.conn.on_message(json.dumps(kwargs))
+
+    @gen_test
+    def test_not_authenticated(self):
+        self.command(action='auth', ticket='1:1:bad')
+        yield self.conn.run_command({'action': 'comment', 'id': 'c1'})
+        self.assertEqual(self.sent, [
+            {'action': 'auth', 'ok': False},
+            {'action': 'command_result', 'id': 'c1', 'ok': False, 'error': 'Not authenticated'},
+        ])
+
+    @gen_test
+    def test_command(self):
+        self.command(action='auth', ticket=sign_ticket('secret', 5))
+        self.assertEqual(self.conn.user_id, 5)
+        yield self.conn.run_command({'action': 'ack', 'id': 'a1', 'codes': ['x'], 'status': 'started'})
+        self.assertEqual(self.sent, [
+            {'action': 'auth', 'ok': True},
+            {'action': 'command_result', 'id': 'a1', 'ok': True},
+        ])
+
+    @gen_test
+    def test_disabled(self):
+        self.router.commands = None
+        yield self.conn.run_command({'action': 'ack', 'id': 'a1'})
+        self.assertEqual(self.sent[-1]['error'], 'Commands are disabled')
@@ -0,0 +1,78 @@
+"""
+Tests for the per-exam ordered dispatcher
+"""
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from notifications.dispatcher import KeyedDispatcher
+
+
+class KeyedDispatcherTestCase(AsyncTestCase):
+    def setUp(self):
+        super(KeyedDispatcherTestCase, self).setUp()
+        self.events = []
+        self.gates = {}
+
+    @gen.coroutine
+    def task(self, name):
+        self.events.append(('start', name))
+        gate = self.gates[name] = Future()
+        yield gate
+        self.events.append(('end', name))
+
+    @gen_test
+    def test_same_key_in_order(self):
+        dispatcher = KeyedDispatcher(10)
+        first = dispatcher.submit('a', self.task, 'a1')
+        second = dispatcher.submit('a', self.task, 'a2')
+        other = dispatcher.submit('b', self.task, 'b1')
+        self.assertEqual(self.events, [('start', 'a1'), ('start', 'b1')])
+        self.assertEqual(dispatcher.stats()['queued'], 1)
+
+        self.gates['a1'].set_result(None)
+        yield first
+        self.assertIn(('start', 'a2'), self.events)
+        self.gates['a2'].set_result(None)
+        self.gates['b1'].set_result(None)
+        yield [second, other]
+        self.assertEqual(dispatcher.stats(), {'running': 0, 'queued': 0, 'keys': 0, 'concurrency': 10})
+
+    @gen_test
+    def test_concurrency_limit(self):
+        dispatcher = KeyedDispatcher(2)
+        futures = [dispatcher.submit(key, self.task, key) for key in 'abc']
+        self.assertEqual([name for event, name in self.events], ['a', 'b'])
+        self.assertEqual(dispatcher.running, 2)
+        self.assertEqual(dispatcher.queued, 1)
+        self.gates['b'].set_result(None)
+        yield futures[1]
+        self.assertEqual(self.events[-1], ('start', 'c'))
+        self.gates['a'].set_result(None)
+        self.gates['c'].set_result(None)
+        yield futures
+
+    @gen_test
+    def test_failed_task_releases_key(self):
+        dispatcher = KeyedDispatcher(1)
+
+        @gen.coroutine
+        def fail():
+            raise ValueError('failed')
+
+        @gen.coroutine
+        def succeed():
+            raise gen.Return('ok')
+
+        dispatcher.submit('a', fail)
+        result = yield dispatcher.submit('a', succeed)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(dispatcher.stats()['keys'], 0)
+
+    @gen_test
+    def test_many_synchronous_tasks(self):
+        dispatcher = KeyedDispatcher(1)
+        done = []
+        futures = [dispatcher.submit('a', done.append, i) for i in range(5000)]
+        yield futures[-1]
+        self.assertEqual(len(done), 5000)
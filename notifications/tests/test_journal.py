@@ -0,0 +1,243 @@
+"""
+Tests for the retry journal of failed DB writes
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import pymysql
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from notifications.journal import RetryJournal
+from notifications.webapp import NotificationWebApp
+
+from .test_cache import DB_SETTINGS
+
+
+class RetryJournalTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'retry.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replay_order(self):
+        journal = RetryJournal(self.path)
+        for i in range(3):
+            journal.append({'n': i})
+        journal.close()
+
+        journal = RetryJournal(self.path)
+        self.assertEqual(len(journal), 3)
+        replayed = []
+        while journal.peek() is not None:
+            replayed.append(journal.peek()['n'])
+            journal.commit()
+        self.assertEqual(replayed, [0, 1, 2])
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_keys(self):
+        journal = RetryJournal(self.path, key=lambda message: message['code'])
+        journal.append({'code': 'a'})
+        journal.append({'code': 'b'})
+        journal.append({'code': 'a'})
+        journal.close()
+
+        journal = RetryJournal(self.path, key=lambda message: message['code'])
+        self.assertIn('a', journal)
+        journal.peek()
+        journal.commit()
+        journal.peek()
+        journal.commit()
+        self.assertNotIn('b', journal)
+        self.assertIn('a', journal)
+        journal.peek()
+        journal.commit()
+        self.assertNotIn('a', journal)
+
+    def test_torn_record(self):
+        journal = RetryJournal(self.path)
+        journal.append({'n': 1})
+        journal.close()
+        with open(self.path, 'ab') as f:
+            f.write(RetryJournal.HEADER.pack(100) + b'{"n"')
+
+        journal = RetryJournal(self.path)
+        self.assertEqual(len(journal), 1)
+        self.assertEqual(journal.peek(), {'n': 1})
+
+    def test_in_memory(self):
+        journal = RetryJournal()
+        journal.append({'n': 1})
+        self.assertEqual(journal.peek(), {'n': 1})
+        journal.commit()
+        self.assertIsNone(journal.peek())
+
+    def test_size_limit(self):
+        # every record takes 12 bytes
+        journal = RetryJournal(size_limit=30)
+        self.assertTrue(journal.append({'n': 1}))
+        self.assertTrue(journal.append({'n': 2}))
+        self.assertFalse(journal.append({'n': 3}))
+        self.assertEqual(len(journal), 2)
+        journal.peek()
+        journal.commit()
+        self.assertTrue(journal.append({'n': 3}))
+
+    def test_compact(self):
+        journal = RetryJournal(self.path, compact_size=26)
+        journal.append({'n': 0})
+        replayed = []
+        # records keep arriving during the replay, the journal is never empty
+        for i in range(1, 20):
+            journal.append({'n': i})
+            replayed.append(journal.peek()['n'])
+            journal.commit()
+            # replayed records and the waiting ones, up to 13 bytes each
+            self.assertLessEqual(os.path.getsize(self.path), 26 + 13 * 2)
+        self.assertEqual(replayed, list(range(19)))
+        journal.close()
+
+        # after restart the records since the last compaction are replayed again
+        journal = RetryJournal(self.path)
+        self.assertEqual(journal.peek(), {'n': 18})
+        journal.commit()
+        self.assertEqual(journal.peek(), {'n': 19})
+
+    def test_batched_sync(self):
+        journal = RetryJournal(self.path, sync_interval=60)
+        with patch('notifications.journal.os.fsync') as fsync:
+            for i in range(3):
+                journal.append({'n': i})
+            self.assertEqual(fsync.call_count, 0)
+            journal.sync()
+            journal.sync()
+            self.assertEqual(fsync.call_count, 1)
+        journal.close()
+
+
+class ReplayTestCase(AsyncTestCase):
+    def setUp(self):
+        super(ReplayTestCase, self).setUp()
+        self.app = NotificationWebApp(DB_SETTINGS, '/notifications',
+                                      options={'RETRY_INTERVAL': 0.01, 'RETRY_INTERVAL_MAX': 0.02})
+        self.applied = []
+        # exam code -> number of failures of its messages
+        self.failures = {}
+        self.app._apply_edx_message = self._apply
+
+    @gen.coroutine
+    def _apply(self, message, received=None):
+        yield gen.moment
+        if self.failures.get(message['code']):
+            self.failures[message['code']] -= 1
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+        self.applied.append((message['code'], message['n']))
+
+    @gen_test
+    def test_replay_after_failure(self):
+        self.failures['a'] = 3
+        yield self.app._process_edx_message({'code': 'a', 'n': 1})
+        self.assertEqual(len(self.app.retry_journal), 1)
+        self.assertIn('a', self.app.retry_journal)
+        # the next message of the exam waits for the journal to keep the order
+        yield self.app._process_edx_message({'code': 'a', 'n': 2})
+        # messages of other exams don't wait
+        yield self.app._process_edx_message({'code': 'b', 'n': 3})
+        self.assertEqual(self.applied, [('b', 3)])
+        while self.app._replaying is not None:
+            yield gen.sleep(0.01)
+        self.assertEqual(self.applied, [('b', 3), ('a', 1), ('a', 2)])
+        self.assertEqual(len(self.app.retry_journal), 0)
+        self.assertNotIn('a', self.app.retry_journal)
+        self.assertEqual(self.app.metrics.get('journaled_messages_total'), 2)
+
+    @gen_test
+    def test_not_retried_errors(self):
+        @gen.coroutine
+        def fail(message, received=None):
+            raise ValueError('bad message')
+        self.app._apply_edx_message = fail
+        with self.assertRaises(ValueError):
+            yield self.app._process_edx_message({'code': 'a', 'n': 1})
+        self.assertEqual(len(self.app.retry_journal), 0)
+
+
+class FakeCursor(object):
+    """
+    Tables of the daemon's queries
+    """
+    def __init__(self, user_sessions):
+        self.user_sessions = user_sessions
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @gen.coroutine
+    def execute(self, sql, params=()):
+        if sql.startswith('SELECT id FROM proctoring_course'):
+            self.row = {'id': 1}
+        elif sql.startswith('SELECT id, attempt_status'):
+            self.row = {'id': 5, 'attempt_status': 'started', 'attempt_status_updated': None}
+        elif sql.startswith('SELECT id FROM proctoring_usersession'):
+            self.row = {'id': 1} if tuple(params) in [(s[0], s[6]) for s in self.user_sessions] else None
+        elif sql.startswith('INSERT INTO proctoring_usersession'):
+            self.user_sessions.append(params)
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConnection(object):
+    def __init__(self, user_sessions):
+        self.user_sessions = user_sessions
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.user_sessions)
+
+    @gen.coroutine
+    def commit(self):
+        pass
+
+    @gen.coroutine
+    def rollback(self):
+        pass
+
+
+class ReplayUserSessionTestCase(AsyncTestCase):
+    def setUp(self):
+        super(ReplayUserSessionTestCase, self).setUp()
+        self.app = NotificationWebApp(DB_SETTINGS, '/notifications')
+        self.user_sessions = []
+        self.app._notify_participants = lambda message, received=None: None
+
+        @gen.coroutine
+        def db_connection():
+            return FakeConnection(self.user_sessions)
+        self.app._db_connection = db_connection
+
+    @gen_test
+    def test_replayed_twice(self):
+        message = {'course_id': 'org/course/run', 'course_event_id': 'event', 'code': 'code1',
+                   'action': 'new_user_session', 'created': 1,
+                   'data': {'session_id': 'session1', 'browser': 'Firefox'}}
+        yield self.app._apply_edx_message(dict(message))
+        # after the restart of the daemon the journal is replayed from the beginning
+        yield self.app._apply_edx_message(dict(message))
+        self.assertEqual(len(self.user_sessions), 1)
+        yield self.app._apply_edx_message(dict(message, data={'session_id': 'session2'}))
+        self.assertEqual(len(self.user_sessions), 2)
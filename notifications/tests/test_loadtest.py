@@ -0,0 +1,18 @@
+"""
+Tests for the load test of the notifications daemon
+"""
+from unittest import TestCase
+
+from notifications.loadtest import run_load_test
+
+
+class LoadTestTestCase(TestCase):
+    def test_step(self):
+        report = run_load_test([6], rooms=3, rate=50, duration=0.2, port=0, exams_per_room=2)
+        step, = report['steps']
+        self.assertEqual(step['clients'], 6)
+        self.assertEqual(step['messages'], 10)
+        # every message is delivered to both clients of its room
+        self.assertEqual(step['expected_deliveries'], 20)
+        self.assertEqual(step['deliveries'], 20)
+        self.assertGreater(step['rss_mb'], 0)
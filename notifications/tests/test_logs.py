@@ -0,0 +1,105 @@
+"""
+Tests for the logging classes
+"""
+import copy
+import io
+import logging
+import logging.config
+import os
+import sys
+from unittest import TestCase
+
+from django.conf import settings
+
+from notifications.logs import BackgroundHandler, KeyValueFormatter, SamplingFilter
+
+
+def make_record(name='notifications.web', level=logging.INFO, msg='Message', args=(), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class KeyValueFormatterTestCase(TestCase):
+    def test_format(self):
+        formatter = KeyValueFormatter(max_length=10)
+        text = formatter.format(make_record(msg='Exam %s', args=('x',), room=1, body=b'{"code": "abcdefghij"}'))
+        self.assertIn(' level=INFO logger=notifications.web ', text)
+        self.assertIn(' msg="Exam x" ', text)
+        self.assertTrue(text.endswith(' body="{\\"code\\": \\"..." room=1'), text)
+
+
+class SamplingFilterTestCase(TestCase):
+    def test_filter(self):
+        sampling = SamplingFilter('notifications', rate=0.25, level='INFO')
+        passed = [sampling.filter(make_record(level=logging.DEBUG)) for _ in range(8)]
+        self.assertEqual(passed.count(True), 2)
+        self.assertTrue(sampling.filter(make_record(level=logging.INFO)))
+        self.assertTrue(sampling.filter(make_record(name='django', level=logging.DEBUG)))
+        self.assertFalse(SamplingFilter(rate=0, level='INFO').filter(make_record(level=logging.DEBUG)))
+
+
+class BackgroundHandlerTestCase(TestCase):
+    def test_emit(self):
+        stream = io.StringIO()
+        handler = BackgroundHandler('logging.StreamHandler', stream=stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        args = {'status': 'started'}
+        handler.handle(make_record(msg='Status %s', args=(args,)))
+        # the message is formatted before the arguments are changed
+        args['status'] = 'submitted'
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            record = make_record(level=logging.ERROR, msg='Failed')
+            record.exc_info = sys.exc_info()
+            handler.handle(record)
+        handler.close()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "INFO Status {'status': 'started'}")
+        self.assertEqual(lines[1], 'ERROR Failed')
+        self.assertEqual(lines[-1], 'ValueError: broken')
+
+    def test_full_queue(self):
+        handler = BackgroundHandler('logging.NullHandler', queue_size=1)
+        # the background thread isn't started yet, the queue is filled at once
+        handler._pid = os.getpid()
+        handler.handle(make_record())
+        handler.handle(make_record())
+        self.assertEqual(handler.dropped, 1)
+        handler._pid = None
+        handler.close()
+
+
+class LoggingSettingsTestCase(TestCase):
+    def setUp(self):
+        self.loggers = {}
+        for name in settings.LOGGING['loggers']:
+            logger = logging.getLogger(name)
+            self.loggers[name] = (logger.level, logger.handlers[:], logger.filters[:], logger.propagate)
+        self.addCleanup(self._restore)
+
+    def _restore(self):
+        for name, (level, handlers, filters, propagate) in self.loggers.items():
+            logger = logging.getLogger(name)
+            for handler in logger.handlers:
+                if handler not in handlers:
+                    handler.close()
+            logger.setLevel(level)
+            logger.handlers[:] = handlers
+            logger.filters[:] = filters
+            logger.propagate = propagate
+
+    def test_sample_debug(self):
+        config = copy.deepcopy(settings.LOGGING)
+        stream = io.StringIO()
+        config['handlers']['background'].update({'handler_class': 'logging.StreamHandler', 'stream': stream})
+        logging.config.dictConfig(config)
+        logger = logging.getLogger('notifications.amqp')
+        for i in range(20):
+            logger.debug('Received message %s', i)
+        logger.info('Connected')
+        logging.getLogger('notifications').handlers[0].close()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len([line for line in lines if 'Received message' in line]), 2)
+        self.assertIn('msg=Connected', lines[-1])
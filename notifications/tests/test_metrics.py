@@ -0,0 +1,63 @@
+"""
+Tests for the notification daemon metrics
+"""
+import time
+from unittest import TestCase
+
+from tornado.testing import AsyncHTTPTestCase
+
+from notifications.metrics import Metrics
+from notifications.webapp import NotificationWebApp
+
+from .test_cache import DB_SETTINGS
+from .test_rooms import SlowConnection
+
+
+class MetricsTestCase(TestCase):
+    def test_render(self):
+        metrics = Metrics()
+        metrics.counter('received_total', 'Received messages')
+        metrics.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        metrics.inc('received_total', initiator='edx')
+        metrics.inc('received_total', 2, initiator='edx')
+        metrics.observe('latency_seconds', 0.05, stage='db')
+        metrics.observe('latency_seconds', 0.5, stage='db')
+        text = metrics.render([('rooms', 'gauge', 'Rooms', [((('room', 'a"b'),), 3)])])
+        lines = text.splitlines()
+        self.assertIn('# TYPE notifications_received_total counter', lines)
+        self.assertIn('notifications_received_total{initiator="edx"} 3', lines)
+        self.assertIn('notifications_latency_seconds_bucket{stage="db",le="0.1"} 1', lines)
+        self.assertIn('notifications_latency_seconds_bucket{stage="db",le="1"} 2', lines)
+        self.assertIn('notifications_latency_seconds_bucket{stage="db",le="+Inf"} 2', lines)
+        self.assertIn('notifications_latency_seconds_count{stage="db"} 2', lines)
+        self.assertIn('notifications_rooms{room="a\\"b"} 3', lines)
+
+
+class MetricsHandlerTestCase(AsyncHTTPTestCase):
+    def get_app(self):
+        self.app = NotificationWebApp(DB_SETTINGS, '/notifications')
+        return self.app
+
+    def tearDown(self):
+        self.app.notifications_router.participants.clear()
+        super(MetricsHandlerTestCase, self).tearDown()
+
+    def test_metrics(self):
+        router = self.app.notifications_router
+        router.broadcast = lambda clients, msg: None
+        router.participants.add(1, SlowConnection(0))
+        router.participants.add(1, SlowConnection(0))
+        self.app.notify({'initiator': 'webassistant', 'action': 'new_comment', 'course_event_id': 1,
+                         'created': time.time()})
+
+        response = self.fetch('/metrics')
+        self.assertEqual(response.code, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        lines = response.body.decode('utf-8').splitlines()
+        self.assertIn('notifications_room_connections{room="1"} 2', lines)
+        self.assertIn('notifications_messages_received_total{initiator="webassistant"} 1', lines)
+        self.assertIn('notifications_stage_latency_seconds_count{stage="receive"} 1', lines)
+        self.assertIn('notifications_stage_latency_seconds_count{stage="broadcast"} 1', lines)
+        self.assertIn('notifications_broadcast_deliveries_total 2', lines)
+        self.assertIn('notifications_db_pool_connections{state="used"} 0', lines)
+        self.assertIn('notifications_cache_hits_total{cache="exams"} 0', lines)
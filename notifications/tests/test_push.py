@@ -0,0 +1,123 @@
+"""
+Tests for the direct push of notifications to the daemon
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from tornado.httpserver import HTTPServer
+from tornado.httputil import HTTPServerRequest
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_unix_socket
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from notifications.client import PushPublisher
+from notifications.webapp import NotificationWebApp, PushHandler
+
+from .test_cache import DB_SETTINGS
+
+
+class Notifier(object):
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, message):
+        self.messages.append(message)
+
+
+class PushHandlerTestCase(AsyncHTTPTestCase):
+    def get_app(self):
+        app = NotificationWebApp(DB_SETTINGS, '/notifications', options={'PUSH_TOKEN': 'secret'})
+        self.notifier = Notifier()
+        app.notify = self.notifier.notify
+        return app
+
+    def _push(self, body, token='secret'):
+        return self.fetch('/push', method='POST', body=body, headers={'X-Notifications-Token': token})
+
+    def test_push(self):
+        messages = [{'initiator': 'webassistant', 'course_event_id': 1, 'code': 'a'},
+                    {'initiator': 'webassistant', 'course_event_id': 1, 'code': 'b'}]
+        response = self._push(json.dumps(messages))
+        self.assertEqual(response.code, 204)
+        self.assertEqual(self.notifier.messages, messages)
+
+    def test_wrong_token(self):
+        response = self._push(json.dumps([{'initiator': 'webassistant'}]), token='wrong')
+        self.assertEqual(response.code, 403)
+        response = self._push(json.dumps([{'initiator': 'webassistant'}]), token='s\u00e9cret')
+        self.assertEqual(response.code, 403)
+        self.assertEqual(self.notifier.messages, [])
+
+    def test_bad_body(self):
+        self.assertEqual(self._push('not json').code, 400)
+        self.assertEqual(self._push('1').code, 400)
+
+    def test_disabled_without_token(self):
+        app = NotificationWebApp(DB_SETTINGS, '/notifications')
+        delegate = app.find_handler(HTTPServerRequest(method='POST', uri='/push'))
+        self.assertIsNot(delegate.handler_class, PushHandler)
+
+
+class PushPublisherTestCase(TestCase):
+    def setUp(self):
+        self.notifier = Notifier()
+        self.received = threading.Event()
+        self.expected = 0
+        self.tmp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp_dir, 'notifications.sock')
+        started = threading.Event()
+
+        def notify(message):
+            self.notifier.notify(message)
+            if len(self.notifier.messages) >= self.expected:
+                self.received.set()
+
+        def run():
+            self.io_loop = IOLoop()
+            self.io_loop.make_current()
+            server = HTTPServer(Application([(r'/push', PushHandler, {'notifier': self})]))
+            server.add_socket(bind_unix_socket(self.socket_path))
+            self.io_loop.add_callback(started.set)
+            self.io_loop.start()
+            server.stop()
+            self.io_loop.close(all_fds=True)
+
+        self.notify = notify
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+        started.wait(5)
+
+    def tearDown(self):
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.thread.join(5)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_publish(self):
+        self.expected = 20
+        publisher = PushPublisher('unix://' + self.socket_path)
+        for i in range(20):
+            publisher.publish({'initiator': 'webassistant', 'n': i})
+        self.assertTrue(self.received.wait(5))
+        self.assertEqual([msg['n'] for msg in self.notifier.messages], list(range(20)))
+        self.assertTrue(publisher.flush())
+        self.assertEqual(publisher.stats()['published'], 20)
+
+    def test_unserializable_message(self):
+        self.expected = 2
+        publisher = PushPublisher('unix://' + self.socket_path)
+        with self.assertLogs('notifications.client', 'ERROR'):
+            for i in range(3):
+                publisher.publish({'initiator': 'webassistant', 'n': i, 'data': object() if i == 1 else None})
+            self.assertTrue(publisher.flush())
+        self.assertTrue(self.received.wait(5))
+        self.assertEqual([msg['n'] for msg in self.notifier.messages], [0, 2])
+        self.assertEqual(publisher.stats()['failed'], 1)
+
+    def test_unsupported_url(self):
+        with self.assertRaises(Exception):
+            PushPublisher('ftp://localhost/push')
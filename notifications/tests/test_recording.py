@@ -0,0 +1,43 @@
+"""
+Tests for the recording and replay of the AMQP traffic
+"""
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from notifications.recording import TrafficRecorder, read_recording
+from notifications.replay import ReplayWebApp, load_messages
+
+from .test_cache import DB_SETTINGS
+
+
+class RecordingTestCase(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read(self):
+        recorder = TrafficRecorder(self.path)
+        recorder.record(b'{"code": "a"}', timestamp=10.5)
+        recorder.record('not json', timestamp=11)
+        recorder.record(json.dumps([1, 2]), timestamp=12)
+        recorder.record(b'{"code": "b"}', timestamp=13)
+        recorder.close()
+        with open(self.path, 'ab') as recording:
+            recording.write(TrafficRecorder.HEADER.pack(14, 100) + b'{"torn')
+
+        self.assertEqual([timestamp for timestamp, _ in read_recording(self.path)], [10.5, 11, 12, 13])
+        self.assertEqual(load_messages(self.path), [(10.5, {'code': 'a'}), (13, {'code': 'b'})])
+
+    def test_replay_completion(self):
+        app = ReplayWebApp(DB_SETTINGS, '/notifications', use_db=False)
+        app.expected = 2
+        app.notifications_router.notify_participants = lambda room, msg: None
+        app.notify({'initiator': 'webassistant', 'course_event_id': 1, 'replay_sent': 1})
+        app.notify({'action': 'unknown', 'replay_sent': 1})
+        self.assertEqual(len(app.latencies), 2)
+        self.assertTrue(app.finished.is_set())
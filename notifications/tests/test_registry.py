@@ -0,0 +1,85 @@
+"""
+Tests for the registry of notification connections
+"""
+import gc
+import logging
+import tracemalloc
+from unittest import TestCase
+
+from notifications.rooms import RoomRegistry
+from notifications.webapp import NotificationsRouter, NotificationsConnection
+
+
+class FakeRequest(object):
+    path = '/notifications'
+
+    def __init__(self, course_event_id):
+        self.arguments = {'course_event_id': str(course_event_id).encode('utf-8')}
+
+    def get_argument(self, name):
+        return self.arguments.get(name)
+
+
+class FakeSession(object):
+    is_closed = False
+    handler = None
+
+    def __init__(self, server):
+        self.server = server
+
+    def send_message(self, message, binary=False):
+        pass
+
+
+class RoomRegistryTestCase(TestCase):
+    def test_counts(self):
+        registry = RoomRegistry()
+        registry.add(1, 'a')
+        registry.add(1, 'a')
+        registry.add(1, 'b')
+        registry.add(2, 'c')
+        self.assertEqual(registry.rooms_count, 2)
+        self.assertEqual(registry.connections_count, 3)
+        self.assertEqual(registry.rooms_sizes(), {1: 2, 2: 1})
+
+        registry.remove(2, 'c')
+        registry.remove(2, 'c')
+        self.assertNotIn(2, registry)
+        self.assertEqual(registry.rooms_count, 1)
+        self.assertEqual(registry.connections_count, 2)
+        self.assertEqual(registry.get(2), ())
+
+
+class ConnectionsSoakTestCase(TestCase):
+    def setUp(self):
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications')
+        self.session = FakeSession(self.router)
+        self.logger = logging.getLogger('notifications.web')
+        self.log_level = self.logger.level
+        self.logger.setLevel(logging.WARNING)
+
+    def tearDown(self):
+        self.logger.setLevel(self.log_level)
+        NotificationsConnection.participants.clear()
+
+    def _open_and_close(self, start, number):
+        for course_event_id in range(start, start + number):
+            conn = NotificationsConnection(self.session)
+            conn.on_open(FakeRequest(course_event_id))
+            conn.on_close()
+
+    def test_memory_is_flat(self):
+        registry = self.router.participants
+        self._open_and_close(0, 1000)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            self._open_and_close(1000, 100000)
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(registry.rooms_count, 0)
+        self.assertEqual(registry.connections_count, 0)
+        self.assertLess(after - before, 256 * 1024)
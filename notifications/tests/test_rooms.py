@@ -0,0 +1,300 @@
+"""
+Tests for notification rooms
+"""
+import json
+from datetime import datetime
+from unittest import TestCase
+
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from notifications.rooms import RoomHistory, RoomSnapshot
+from notifications.webapp import NotificationsRouter, NotificationsConnection
+
+
+class FakeConnection(object):
+    is_closed = False
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+class RoomHistoryTestCase(TestCase):
+    def test_since(self):
+        history = RoomHistory(3)
+        for i in range(5):
+            history.append({'code': i})
+        self.assertEqual(history.seq, 5)
+        self.assertEqual(len(history), 3)
+        self.assertEqual([msg['code'] for msg in history.since(2)], [2, 3, 4])
+        self.assertEqual([msg['code'] for msg in history.since(4)], [4])
+        self.assertEqual(history.since(5), [])
+        # overrun
+        self.assertIsNone(history.since(1))
+        # unknown position
+        self.assertIsNone(history.since(6))
+
+
+class ReplayTestCase(TestCase):
+    def setUp(self):
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications', history_size=2)
+
+    def test_hello(self):
+        conn = FakeConnection()
+        self.router.notify_participants(1, {'code': 'a'})
+        self.router.greet(conn, 1)
+        self.assertEqual(conn.messages, [{'action': 'hello', 'room': 1, 'epoch': self.router.epoch, 'seq': 1}])
+
+    def test_replay(self):
+        conn = FakeConnection()
+        for code in ('a', 'b', 'c'):
+            self.router.notify_participants(1, {'code': code})
+        self.router.greet(conn, 1, 1, self.router.epoch)
+        self.assertEqual([msg['code'] for msg in conn.messages], ['b', 'c'])
+
+    def test_resync(self):
+        conn = FakeConnection()
+        for code in ('a', 'b', 'c'):
+            self.router.notify_participants(1, {'code': code})
+        self.router.greet(conn, 1, 0, self.router.epoch)
+        self.assertEqual(conn.messages[0]['action'], 'resync')
+        # daemon was restarted
+        conn = FakeConnection()
+        self.router.greet(conn, 1, 3, 'old_epoch')
+        self.assertEqual(conn.messages[0]['action'], 'resync')
+
+
+SNAPSHOT_ROWS = [
+    {'exam_code': 'a', 'attempt_status': 'started', 'attempt_status_updated': datetime(2018, 1, 1),
+     'actual_end_date': None, 'comments': 1},
+    {'exam_code': 'b', 'attempt_status': 'created', 'attempt_status_updated': None,
+     'actual_end_date': None, 'comments': 0},
+]
+
+
+class RoomSnapshotTestCase(TestCase):
+    def test_apply(self):
+        snapshot = RoomSnapshot()
+        # messages before loading are postponed
+        snapshot.apply({'action': 'new_comment', 'exam_code': 'a'})
+        snapshot.load(SNAPSHOT_ROWS)
+        self.assertEqual(snapshot.exams['a'].comments, 2)
+
+        updated = datetime(2018, 1, 1, 1).timestamp()
+        snapshot.apply({'action': 'change_status', 'code': 'a', 'status': 'submitted', 'created': updated,
+                        'actual_end_date': '2018-01-01T01:00:00Z'})
+        # outdated status change is ignored
+        snapshot.apply({'action': 'change_status', 'code': 'a', 'status': 'started', 'created': updated - 1})
+        snapshot.apply({'action': 'new_attempt', 'code': 'c', 'status': 'created', 'created': updated})
+        data = snapshot.to_dict()
+        self.assertEqual(data['a'], {'status': 'submitted', 'updated': updated,
+                                     'end_date': '2018-01-01T01:00:00Z', 'comments': 2})
+        self.assertEqual(data['c']['status'], 'created')
+        self.assertEqual(len(snapshot), 3)
+
+
+class SnapshotGreetTestCase(AsyncTestCase):
+    def setUp(self):
+        super(SnapshotGreetTestCase, self).setUp()
+        self.loads = 0
+
+        @gen.coroutine
+        def loader(course_event_id):
+            self.loads += 1
+            yield gen.moment
+            raise gen.Return(SNAPSHOT_ROWS)
+
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications', snapshot_loader=loader)
+
+    @gen_test
+    def test_hello_with_snapshot(self):
+        first, second = FakeConnection(), FakeConnection()
+        yield [self.router.greet(first, 1), self.router.greet(second, 1)]
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'b', 'status': 'started'})
+        third = FakeConnection()
+        yield self.router.greet(third, 1)
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(first.messages[0]['action'], 'hello')
+        self.assertEqual(sorted(first.messages[0]['exams'].keys()), ['a', 'b'])
+        self.assertEqual(second.messages, first.messages)
+        self.assertEqual(third.messages[0]['seq'], 1)
+        self.assertEqual(third.messages[0]['exams']['b']['status'], 'started')
+
+
+class CoalescingTestCase(AsyncTestCase):
+    def setUp(self):
+        super(CoalescingTestCase, self).setUp()
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications',
+                                          broadcast_window=0.01, io_loop=self.io_loop)
+        self.frames = []
+        self.router.broadcast = lambda clients, msg: self.frames.append(msg)
+        NotificationsConnection.participants.add(1, FakeConnection())
+
+    def tearDown(self):
+        NotificationsConnection.participants.clear()
+        super(CoalescingTestCase, self).tearDown()
+
+    @gen_test
+    def test_batch(self):
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'a', 'status': 'started'})
+        self.router.notify_participants(1, {'action': 'new_comment', 'exam_code': 'b'})
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'a', 'status': 'submitted'})
+        yield gen.sleep(0.05)
+        self.assertEqual(len(self.frames), 1)
+        frame = self.frames[0]
+        self.assertEqual(frame['action'], 'batch')
+        self.assertEqual(frame['seq'], 3)
+        self.assertEqual([msg.get('status') for msg in frame['messages']], [None, 'submitted'])
+
+        stats = self.router.broadcast_stats()
+        self.assertEqual(stats['messages'], 3)
+        self.assertEqual(stats['frames_saved'], 2)
+        self.assertEqual(stats['superseded'], 1)
+
+    @gen_test
+    def test_hello_before_flush(self):
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'a', 'status': 'started'})
+        conn = FakeConnection()
+        yield self.router.greet(conn, 1)
+        reconnected = FakeConnection()
+        yield self.router.greet(reconnected, 1, 0, self.router.epoch)
+        # the message waiting for the batch isn't counted nor replayed, the client gets it with the batch
+        self.assertEqual(conn.messages[0]['seq'], 0)
+        self.assertEqual(reconnected.messages, [])
+        yield gen.sleep(0.05)
+        self.assertEqual(self.frames[0]['seq'], 1)
+        reconnected = FakeConnection()
+        yield self.router.greet(reconnected, 1, 0, self.router.epoch)
+        self.assertEqual([msg['code'] for msg in reconnected.messages], ['a'])
+
+
+class SlowConnection(FakeConnection):
+    connection_id = 'slow'
+    course_event_id = 1
+
+    def __init__(self, pending):
+        super(SlowConnection, self).__init__()
+        self.pending = pending
+        self.backlog = None
+        self.closed_with = None
+        self.session = self
+        self.rooms = {1}
+
+    @property
+    def participants(self):
+        return NotificationsConnection.participants
+
+    def pending_bytes(self):
+        return self.pending
+
+    def close(self, code, reason):
+        # the session of sockjs-tornado calls on_close at once
+        self.closed_with = (code, reason)
+        NotificationsConnection.on_close(self)
+
+
+class BackpressureTestCase(AsyncTestCase):
+    def setUp(self):
+        super(BackpressureTestCase, self).setUp()
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications', io_loop=self.io_loop,
+                                          send_queue_limit=100, send_backlog_limit=2)
+        self.received = []
+        self.router.broadcast = lambda clients, msg: self.received.extend((conn, msg) for conn in clients)
+        self.fast = SlowConnection(0)
+        self.slow = SlowConnection(1000)
+        NotificationsConnection.participants.add(1, self.fast)
+        NotificationsConnection.participants.add(1, self.slow)
+
+    def tearDown(self):
+        NotificationsConnection.participants.clear()
+        super(BackpressureTestCase, self).tearDown()
+
+    @gen_test
+    def test_coalesce_and_drain(self):
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'a', 'status': 'started'})
+        self.router.notify_participants(1, {'action': 'change_status', 'code': 'a', 'status': 'submitted'})
+        self.assertEqual(len(self.received), 2)
+        self.assertTrue(all(conn is self.fast for conn, msg in self.received))
+        self.assertEqual(list(self.slow.backlog.keys()), [(1, 'a')])
+        self.assertEqual(self.router.queue_stats()['throttled_clients'], 1)
+
+        self.slow.pending = 0
+        yield gen.sleep(0.6)
+        self.assertIsNone(self.slow.backlog)
+        self.assertEqual(self.slow.messages[0]['status'], 'submitted')
+
+    def test_disconnect(self):
+        others = [SlowConnection(0) for _ in range(10)]
+        for conn in others:
+            NotificationsConnection.participants.add(1, conn)
+        for code in ('a', 'b', 'c'):
+            self.router.notify_participants(1, {'action': 'change_status', 'code': code, 'status': 'started'})
+        self.assertEqual(self.slow.closed_with, (3001, 'resync'))
+        self.assertIsNone(self.slow.backlog)
+        self.assertEqual(self.router.broadcast_stats()['disconnected'], 1)
+        self.assertNotIn(self.slow, NotificationsConnection.participants.get(1))
+        # the rest of the room got all the messages
+        for conn in [self.fast] + others:
+            self.assertEqual(len([msg for client, msg in self.received if client is conn]), 3)
+
+
+class FakeSession(object):
+    is_closed = False
+
+    def __init__(self, server):
+        self.server = server
+
+
+class MultiRoomTestCase(TestCase):
+    def setUp(self):
+        self.router = NotificationsRouter(NotificationsConnection, '/notifications', max_subscriptions=2)
+        self.router.broadcast = lambda clients, msg: [conn.send(msg) for conn in clients]
+        self.conn = NotificationsConnection(FakeSession(self.router))
+        self.sent = []
+        self.conn.send = self.sent.append
+
+    def tearDown(self):
+        NotificationsConnection.participants.clear()
+
+    def command(self, **kwargs):
+        self.conn.on_message(json.dumps(kwargs))
+
+    def test_subscribe(self):
+        self.command(action='subscribe', room=1)
+        self.command(action='subscribe', room='2')
+        self.assertEqual([(msg['action'], msg['room']) for msg in self.sent], [('hello', 1), ('hello', 2)])
+        self.router.notify_participants(2, {'code': 'a'})
+        self.assertEqual(self.sent[-1], {'code': 'a', 'room': 2, 'seq': 1})
+        self.assertEqual(NotificationsConnection.participants.connections_count, 2)
+
+    def test_unsubscribe(self):
+        self.command(action='subscribe', room=1)
+        self.command(action='unsubscribe', room=1)
+        self.router.notify_participants(1, {'code': 'a'})
+        self.assertEqual(len(self.sent), 1)
+        self.assertNotIn(1, NotificationsConnection.participants)
+
+    def test_close(self):
+        self.command(action='subscribe', room=1)
+        self.command(action='subscribe', room=2)
+        self.conn.on_close()
+        self.assertEqual(NotificationsConnection.participants.rooms_count, 0)
+
+    def test_errors(self):
+        self.conn.on_message('not json')
+        self.command(action='subscribe', room='x')
+        self.command(action='dance', room=1)
+        for room in (1, 2, 3):
+            self.command(action='subscribe', room=room)
+        errors = [msg['message'] for msg in self.sent if msg['action'] == 'error']
+        self.assertEqual(errors, ['Invalid command', 'Invalid room', 'Unknown action', 'Too many rooms'])
+
+    def test_foreign_room(self):
+        self.router.owns_room = lambda room: room == 1
+        self.command(action='subscribe', room=2)
+        self.assertEqual(self.sent[0]['action'], 'error')
+        self.assertEqual(self.conn.rooms, set())
@@ -0,0 +1,77 @@
+"""
+Tests for sharding of rooms between notification daemons
+"""
+from collections import Counter
+from unittest import TestCase, mock
+
+from notifications import client
+from notifications.client import ProctorNotificator
+from notifications.sharding import HashRing, ring_hash, nginx_locations
+from notifications.webapp import NotificationWebApp
+
+from .test_cache import DB_SETTINGS
+
+SHARDS = {'1': '127.0.0.1:9090', '2': '127.0.0.1:9091', '3': '127.0.0.1:9092'}
+
+
+class HashRingTestCase(TestCase):
+    def test_stable_hash(self):
+        # the same values are produced by websocket.js
+        self.assertEqual(ring_hash('1'), 1428125071)
+        self.assertEqual(ring_hash(''), 2872998923)
+        ring = HashRing(SHARDS)
+        self.assertEqual([ring.node(key) for key in (1, 2, 3, 42, 1000)], ['2', '2', '1', '1', '1'])
+
+    def test_distribution(self):
+        ring = HashRing(SHARDS)
+        counts = Counter(ring.node(key) for key in range(1, 30001))
+        for shard in SHARDS:
+            self.assertGreater(counts[shard], 8000)
+
+    def test_adding_shard_moves_part_of_rooms(self):
+        before = HashRing(SHARDS)
+        after = HashRing(list(SHARDS) + ['4'])
+        moved = [key for key in range(1, 10001) if before.node(key) != after.node(key)]
+        self.assertTrue(all(after.node(key) == '4' for key in moved))
+        self.assertLess(len(moved), 3500)
+
+    def test_nginx_locations(self):
+        config = nginx_locations('/notifications/', SHARDS)
+        self.assertIn('location /notifications/2 {', config)
+        self.assertIn('proxy_pass http://127.0.0.1:9091;', config)
+
+
+class ShardedWebAppTestCase(TestCase):
+    def setUp(self):
+        self.app = NotificationWebApp(DB_SETTINGS, '/notifications', options={'SHARDS': SHARDS, 'DAEMON_ID': '1'})
+        self.app._notify_participants = mock.Mock()
+
+    def test_router_url(self):
+        self.assertTrue(all(url[0].startswith('/notifications/1') for url in self.app.notifications_router.urls))
+
+    def test_foreign_rooms_are_skipped(self):
+        self.app.notify({'initiator': 'webassistant', 'course_event_id': 3})
+        self.app.notify({'initiator': 'webassistant', 'course_event_id': 1})
+        self.assertEqual(self.app._notify_participants.call_count, 1)
+        self.assertEqual(self.app.metrics.get('foreign_messages_total'), 1)
+
+
+class ShardedPublishingTestCase(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(client.NOTIFICATIONS, {'SHARDS': SHARDS})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ProctorNotificator._ring = None
+        self.addCleanup(setattr, ProctorNotificator, '_ring', None)
+
+    def test_routing_keys(self):
+        self.assertEqual(ProctorNotificator._shard_routing_keys({'course_event_id': 1}), ['shard.2'])
+        self.assertEqual(ProctorNotificator._shard_routing_keys({'action': 'cache_bust'}),
+                         ['shard.1', 'shard.2', 'shard.3'])
+
+    def test_push_to_owner(self):
+        publishers = [('1', mock.Mock()), ('2', mock.Mock()), ('3', mock.Mock())]
+        with mock.patch.object(ProctorNotificator, '_publishers', publishers):
+            ProctorNotificator.notify({'course_event_id': 1})
+            ProctorNotificator.notify({'action': 'cache_bust'})
+        self.assertEqual([publisher.publish.call_count for _, publisher in publishers], [1, 2, 1])
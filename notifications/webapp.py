@@ -1,32 +1,107 @@
 # encoding: utf-8
 
+import hmac
+import json
 import logging
 import time
 import tornado.web
 import tormysql
 import pymysql
-import uuid
 
 from collections import OrderedDict
+from itertools import count
 from datetime import datetime
 from tornado import gen
+from tornado.ioloop import IOLoop, PeriodicCallback
 from raven.contrib.tornado import AsyncSentryClient
 from sockjs.tornado import SockJSRouter, SockJSConnection
+from tormysql.pool import WaitConnectionTimeoutError
+
+from .cache import LRUCache
+from .commands import COMMANDS, CommandForwarder
+from .dispatcher import KeyedDispatcher
+from .journal import RetryJournal
+from .metrics import Metrics, MetricsHandler
+from .rooms import RoomHistory, RoomSnapshot, MessageBatch, RoomRegistry
+from .sharding import HashRing, shard_url
 
 
 logger = logging.getLogger('notifications.web')
 
+# DB errors after which the message is saved to the retry journal
+RETRY_ERRORS = (WaitConnectionTimeoutError, pymysql.err.OperationalError, pymysql.err.InterfaceError, OSError)
+
 
 class NotificationWebApp(tornado.web.Application):
 
-    def __init__(self, db_settings, url, raven_dsn=None):
+    def __init__(self, db_settings, url, raven_dsn=None, options=None):
+        options = options or {}
         self.broker_connected = False
         if raven_dsn:
             self.sentry_client = AsyncSentryClient(dsn=raven_dsn)
         self.db_pool = self._connect_to_db(db_settings)
-        self.notifications_router = NotificationsRouter(NotificationsConnection, url)
-        self.courses = {}
-        super(NotificationWebApp, self).__init__(self.notifications_router.urls)
+        # in the sharded mode the daemon serves only rooms which are assigned to it
+        self.daemon_id = str(options.get('DAEMON_ID', ''))
+        self.shard_ring = HashRing(options['SHARDS']) if options.get('SHARDS') else None
+        if self.shard_ring:
+            url = shard_url(url, self.daemon_id)
+        # proctor commands sent over the socket are forwarded to the web assistant in batches
+        self.command_forwarder = None
+        if options.get('COMMANDS_URL') and options.get('COMMAND_SECRET'):
+            self.command_forwarder = CommandForwarder(
+                options['COMMANDS_URL'], options['COMMAND_SECRET'],
+                window=options.get('COMMAND_BATCH_WINDOW_MS', 10) / 1000.0,
+                batch_size=options.get('COMMAND_BATCH_SIZE', 100))
+        self.notifications_router = NotificationsRouter(
+            NotificationsConnection, url,
+            history_size=options.get('ROOM_HISTORY_SIZE', 500),
+            max_rooms_history=options.get('ROOMS_HISTORY_LIMIT', 1000),
+            max_rooms_snapshot=options.get('ROOMS_SNAPSHOT_LIMIT', 1000),
+            snapshot_loader=self._load_room_snapshot,
+            owns_room=self.owns_room,
+            max_subscriptions=options.get('MAX_ROOMS_PER_CONNECTION', 50),
+            broadcast_window=options.get('BROADCAST_WINDOW_MS', 0) / 1000.0,
+            send_queue_limit=options.get('SEND_QUEUE_LIMIT', 1024 * 1024),
+            send_backlog_limit=options.get('SEND_BACKLOG_LIMIT', 1000),
+            commands=self.command_forwarder
+        )
+        # course display name -> course pk
+        self.courses = LRUCache(options.get('COURSES_CACHE_SIZE', 1000))
+        # (course pk, exam code) -> exam row (id, attempt_status, attempt_status_updated)
+        self.exams = LRUCache(options.get('EXAMS_CACHE_SIZE', 10000))
+        # edX messages which failed because of DB unavailability, replayed in order
+        self.retry_journal = RetryJournal(options.get('RETRY_JOURNAL'),
+                                          sync_interval=options.get('RETRY_JOURNAL_SYNC_INTERVAL', 1),
+                                          size_limit=options.get('RETRY_JOURNAL_SIZE_LIMIT', 64 * 1024 * 1024),
+                                          key=lambda message: message.get('code'))
+        if self.retry_journal.path:
+            # fsync of the journaled messages once per interval, not per message
+            PeriodicCallback(self.retry_journal.sync,
+                             self.retry_journal.sync_interval * 1000).start()
+        self.retry_interval = options.get('RETRY_INTERVAL', 1)
+        self.retry_interval_max = options.get('RETRY_INTERVAL_MAX', 60)
+        self._replaying = None
+        # edX messages of the same exam are processed in order, different exams concurrently
+        self.dispatcher = KeyedDispatcher(options.get('PROCESSING_CONCURRENCY', 10))
+        if len(self.retry_journal):
+            IOLoop.current().add_callback(self._start_replay)
+        self.metrics = Metrics()
+        self.metrics.counter('messages_received_total', 'Messages received by the daemon')
+        self.metrics.counter('foreign_messages_total', 'Messages of the rooms of other shards which were skipped')
+        self.metrics.counter('amqp_reconnects_total', 'Reconnections to the broker')
+        self.metrics.histogram('stage_latency_seconds',
+                               'Seconds from the message creation till receiving (stage "receive") and from'
+                               ' receiving till the end of the stage ("db_commit", "broadcast")')
+        self.metrics.histogram('db_pool_wait_seconds', 'Seconds waiting for the DB connection from the pool')
+        self.metrics.counter('journaled_messages_total', 'Messages saved to the retry journal')
+        self.metrics.counter('journal_dropped_messages_total',
+                             'Messages dropped because the retry journal is full')
+        handlers = list(self.notifications_router.urls)
+        if options.get('PUSH_TOKEN'):
+            handlers.append((r'/push', PushHandler, {'notifier': self, 'token': options['PUSH_TOKEN']}))
+        if options.get('METRICS_URL', '/metrics'):
+            handlers.append((options.get('METRICS_URL', '/metrics'), MetricsHandler))
+        super(NotificationWebApp, self).__init__(handlers)
 
     def _connect_to_db(self, settings):
         return tormysql.ConnectionPool(
@@ -45,20 +120,181 @@ class NotificationWebApp(tornado.web.Application):
     def notify(self, message):
         initiator = message.get('initiator')
         if initiator:
-            if initiator == 'edx.proctoring':
-                self._process_edx_message(message)
+            received = time.time()
+            self.metrics.inc('messages_received_total', initiator=initiator)
+            created = message.get('created')
+            if isinstance(created, (int, float)):
+                self.metrics.observe('stage_latency_seconds', max(received - created, 0), stage='receive')
+            if not self.owns_room(message.get('course_event_id')):
+                # edX messages come to all shards through the fanout exchange
+                self.metrics.inc('foreign_messages_total')
+                return
+            if message.get('action') == 'cache_bust':
+                self._bust_cache(message)
+            elif initiator == 'edx.proctoring':
+                self.dispatcher.submit(message.get('code'), self._process_edx_message, message, received)
             else:
-                self._notify_participants(message)
+                self._notify_participants(message, received)
 
-    def _notify_participants(self, message):
+    def owns_room(self, course_event_id):
+        if self.shard_ring is None or not course_event_id:
+            return True
+        return self.shard_ring.node(int(course_event_id)) == self.daemon_id
+
+    def _notify_participants(self, message, received=None):
         course_event_id = message.get('course_event_id')
         if course_event_id:
             course_event_id = int(course_event_id)
-            logger.debug('Send message to client (course_event_id: %d, message_body: %s)' % (course_event_id, message))
+            logger.debug('Send message to clients', extra={'room': course_event_id, 'action': message.get('action'),
+                                                           'code': message.get('code')})
             self.notifications_router.notify_participants(course_event_id, message)
+            if received is not None:
+                self.metrics.observe('stage_latency_seconds', time.time() - received, stage='broadcast')
+
+    def _bust_cache(self, message):
+        """
+        Drop cached courses and exams changed outside of the daemon.
+        Message may contain `course_id` (course display name) and/or `codes`
+        (list of exam codes). Without both fields all caches are cleared.
+        Snapshots of the rooms with the codes are dropped too, statuses may be
+        changed without messages to the rooms; they are reloaded for the next clients.
+        """
+        course_id = message.get('course_id')
+        codes = set(message.get('codes') or [])
+        snapshots = self.notifications_router.snapshots
+        if codes:
+            for room, snapshot in snapshots.items():
+                if not snapshot.loaded or codes.intersection(snapshot.exams):
+                    snapshots.pop(room)
+        elif not course_id:
+            snapshots.clear()
+        if course_id:
+            course_pk = self.courses.pop(course_id)
+            if codes:
+                for code in codes:
+                    self.exams.pop((course_pk, code))
+            elif course_pk is not None:
+                self.exams.pop_matching(lambda key: key[0] == course_pk)
+        elif codes:
+            self.exams.pop_matching(lambda key: key[1] in codes)
+        else:
+            self.courses.clear()
+            self.exams.clear()
+        logger.info('Cache was busted (course_id: %s, codes: %s)', course_id, ', '.join(codes))
+
+    def cache_stats(self):
+        return {
+            'courses': self.courses.stats(),
+            'exams': self.exams.stats(),
+        }
+
+    def collect_metrics(self):
+        """
+        Metrics families of rooms, caches and the DB pool for `Metrics.render`
+        """
+        router = self.notifications_router
+        participants = router.participants
+        caches = dict(self.cache_stats(), histories=router.histories.stats(), snapshots=router.snapshots.stats())
+        queues = router.queue_stats()
+        pool = self.db_pool
+        families = [
+            ('connections', 'gauge', 'Subscriptions of SockJS connections to rooms',
+             [((), participants.connections_count)]),
+            ('room_connections', 'gauge', 'Open SockJS connections of the room',
+             [((('room', room),), size) for room, size in sorted(participants.rooms_sizes().items())]),
+            ('rooms', 'gauge', 'Rooms with open connections', [((), participants.rooms_count)]),
+            ('amqp_connected', 'gauge', 'Whether the broker is connected', [((), self.broker_connected)]),
+            ('send_queue_bytes', 'gauge', 'Bytes of undelivered data of all clients', [((), queues['pending_bytes'])]),
+            ('throttled_clients', 'gauge', 'Clients which messages are held', [((), queues['throttled_clients'])]),
+            ('held_messages', 'gauge', 'Messages held for the slow clients', [((), queues['held_messages'])]),
+            ('db_pool_connections', 'gauge', 'Connections of the DB pool', [
+                ((('state', 'idle'),), len(pool._connections)),
+                ((('state', 'used'),), len(pool._used_connections)),
+            ]),
+            ('db_pool_max_connections', 'gauge', 'Max connections of the DB pool', [((), pool._max_connections)]),
+            ('db_pool_waiting', 'gauge', 'Requests waiting for the DB connection', [((), len(pool._wait_connections))]),
+            ('retry_journal_records', 'gauge', 'Messages waiting for replay', [((), len(self.retry_journal))]),
+            ('processing_running', 'gauge', 'edX messages being processed', [((), self.dispatcher.running)]),
+            ('processing_queued', 'gauge', 'edX messages waiting for processing', [((), self.dispatcher.queued)]),
+        ]
+        for key, help_text in (('size', 'Entries in the cache'), ('maxsize', 'Max entries in the cache')):
+            families.append(('cache_%s' % key, 'gauge', help_text,
+                             [((('cache', name),), stats[key]) for name, stats in sorted(caches.items())]))
+        for key in ('hits', 'misses', 'evictions'):
+            families.append(('cache_%s_total' % key, 'counter', 'Cache %s' % key,
+                             [((('cache', name),), stats[key]) for name, stats in sorted(caches.items())]))
+        for key, help_text in sorted(BROADCAST_COUNTERS.items()):
+            families.append(('broadcast_%s_total' % key, 'counter', help_text, [((), router.counters[key])]))
+        if self.command_forwarder is not None:
+            for key, help_text in sorted(COMMAND_COUNTERS.items()):
+                families.append(('%s_total' % key, 'counter', help_text,
+                                 [((), self.command_forwarder.counters[key])]))
+        return families
 
     @gen.coroutine
-    def _process_edx_message(self, message):
+    def _db_connection(self):
+        started = time.time()
+        conn = yield self.db_pool.Connection()
+        self.metrics.observe('db_pool_wait_seconds', time.time() - started)
+        raise gen.Return(conn)
+
+    @gen.coroutine
+    def _process_edx_message(self, message, received=None):
+        if message.get('code') in self.retry_journal:
+            # keep the order of the messages of the exam while its ones are replayed,
+            # messages of other exams don't wait for the replay
+            self._journal(message)
+            return
+        try:
+            yield self._apply_edx_message(message, received)
+        except RETRY_ERRORS as e:
+            logger.warning("Can't process message, it is saved to the retry journal: %s", str(e))
+            self._journal(message)
+
+    def _journal(self, message):
+        if not self.retry_journal.append(message):
+            logger.error("Retry journal is full, message is dropped: %s", message)
+            self.metrics.inc('journal_dropped_messages_total')
+            return
+        self.metrics.inc('journaled_messages_total')
+        self._start_replay()
+
+    def _start_replay(self):
+        if self._replaying is None:
+            self._replaying = self._replay_journal()
+            if self._replaying.done():
+                self._replaying = None
+
+    @gen.coroutine
+    def _replay_journal(self):
+        """
+        Apply journaled messages in order. While DB is unavailable
+        the interval between attempts grows up to `retry_interval_max`.
+        """
+        interval = self.retry_interval
+        try:
+            while True:
+                message = self.retry_journal.peek()
+                if message is None:
+                    break
+                try:
+                    yield self._apply_edx_message(message)
+                except RETRY_ERRORS as e:
+                    logger.warning("Can't replay message, retry in %ss (%d in journal): %s",
+                                   interval, len(self.retry_journal), str(e))
+                    yield gen.sleep(interval)
+                    interval = min(interval * 2, self.retry_interval_max)
+                    continue
+                except Exception:
+                    logger.exception("Can't replay message, it is skipped: %s", message)
+                self.retry_journal.commit()
+                interval = self.retry_interval
+            logger.info('Retry journal was replayed')
+        finally:
+            self._replaying = None
+
+    @gen.coroutine
+    def _apply_edx_message(self, message, received=None):
         course_id = message.get('course_id')
         course_event_id = message.get('course_event_id')
         exam_code = message.get('code')
@@ -70,19 +306,29 @@ class NotificationWebApp(tornado.web.Application):
         if not course_id or not exam_code or not course_event_id:
             return
 
-        with (yield self.db_pool.Connection()) as conn:
+        with (yield self._db_connection()) as conn:
             with conn.cursor() as cursor:
-                if course_id not in self.courses:
-                    yield cursor.execute("SELECT * FROM proctoring_course WHERE display_name=%s", (course_id,))
+                course_pk = self.courses.get(course_id)
+                if course_pk is None:
+                    yield cursor.execute("SELECT id FROM proctoring_course WHERE display_name=%s", (course_id,))
                     proctoring_course = cursor.fetchone()
                     if not proctoring_course:
                         logger.warning("Course '%s' not found", course_id)
                         return
-                    self.courses[course_id] = proctoring_course['id']
-
-                yield cursor.execute("SELECT * FROM proctoring_exam WHERE course_id=%s AND exam_code=%s",
-                                     (self.courses[course_id], exam_code))
-                proctoring_exam = cursor.fetchone()
+                    course_pk = proctoring_course['id']
+                    self.courses.set(course_id, course_pk)
+
+                exam_key = (course_pk, exam_code)
+                proctoring_exam = self.exams.get(exam_key)
+                if proctoring_exam is None:
+                    yield cursor.execute("SELECT id, attempt_status, attempt_status_updated FROM proctoring_exam"
+                                         " WHERE course_id=%s AND exam_code=%s", (course_pk, exam_code))
+                    proctoring_exam = cursor.fetchone()
+                    if proctoring_exam:
+                        self.exams.set(exam_key, proctoring_exam)
+                    else:
+                        # course could be re-created with the new id
+                        self.courses.pop(course_id)
                 if proctoring_exam:
                     notify_participants = True
 
@@ -110,13 +356,21 @@ class NotificationWebApp(tornado.web.Application):
                         except Exception as e:
                             notify_participants = False
                             logger.warning("Can't update exam [id=%s]: %s", proctoring_exam['id'], str(e))
+                            self.exams.pop(exam_key)
                             yield conn.rollback()
+                            if isinstance(e, RETRY_ERRORS):
+                                raise
                         else:
                             logger.info("Exam [id=%s] was updated. Previous status: %s (%s). New status: %s (%s)",
                                         proctoring_exam['id'], proctoring_exam['attempt_status'],
                                         str(proctoring_exam['attempt_status_updated']), new_status,
                                         data_to_update['attempt_status_updated'])
                             yield conn.commit()
+                            if received is not None:
+                                self.metrics.observe('stage_latency_seconds', time.time() - received,
+                                                     stage='db_commit')
+                            proctoring_exam['attempt_status'] = new_status
+                            proctoring_exam['attempt_status_updated'] = dt
                     elif action == 'new_user_session':
                         try:
                             message_data = message.get('data', None)
@@ -140,23 +394,45 @@ class NotificationWebApp(tornado.web.Application):
                                 ('timestamp', tm),
                                 ('exam_id', proctoring_exam['id']),
                             ])
-                            sql = "INSERT INTO proctoring_usersession(session_id, user_agent, browser, os, " \
-                                  "ip_address, timestamp, exam_id) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-                            yield cursor.execute(sql, tuple(data_to_insert.values()))
+                            # the message may be replayed from the retry journal
+                            yield cursor.execute("SELECT id FROM proctoring_usersession"
+                                                 " WHERE session_id=%s AND exam_id=%s",
+                                                 (sess_data_session_id, proctoring_exam['id']))
+                            if not cursor.fetchone():
+                                sql = "INSERT INTO proctoring_usersession(session_id, user_agent, browser, os, " \
+                                      "ip_address, timestamp, exam_id) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+                                yield cursor.execute(sql, tuple(data_to_insert.values()))
                         except Exception as e:
                             notify_participants = False
                             logger.warning("Can't insert user session [exam id=%s]: %s",
                                            proctoring_exam['id'], str(e))
                             yield conn.rollback()
+                            if isinstance(e, RETRY_ERRORS):
+                                raise
                         else:
                             logger.info("User session was added: session id: %s, browser: %s, os: %s,"
                                         " IP: %s, timestamp: %s, exam_id: %s",
                                         sess_data_session_id, sess_data_browser, sess_data_os, sess_data_ip_address,
                                         str(tm), str(proctoring_exam['id']))
                             yield conn.commit()
+                            if received is not None:
+                                self.metrics.observe('stage_latency_seconds', time.time() - received,
+                                                     stage='db_commit')
 
                     if notify_participants:
-                        self._notify_participants(message)
+                        self._notify_participants(message, received)
+
+    @gen.coroutine
+    def _load_room_snapshot(self, course_event_id):
+        with (yield self._db_connection()) as conn:
+            with conn.cursor() as cursor:
+                yield cursor.execute(
+                    "SELECT e.exam_code, e.attempt_status, e.attempt_status_updated, e.actual_end_date,"
+                    " (SELECT COUNT(*) FROM proctoring_comment c WHERE c.exam_id=e.id) AS comments"
+                    " FROM proctoring_exam e INNER JOIN proctoring_eventsession s ON s.id=e.event_id"
+                    " WHERE s.course_event_id=%s AND s.status=%s", (str(course_event_id), 'in_progress'))
+                rows = cursor.fetchall()
+        raise gen.Return(rows)
 
     def on_broker_connected(self):
         self.broker_connected = True
@@ -166,50 +442,424 @@ class NotificationWebApp(tornado.web.Application):
         logger.info('AMQP borker closed')
         self.broker_connected = False
 
+    def on_broker_reconnect(self):
+        self.metrics.inc('amqp_reconnects_total')
+
+
+class PushHandler(tornado.web.RequestHandler):
+    """
+    Receives messages pushed by the web assistant without the broker.
+    Body is JSON list of messages in the same format as the AMQP ones.
+    """
+
+    def initialize(self, notifier, token=None):
+        self.notifier = notifier
+        self.token = token
+
+    def post(self):
+        # compare_digest takes only ASCII strings
+        if self.token and not hmac.compare_digest(
+                self.request.headers.get('X-Notifications-Token', '').encode('utf-8', 'replace'),
+                self.token.encode('utf-8')):
+            raise tornado.web.HTTPError(403)
+        try:
+            messages = json.loads(self.request.body.decode('utf-8'))
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        if isinstance(messages, dict):
+            messages = [messages]
+        if not isinstance(messages, list):
+            raise tornado.web.HTTPError(400)
+        for message in messages:
+            if isinstance(message, dict):
+                self.notifier.notify(message)
+        self.set_status(204)
+
+
+_connection_ids = count(1)
+
+BROADCAST_COUNTERS = {
+    'messages': 'Messages broadcasted to the rooms',
+    'frames': 'Frames broadcasted to the rooms',
+    'deliveries': 'Frames sent to the clients',
+    'superseded': 'Status changes dropped inside the coalescing window',
+    'throttled': 'Times the clients were throttled because of the send queue limit',
+    'disconnected': 'Slow clients disconnected to resync',
+}
+
+COMMAND_COUNTERS = {
+    'commands': 'Proctor commands forwarded to the web assistant',
+    'batches': 'Requests with commands sent to the web assistant',
+    'failed_batches': 'Requests with commands which failed',
+}
+
 
 class NotificationsConnection(SockJSConnection):
+    """
+    Connection subscribed to one or several rooms. The room from the
+    `course_event_id` query argument is subscribed on open, others are
+    (un)subscribed by the client's commands:
+    {"action": "subscribe", "room": <course_event_id>, "epoch": ..., "last_seq": ...}
+    {"action": "unsubscribe", "room": <course_event_id>}
+
+    Proctor commands need the connection authenticated by the ticket:
+    {"action": "auth", "ticket": ...}
+    {"action": "comment", "id": ..., "codes": [...], "comment": {...}}
+    {"action": "ack", "id": ..., "codes": [...], "status": ...}
+    and are answered by {"action": "command_result", "id": ..., "ok": ..., "error": ...}
+    """
     participants = None
 
     def __init__(self, session):
         self.course_event_id = None
         self.connection_id = None
+        # messages held while the client is too slow, latest state per exam
+        self.backlog = None
+        self.rooms = set()
+        # proctor authenticated by the ticket
+        self.user_id = None
         super(NotificationsConnection, self).__init__(session)
 
     def on_open(self, request):
+        self.connection_id = next(_connection_ids)
         course_event_id = request.get_argument('course_event_id')
+        logger.info('Notification connection was opened # %s : %s (course_event_id: %s)',
+                    self.connection_id, request.path, course_event_id)
         if course_event_id:
             self.course_event_id = int(course_event_id)
-            self.connection_id = uuid.uuid4()
-            logger.info('Notification connection was opened # %s : %s (course_event_id: %s)',
-                        self.connection_id, request.path, self.course_event_id)
-            if self.course_event_id not in self.participants:
-                self.participants[self.course_event_id] = set()
-            self.participants[self.course_event_id].add(self)
+            epoch = request.get_argument('epoch')
+            if isinstance(epoch, bytes):
+                epoch = epoch.decode('utf-8')
+            self.subscribe(self.course_event_id, _to_int(request.get_argument('last_seq')), epoch)
 
     def on_message(self, message):
-        pass
+        try:
+            command = json.loads(message)
+        except ValueError:
+            command = None
+        if not isinstance(command, dict):
+            self.send({'action': 'error', 'message': 'Invalid command'})
+            return
+        action = command.get('action')
+        if action == 'auth':
+            self.authenticate(command.get('ticket'))
+            return
+        if action in COMMANDS:
+            self.run_command(command)
+            return
+        room = _to_int(command.get('room'))
+        if room is None:
+            self.send({'action': 'error', 'message': 'Invalid room'})
+        elif action == 'subscribe':
+            self.subscribe(room, _to_int(command.get('last_seq')), command.get('epoch'))
+        elif action == 'unsubscribe':
+            self.unsubscribe(room)
+        else:
+            self.send({'action': 'error', 'room': room, 'message': 'Unknown action'})
+
+    def authenticate(self, ticket):
+        commands = self.session.server.commands
+        user_id = commands.authenticate(ticket) if commands is not None else None
+        if user_id is None:
+            self.send({'action': 'auth', 'ok': False})
+            return
+        self.user_id = user_id
+        logger.debug('Connection # %s authenticated (user_id: %s)', self.connection_id, user_id)
+        self.send({'action': 'auth', 'ok': True})
+
+    @gen.coroutine
+    def run_command(self, command):
+        commands = self.session.server.commands
+        result = {'action': 'command_result', 'id': command.get('id')}
+        if commands is None:
+            result.update(ok=False, error='Commands are disabled')
+        elif self.user_id is None:
+            result.update(ok=False, error='Not authenticated')
+        else:
+            response = yield commands.submit(self.user_id, command)
+            result.update(ok=bool(response.get('ok')))
+            if response.get('error'):
+                result['error'] = response['error']
+        if not self.is_closed:
+            self.send(result)
+
+    def subscribe(self, room, last_seq=None, epoch=None):
+        if room in self.rooms:
+            return
+        router = self.session.server
+        if not router.owns_room(room):
+            self.send({'action': 'error', 'room': room, 'message': 'Room is served by another daemon'})
+            return
+        if len(self.rooms) >= router.max_subscriptions:
+            self.send({'action': 'error', 'room': room, 'message': 'Too many rooms'})
+            return
+        self.rooms.add(room)
+        self.participants.add(room, self)
+        logger.debug('Connection # %s subscribed (course_event_id: %s)', self.connection_id, room)
+        router.greet(self, room, last_seq, epoch)
+
+    def unsubscribe(self, room):
+        if room in self.rooms:
+            self.rooms.discard(room)
+            self.participants.remove(room, self)
+            logger.debug('Connection # %s unsubscribed (course_event_id: %s)', self.connection_id, room)
+
+    def pending_bytes(self):
+        """
+        Size of outgoing data which wasn't delivered to the client yet:
+        session queue of polling transports and socket buffer of websockets
+        """
+        session = self.session
+        size = len(getattr(session, 'send_queue', ''))
+        stream = getattr(session.handler, 'stream', None)
+        if stream is not None:
+            size += getattr(stream, '_write_buffer_size', 0)
+        return size
 
     def on_server_message(self, data):
         self.send(data)
 
     def on_close(self):
         logger.info('Notification connection was closed # %s (course_event_id: %s)',
-                    self.connection_id, self.course_event_id)
-        if self.course_event_id:
-            self.participants[self.course_event_id].remove(self)
+                    self.connection_id, ', '.join(str(room) for room in self.rooms))
+        for room in self.rooms:
+            self.participants.remove(room, self)
+        self.rooms = set()
+        self.backlog = None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 class NotificationsRouter(SockJSRouter):
 
     def __init__(self, *args, **kwargs):
+        self.history_size = kwargs.pop('history_size', 500)
+        # every daemon start begins the new sequence of messages
+        self.epoch = str(int(time.time() * 1000))
+        self.histories = LRUCache(kwargs.pop('max_rooms_history', 1000))
+        self.snapshots = LRUCache(kwargs.pop('max_rooms_snapshot', 1000))
+        # coroutine function returning exam rows of the room
+        self.snapshot_loader = kwargs.pop('snapshot_loader', None)
+        # function telling whether the room is served by this daemon
+        self.owns_room = kwargs.pop('owns_room', lambda room: True)
+        self.max_subscriptions = kwargs.pop('max_subscriptions', 50)
+        # messages to the room are collected during the window (in seconds) and sent as one frame
+        self.broadcast_window = kwargs.pop('broadcast_window', 0)
+        self._batches = {}
+        # clients with more than `send_queue_limit` bytes of undelivered data are throttled
+        self.send_queue_limit = kwargs.pop('send_queue_limit', 0)
+        self.send_backlog_limit = kwargs.pop('send_backlog_limit', 1000)
+        self._throttled = set()
+        self._drain_timer = None
+        self.counters = dict.fromkeys(BROADCAST_COUNTERS, 0)
+        # CommandForwarder or None when commands are disabled
+        self.commands = kwargs.pop('commands', None)
         super(NotificationsRouter, self).__init__(*args, **kwargs)
-        self._connection.participants = {}
+        self._connection.participants = RoomRegistry()
+
+    @gen.coroutine
+    def greet(self, conn, course_event_id, last_seq=None, epoch=None):
+        """
+        Send the state of the room to the new connection.
+        Reconnected clients which passed `last_seq` get only the missed messages.
+        Others get `hello` (or `resync` if missed messages aren't available anymore)
+        with the current position in the room and the snapshot of room's exams.
+        """
+        history = self.histories.get(course_event_id)
+        if last_seq is not None:
+            missed = None
+            if epoch == self.epoch:
+                if history:
+                    missed = history.since(last_seq)
+                elif last_seq == 0:
+                    missed = []
+            if missed is not None:
+                for msg in missed:
+                    conn.send(msg)
+                return
+            logger.info('Client must resync (course_event_id: %s, last_seq: %s)', course_event_id, last_seq)
+
+        snapshot = yield self.get_snapshot(course_event_id)
+        history = self.histories.get(course_event_id)
+        msg = {
+            'action': 'hello' if last_seq is None else 'resync',
+            'room': course_event_id,
+            'epoch': self.epoch,
+            'seq': history.seq if history else 0
+        }
+        if snapshot is not None:
+            msg['exams'] = snapshot.to_dict()
+        if not conn.is_closed:
+            conn.send(msg)
+
+    @gen.coroutine
+    def get_snapshot(self, course_event_id):
+        """
+        Snapshot of room's exams. It is loaded by `snapshot_loader` on the first call.
+        :return: RoomSnapshot or None if snapshot can't be loaded
+        """
+        snapshot = self.snapshots.get(course_event_id)
+        if snapshot is None:
+            if self.snapshot_loader is None:
+                raise gen.Return(None)
+            snapshot = RoomSnapshot()
+            self.snapshots.set(course_event_id, snapshot)
+            snapshot.loading = self._load_snapshot(snapshot, course_event_id)
+        if snapshot.loading is not None:
+            yield snapshot.loading
+        raise gen.Return(snapshot if snapshot.loaded else None)
+
+    @gen.coroutine
+    def _load_snapshot(self, snapshot, course_event_id):
+        try:
+            rows = yield self.snapshot_loader(course_event_id)
+            snapshot.load(rows)
+            logger.info('Snapshot was loaded (course_event_id: %s, exams: %s)', course_event_id, len(snapshot))
+        except Exception as e:
+            logger.warning("Can't load snapshot (course_event_id: %s): %s", course_event_id, str(e))
+            self.snapshots.pop(course_event_id)
+        finally:
+            snapshot.loading = None
 
     def notify_participants(self, course_event_id, msg):
-        participants = self._connection.participants.get(int(course_event_id), [])
+        course_event_id = int(course_event_id)
+        # clients subscribed to several rooms tell messages apart by the room
+        msg['room'] = course_event_id
+        if self.broadcast_window:
+            batch = self._batches.get(course_event_id)
+            if batch is None:
+                batch = self._batches[course_event_id] = MessageBatch()
+                self.io_loop.call_later(self.broadcast_window, self._flush_batch, course_event_id)
+            batch.add(msg)
+        else:
+            self._record(course_event_id, [msg])
+            self._broadcast(course_event_id, [msg], 1)
+
+    def _flush_batch(self, course_event_id):
+        batch = self._batches.pop(course_event_id, None)
+        if batch:
+            self._record(course_event_id, batch.received_messages())
+            self.counters['superseded'] += batch.superseded
+            self._broadcast(course_event_id, batch.messages(), len(batch))
+
+    def _record(self, course_event_id, messages):
+        """
+        Number the messages which are being sent and add them to the history and the snapshot
+        of the room, so `greet` doesn't replay or count the messages waiting for the batch
+        """
+        history = self.histories.get(course_event_id)
+        if history is None:
+            history = RoomHistory(self.history_size)
+            self.histories.set(course_event_id, history)
+        snapshot = self.snapshots.get(course_event_id)
+        for msg in messages:
+            history.append(msg)
+            if snapshot is not None:
+                snapshot.apply(msg)
+
+    def _broadcast(self, course_event_id, messages, received):
+        participants = self._connection.participants.get(course_event_id)
         if participants:
-            logger.info('Broadcast messages to participants (course_event_id: %s)',
-                        course_event_id)
-            self.broadcast(participants, msg)
+            logger.debug('Broadcast messages to participants',
+                         extra={'room': course_event_id, 'messages': len(messages), 'connections': len(participants)})
+            disconnected = []
+            if self.send_queue_limit:
+                participants, disconnected = self._apply_backpressure(participants, messages)
+            self.broadcast(participants, _make_frame(messages, course_event_id))
+            # closing removes the connection from the room, not while the room is iterated
+            for conn in disconnected:
+                conn.session.close(3001, 'resync')
+            self.counters['messages'] += received
+            self.counters['frames'] += 1
+            self.counters['deliveries'] += len(participants)
         else:
-            logger.info('Participants not found (course_event_id: %s)', course_event_id)
+            logger.debug('Participants not found', extra={'room': course_event_id})
+
+    def _apply_backpressure(self, participants, messages):
+        """
+        Hold messages for slow clients
+        :return: tuple (list of clients ready to receive messages,
+            list of clients to disconnect because of too many held messages)
+        """
+        ready = []
+        disconnected = []
+        for conn in list(participants):
+            if conn.backlog is None and conn.pending_bytes() <= self.send_queue_limit:
+                ready.append(conn)
+            elif not self._hold(conn, messages):
+                disconnected.append(conn)
+        return ready, disconnected
+
+    def _hold(self, conn, messages):
+        """
+        :return: False if the client has too many held messages and must be disconnected
+        """
+        if conn.backlog is None:
+            logger.info('Client is too slow, messages are held # %s (course_event_id: %s)',
+                        conn.connection_id, conn.course_event_id)
+            conn.backlog = OrderedDict()
+            self._throttled.add(conn)
+            self.counters['throttled'] += 1
+            if self._drain_timer is None:
+                self._drain_timer = PeriodicCallback(self._drain, 500, self.io_loop)
+                self._drain_timer.start()
+        for msg in messages:
+            code = msg.get('code')
+            key = (msg.get('room'), code if code and msg.get('action') == 'change_status' else msg.get('seq'))
+            conn.backlog.pop(key, None)
+            conn.backlog[key] = msg
+        if len(conn.backlog) > self.send_backlog_limit:
+            logger.warning('Client is disconnected because of too many held messages # %s (course_event_id: %s)',
+                           conn.connection_id, conn.course_event_id)
+            self._throttled.discard(conn)
+            conn.backlog = None
+            self.counters['disconnected'] += 1
+            # reconnected client gets missed messages or resync
+            return False
+        return True
+
+    def _drain(self):
+        for conn in list(self._throttled):
+            if conn.backlog is None or conn.is_closed:
+                self._throttled.discard(conn)
+            elif conn.pending_bytes() <= self.send_queue_limit:
+                rooms = OrderedDict()
+                for msg in conn.backlog.values():
+                    rooms.setdefault(msg.get('room'), []).append(msg)
+                conn.backlog = None
+                self._throttled.discard(conn)
+                for room, messages in rooms.items():
+                    conn.send(_make_frame(messages, room))
+        if not self._throttled:
+            self._drain_timer.stop()
+            self._drain_timer = None
+
+    def queue_stats(self):
+        sizes = [conn.pending_bytes() for conn in set(self._connection.participants.connections())]
+        return {
+            'pending_bytes': sum(sizes),
+            'max_pending_bytes': max(sizes) if sizes else 0,
+            'throttled_clients': len(self._throttled),
+            'held_messages': sum(len(conn.backlog or ()) for conn in self._throttled),
+        }
+
+    @property
+    def participants(self):
+        return self._connection.participants
+
+    def broadcast_stats(self):
+        stats = dict(self.counters)
+        stats['frames_saved'] = stats['messages'] - stats['frames']
+        stats['pending_batches'] = len(self._batches)
+        return stats
+
+
+def _make_frame(messages, room=None):
+    if len(messages) == 1:
+        return messages[0]
+    return {'action': 'batch', 'room': room, 'seq': messages[-1]['seq'], 'messages': messages}
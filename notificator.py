@@ -14,13 +14,16 @@ def main():
 
     logger = logging.getLogger('notifications')
 
-    if 'SERVER_PORT' not in NOTIFICATIONS or 'BROKER_URL' not in NOTIFICATIONS:
+    if 'SERVER_PORT' not in NOTIFICATIONS:
         raise Exception('Please set \'NOTIFICATIONS\' dict in the settings.py')
+    if 'BROKER_URL' not in NOTIFICATIONS:
+        logger.warning('BROKER_URL is not set, only messages pushed by the web assistant will be received')
 
     logger.info('Start notifications server (Tornado Version {tornado_version})'.format(tornado_version=tornado.version))
     server = NotificationServer(NOTIFICATIONS['SERVER_PORT'], daemon_id=NOTIFICATIONS['DAEMON_ID'],
-                                web_url=NOTIFICATIONS['WEB_URL'], broker_url=NOTIFICATIONS['BROKER_URL'],
-                                db_settings=DATABASES['default'], raven_dsn=RAVEN_CONFIG.get('dsn'))
+                                web_url=NOTIFICATIONS['WEB_URL'], broker_url=NOTIFICATIONS.get('BROKER_URL'),
+                                db_settings=DATABASES['default'], raven_dsn=RAVEN_CONFIG.get('dsn'),
+                                options=NOTIFICATIONS)
     try:
         server.start()
     except Exception as e:
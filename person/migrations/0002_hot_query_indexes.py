@@ -0,0 +1,17 @@
+# Generated by Django 2.0.3 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('person', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='permission',
+            index=models.Index(fields=['user', 'role'], name='permission_user_role_idx'),
+        ),
+    ]
@@ -42,6 +42,11 @@ class Permission(models.Model):
     role = models.CharField(max_length=10, choices=ROLES_CHOICES,
                             default=ROLE_PROCTOR)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'role'], name='permission_user_role_idx'),
+        ]
+
     def _get_course_field_by_type(self):
         """
         return field name by object type
@@ -14,7 +14,7 @@ from rest_framework import status
 from journaling.models import Journaling
 from proctoring import models
 from proctoring.edx_api import bulk_update_exams_statuses
-from edx_proctor_webassistant.web_soket_methods import send_notification
+from edx_proctor_webassistant.web_soket_methods import send_notification, send_cache_bust
 
 
 csrf_protect_m = method_decorator(csrf_protect)
@@ -170,6 +170,7 @@ class InProgressEventSessionAdmin(EventSessionAdmin):
                             exam_attempt.attempt_status_updated = datetime.now()
                             exam_attempt.exam_status = models.Exam.FINISHED
                             exam_attempt.save()
+                    send_cache_bust(list(new_statuses.keys()))
                 else:
                     messages.error(request, _('Error during request to API edX. Please try again later'))
                     return HttpResponseRedirect(redirect_url)
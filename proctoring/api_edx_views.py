@@ -3,6 +3,8 @@
 API Views for OpenEdX's calls
 APIRoot view - list of all available API endpoints
 """
+import time
+
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import viewsets, status, mixins
 from rest_framework.authentication import BasicAuthentication
@@ -33,6 +35,7 @@ class APIRoot(APIView):
             "review": reverse('review', request=request),
             "proctored_exams": reverse('proctor_exams', request=request),
             "journaling": reverse('journaling-list', request=request),
+            "journaling_archive": reverse('journaling-archive-list', request=request),
             "event_session": reverse('event-session-list', request=request),
             "archived_event_session": reverse('archived-event-session-list',
                                               request=request),
@@ -109,6 +112,7 @@ class ExamViewSet(mixins.ListModelMixin,
         Create new exam, on exam attempt.
         Find Event Session for this exam.
         """
+        started = time.time()
         data = request.data.copy()
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
@@ -124,7 +128,8 @@ class ExamViewSet(mixins.ListModelMixin,
                     'error': _("No event was found. Forbidden"),
                     'message': _("There is no active room for the chosen exam")
                 },
-                status_code=status.HTTP_403_FORBIDDEN
+                status_code=status.HTTP_403_FORBIDDEN,
+                started=started
             )
         event = event[0]
         self.perform_create(serializer)
@@ -149,25 +154,20 @@ class ExamViewSet(mixins.ListModelMixin,
             data=data,
             result={'ID': data['hash']},
             status_code=status.HTTP_201_CREATED,
-            headers=headers
+            headers=headers,
+            started=started
         )
 
 
 def _send_journaling_response(request, data, result, status_code,
-                              headers=None):
+                              headers=None, started=None):
     """
     Journaling all requests and responses from edX
     """
-    Journaling.objects.create(
-        journaling_type=Journaling.API_REQUESTS,
-        note="""
-Requested url:%s
-Sent data: %s
-Response status: %s
-Response content: %s
-            """ % (
-            reverse('exam-register-list', request=request),
-            str(data), status_code, str(result))
+    Journaling.create_http_call(
+        Journaling.API_REQUESTS, reverse('exam-register-list'), request.method, status_code,
+        time.time() - started if started else 0, sent=data, received=result,
+        url=reverse('exam-register-list', request=request)
     )
     return Response(result,
                     status=status_code,
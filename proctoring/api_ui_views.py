@@ -2,7 +2,9 @@
 Views for UI application
 """
 # -*- coding: utf-8 -*-
+import hmac
 import json
+import logging
 from datetime import datetime, timedelta
 
 from rest_framework import viewsets, status, mixins
@@ -10,18 +12,25 @@ from rest_framework.authentication import BasicAuthentication
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.exceptions import ValidationError
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import redirect
 
-from edx_proctor_webassistant.web_soket_methods import send_notification
+from edx_proctor_webassistant.web_soket_methods import send_notification, send_cache_bust
 from edx_proctor_webassistant.auth import (CsrfExemptSessionAuthentication,
                                            SsoTokenAuthentication,
                                            IsProctor, IsProctorOrInstructor)
-from edx_proctor_webassistant.rest_framework import PaginationBy25
+from edx_proctor_webassistant.rest_framework import (CSVRenderer, KeysetPagination,
+                                                     stream_csv, stream_json)
 from journaling.models import Journaling
+from notifications.commands import sign_ticket
+from person.models import Permission
 from proctoring import models
 from proctoring.serializers import (EventSessionSerializer, CommentSerializer,
                                     ArchivedEventSessionSerializer)
@@ -31,6 +40,8 @@ from proctoring.edx_api import (start_exam_request, stop_exam_request,
                                 get_proctored_exams_request,
                                 bulk_start_exams_request)
 
+logger = logging.getLogger(__name__)
+
 
 def _get_status(code):
     """
@@ -223,6 +234,7 @@ class PollStatus(APIView):
                 .filter(exam_code__in=data['list'])\
                 .select_related('event')
             codes_dict = {exam.exam_code: exam for exam in exams}
+            changed_codes = []
             if codes_dict:
                 response = poll_statuses_attempts_request(list(codes_dict.keys()))
                 for attempt_code, new_status in response.items():
@@ -245,6 +257,7 @@ class PollStatus(APIView):
                             exam.attempt_status_updated = datetime.now()
                             exam.last_poll = datetime.now()
                             exam.save()
+                            changed_codes.append(attempt_code)
                             if not result_in_response:
                                 send_notification(data, channel=exam.event.course_event_id)
                         if result_in_response:
@@ -252,6 +265,8 @@ class PollStatus(APIView):
                                 else None
                             result.append({'code': attempt_code, 'status': exam.attempt_status,
                                            'updated': dt_updated})
+            if changed_codes:
+                send_cache_bust(changed_codes)
             return Response(data=result, status=status.HTTP_200_OK) if result_in_response\
                 else Response(status=status.HTTP_200_OK)
         else:
@@ -286,12 +301,12 @@ class EventSessionViewSet(mixins.ListModelMixin,
         hash_key = self.request.query_params.get('session')
         if hash_key:
             queryset = models.EventSession.objects.filter(
-                hash_key=hash_key)
+                hash_key=hash_key).select_related('course', 'proctor')
             queryset = models.EventSession.update_queryset_with_permissions(
                 queryset, self.request.user
             )
         else:
-            queryset = models.EventSession.objects.all()
+            queryset = models.EventSession.objects.select_related('course', 'proctor')
         return queryset
 
     def create(self, request, *args, **kwargs):
@@ -401,10 +416,13 @@ class ArchivedEventSessionViewSet(mixins.ListModelMixin,
 
     Add GET parameter in end of URL, for example:
     `?start_date=2015-12-04&proctor=proctor_username`
+
+    Follow the `next` and `previous` links for other pages, `page_size`
+    is up to 100. Add `count=1` to get the number of results.
     """
     serializer_class = ArchivedEventSessionSerializer
-    queryset = models.ArchivedEventSession.objects.order_by('-pk')
-    pagination_class = PaginationBy25
+    queryset = models.ArchivedEventSession.objects.select_related('course', 'proctor').order_by('-pk')
+    pagination_class = KeysetPagination
     authentication_classes = (SsoTokenAuthentication,
                               CsrfExemptSessionAuthentication,
                               BasicAuthentication)
@@ -465,7 +483,40 @@ class ArchivedEventSessionViewSet(mixins.ListModelMixin,
 
 
 class ArchivedEventSessionAllViewSet(ArchivedEventSessionViewSet):
+    """
+    All Archived Event sessions with the same filters, streamed as JSON
+    array or as CSV with `?format=csv`
+    """
     pagination_class = None
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (CSVRenderer,)
+    chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        rows = (serializer.to_representation(session) for session in self._iterate(queryset))
+        if request.accepted_renderer.format == 'csv':
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="archived_sessions.csv"'
+        else:
+            response = StreamingHttpResponse(stream_json(rows), content_type='application/json')
+        return response
+
+    def _iterate(self, queryset):
+        """
+        Sessions in chunks of `chunk_size` in order of the queryset (`-pk`),
+        every query returns only one chunk: MySQL client buffers the whole
+        result of the query, `iterator()` doesn't keep memory flat there
+        """
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__lt=last_pk)
+            chunk = list(chunk[:self.chunk_size])
+            for session in chunk:
+                yield session
+            if len(chunk) < self.chunk_size:
+                return
+            last_pk = chunk[-1].pk
 
 
 class Review(APIView):
@@ -602,7 +653,7 @@ class GetExamsProctored(APIView):
                     results[i]['org_description'] = orgs_descriptions[res['org']]
         current_active_sessions = models.InProgressEventSession.objects.filter(
             proctor=request.user
-        ).order_by('-start_date')
+        ).select_related('course', 'proctor').order_by('-start_date')
 
         return Response(
             status=response.status_code,
@@ -658,26 +709,24 @@ def redirect_ui(request):
     return redirect('/#{}'.format(request.path))
 
 
-class Comment(APIView):
+def _add_comments(user, exam_codes, comment):
     """
-    Add comment to exams.
-
+    Add comment to the exams, notify their rooms and journal it
+    :param user: proctor
+    :param exam_codes: list of exam codes
+    :param comment: dict
+    :raise Http404: if the exam isn't available to the user
+    :raise ValidationError: if the comment is invalid
+    :raise ValueError: if `event_start` or `event_finish` isn't a number
+
+    Comments are saved for all the exams or for none of them,
+    rooms are notified after that.
     """
-    authentication_classes = (SsoTokenAuthentication,
-                              CsrfExemptSessionAuthentication,
-                              BasicAuthentication)
-    permission_classes = (IsAuthenticated, IsProctor)
-
-    def post(self, request):
-        comment = request.data.get('comment')
-        if isinstance(comment, str):
-            comment = json.loads(comment)
-        exam_codes = request.data.get('codes', [])
-        if isinstance(exam_codes, str):
-            exam_codes = json.loads(exam_codes)
+    notifications = []
+    with transaction.atomic():
         for code in exam_codes:
             exam = get_object_or_404(
-                models.Exam.objects.by_user_perms(request.user),
+                models.Exam.objects.by_user_perms(user),
                 exam_code=code
             )
             exam_comment = comment.copy()
@@ -687,19 +736,16 @@ class Comment(APIView):
             if 'event_finish' in comment:
                 exam_comment['event_finish'] = int(exam_comment['event_finish'])
             serializer = CommentSerializer(data=exam_comment)
-            try:
-                serializer.is_valid(raise_exception=True)
-            except ValidationError as e:
-                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            serializer.is_valid(raise_exception=True)
             serializer.save()
-            send_notification(serializer.data, channel=exam.event.course_event_id, action='new_comment')
+            notifications.append((serializer.data, exam.event.course_event_id))
 
             # comment journaling
             Journaling.objects.create(
                 journaling_type=Journaling.EXAM_COMMENT,
                 event=exam.event,
                 exam=exam,
-                proctor=request.user,
+                proctor=user,
                 note="""
                     Duration: %s
                     Event start: %s
@@ -715,4 +761,129 @@ class Comment(APIView):
                     serializer.data.get('comment'),
                 ),
             )
+    for data, channel in notifications:
+        send_notification(data, channel=channel, action='new_comment')
+
+
+def _acknowledge_status(user, exam_codes, attempt_status):
+    """
+    Record that the proctor has seen the attempt status of the exams
+    and tell other proctors of the rooms
+    :raise Http404: if the exam isn't available to the user
+    """
+    exams = [
+        get_object_or_404(models.Exam.objects.by_user_perms(user), exam_code=code)
+        for code in exam_codes
+    ]
+    with transaction.atomic(using=router.db_for_write(Journaling)):
+        for exam in exams:
+            Journaling.objects.create(
+                journaling_type=Journaling.EXAM_STATUS_ACK,
+                event=exam.event,
+                exam=exam,
+                proctor=user,
+                note=attempt_status,
+            )
+    for exam in exams:
+        send_notification({'code': exam.exam_code, 'status': attempt_status, 'proctor': user.username},
+                          channel=exam.event.course_event_id, action='status_ack')
+
+
+class Comment(APIView):
+    """
+    Add comment to exams.
+
+    """
+    authentication_classes = (SsoTokenAuthentication,
+                              CsrfExemptSessionAuthentication,
+                              BasicAuthentication)
+    permission_classes = (IsAuthenticated, IsProctor)
+
+    def post(self, request):
+        comment = request.data.get('comment')
+        if isinstance(comment, str):
+            comment = json.loads(comment)
+        exam_codes = request.data.get('codes', [])
+        if isinstance(exam_codes, str):
+            exam_codes = json.loads(exam_codes)
+        try:
+            _add_comments(request.user, exam_codes, comment)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_201_CREATED)
+
+
+class NotificationsTicket(APIView):
+    """
+    Ticket which authenticates the proctor's commands sent over
+    the notifications connection, see `notifications.commands`
+    """
+    authentication_classes = (SsoTokenAuthentication,
+                              CsrfExemptSessionAuthentication,
+                              BasicAuthentication)
+    permission_classes = (IsAuthenticated, IsProctor)
+
+    def get(self, request):
+        secret = settings.NOTIFICATIONS.get('COMMAND_SECRET')
+        if not secret:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        ticket = sign_ticket(secret, request.user.pk, settings.NOTIFICATIONS.get('COMMAND_TICKET_TTL', 300))
+        return Response({'ticket': ticket})
+
+
+class NotificationCommands(APIView):
+    """
+    Proctor commands forwarded by the notification daemons in batches.
+    Daemons authenticate by the `COMMAND_SECRET` and pass the id of the proctor
+    who sent every command; permissions of proctors are checked here.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request):
+        secret = settings.NOTIFICATIONS.get('COMMAND_SECRET')
+        if not secret or not hmac.compare_digest(request.META.get('HTTP_X_NOTIFICATIONS_TOKEN', ''), secret):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        commands = request.data.get('commands')
+        if not isinstance(commands, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        user_ids = set(command.get('user_id') for command in commands if isinstance(command, dict))
+        users = User.objects.filter(pk__in=user_ids, is_active=True).in_bulk()
+        proctors = set(Permission.objects.filter(
+            user_id__in=user_ids, role=Permission.ROLE_PROCTOR
+        ).values_list('user_id', flat=True))
+        results = []
+        for command in commands:
+            if not isinstance(command, dict):
+                results.append({'ok': False, 'error': 'Invalid command'})
+                continue
+            user = users.get(command.get('user_id'))
+            if user is None or not (user.is_superuser or user.pk in proctors):
+                results.append({'ok': False, 'error': 'Permission denied'})
+                continue
+            results.append(self._run(user, command))
+        return Response({'results': results})
+
+    def _run(self, user, command):
+        action = command.get('action')
+        exam_codes = command.get('codes')
+        if not isinstance(exam_codes, list):
+            return {'ok': False, 'error': 'Invalid codes'}
+        # a failed command doesn't fail the others of the batch, they are already saved
+        try:
+            if action == 'comment' and isinstance(command.get('comment'), dict):
+                _add_comments(user, exam_codes, command['comment'])
+            elif action == 'ack' and command.get('status'):
+                _acknowledge_status(user, exam_codes, str(command['status']))
+            else:
+                return {'ok': False, 'error': 'Invalid command'}
+        except Http404:
+            return {'ok': False, 'error': 'Exam not found'}
+        except ValidationError as e:
+            return {'ok': False, 'error': e.detail}
+        except (TypeError, ValueError):
+            return {'ok': False, 'error': 'Invalid command'}
+        except Exception:
+            logger.exception("Can't run the command %s", command)
+            return {'ok': False, 'error': 'Internal error'}
+        return {'ok': True}
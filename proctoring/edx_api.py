@@ -4,6 +4,8 @@ There are requests to edX API
 See https://github.com/edx/edx-proctoring/blob/master/edx_proctoring/api.py
 """
 import json
+import time
+
 import requests
 
 from bs4 import BeautifulSoup
@@ -22,7 +24,8 @@ def start_exam_request(attempt_code):
     """
     return _journaling_request(
         'get',
-        "api/edx_proctoring/proctoring_launch_callback/start_exam/" + attempt_code
+        "api/edx_proctoring/proctoring_launch_callback/start_exam/" + attempt_code,
+        endpoint="api/edx_proctoring/proctoring_launch_callback/start_exam/"
     )
 
 
@@ -37,8 +40,9 @@ def stop_exam_request(_id, action, user_id):
     return _journaling_request(
         'put',
         "api/edx_proctoring/v1/proctored_exam/attempt/" + _id,
-        json.dumps({'action': action, 'user_id': user_id, 'initiator': 'proctor'}),
-        {'Content-Type': 'application/json'}
+        {'action': action, 'user_id': user_id, 'initiator': 'proctor'},
+        {'Content-Type': 'application/json'},
+        endpoint="api/edx_proctoring/v1/proctored_exam/attempt/"
     )
 
 
@@ -50,7 +54,7 @@ def bulk_update_exams_statuses(attempts):
     return _journaling_request(
         'post',
         'api/extended/edx_proctoring/attempts_bulk_update/',
-        json.dumps({'attempts': attempts}),
+        {'attempts': attempts},
         {'Content-Type': 'application/json', 'X-Edx-Api-Key': settings.EDX_API_KEY}
     )
 
@@ -109,7 +113,7 @@ def send_review_request(payload):
     return _journaling_request(
         'post',
         "api/edx_proctoring/proctoring_review_callback/",
-        json.dumps(payload, default=date_handler),
+        payload,
     )
 
 
@@ -138,26 +142,29 @@ def bulk_start_exams_request(exam_list):
     url = "api/edx_proctoring/proctoring_launch_callback/start_exam/%s"
     for exam in exam_list:
         response = _journaling_request(
-            'get', url % str(exam.exam_code),
+            'get', url % str(exam.exam_code), endpoint=url % ''
         )
         if response.status_code == 200:
             result.append(exam)
     return result
 
 
-def _journaling_request(request_type, url, data=None, headers=None):
+def _journaling_request(request_type, url, data=None, headers=None, endpoint=None):
     """
     Method wich journaling all requests and responses for edX
     :param request_type: get, post or put
     :param url: str
-    :param data: dict
+    :param data: dict, sent as JSON body of post and put, as query params of get
     :param headers: dict
+    :param endpoint: url without the attempt code, url by default
     :return: Response
     """
+    body = json.dumps(data, default=date_handler) if data is not None else None
+    started = time.time()
     if request_type == "post":
         response = requests.post(
             settings.EDX_URL + url,
-            data=data,
+            data=body,
             headers=headers
         )
     elif request_type == "get":
@@ -175,11 +182,12 @@ def _journaling_request(request_type, url, data=None, headers=None):
     elif request_type == "put":
         response = requests.put(
             settings.EDX_URL + url,
-            data=data,
+            data=body,
             headers=headers
         )
     else:
         raise Exception('Invalid request_type', request_type)
+    duration = time.time() - started
     try:
         result = response.json()
     except ValueError:
@@ -196,19 +204,9 @@ def _journaling_request(request_type, url, data=None, headers=None):
         else:
             result = str(response.content)
     try:
-        Journaling.objects.create(
-            journaling_type=Journaling.EDX_API_CALL,
-            note="""
-Call url:%s
-Sent data: %s
-Response status: %s
-Response content: %s
-            """ % (
-                url,
-                str(data).encode('utf-8'),
-                str(response.status_code),
-                str(result)
-            )
+        Journaling.create_http_call(
+            Journaling.EDX_API_CALL, endpoint or url, request_type, response.status_code, duration,
+            sent=data, received=result, url=url
         )
     except:
         pass
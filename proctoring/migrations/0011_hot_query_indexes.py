@@ -0,0 +1,30 @@
+# Generated by Django 2.0.3 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proctoring', '0010_user_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['display_name'], name='course_display_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventsession',
+            index=models.Index(fields=['course', 'course_event_id', 'status', 'start_date'],
+                               name='session_course_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventsession',
+            index=models.Index(fields=['course_event_id', 'status'], name='session_event_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['event', 'attempt_status'], name='exam_event_status_idx'),
+        ),
+    ]
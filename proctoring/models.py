@@ -106,6 +106,12 @@ class Course(models.Model):
     def __str__(self):
         return self.display_name
 
+    class Meta:
+        indexes = [
+            # course lookup of the notification daemon
+            models.Index(fields=['display_name'], name='course_display_name_idx'),
+        ]
+
 
 def has_permission_to_course(user, course_id, permissions=None, role=None):
     """
@@ -240,6 +246,10 @@ class Exam(models.Model):
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            # not finished attempts of the session when it is closed
+            models.Index(fields=['event', 'attempt_status'], name='exam_event_status_idx'),
+        ]
 
 
 class InProgressEventSessionManager(models.Manager):
@@ -353,6 +363,15 @@ class EventSession(models.Model):
                             self.course.course_run,
                             self.course_event_id))
 
+    class Meta:
+        indexes = [
+            # the latest session of the course event when the exam or the session is created
+            models.Index(fields=['course', 'course_event_id', 'status', 'start_date'],
+                         name='session_course_event_idx'),
+            # sessions of the room loaded by the notification daemon
+            models.Index(fields=['course_event_id', 'status'], name='session_event_status_idx'),
+        ]
+
 
 class InProgressEventSession(EventSession):
     """
@@ -1,6 +1,8 @@
 """
 Tests for API endpoints called by UI
 """
+import csv
+import io
 import json
 from datetime import datetime
 from unittest.mock import patch
@@ -9,12 +11,18 @@ from rest_framework import status
 from rest_framework.test import APIRequestFactory, force_authenticate
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from journaling.models import Journaling
+from notifications.commands import verify_ticket
 
 from person.models import Permission, Student
 from proctoring.models import (Exam, EventSession, ArchivedEventSession,
                                Comment, Course, InProgressEventSession)
 from proctoring import api_ui_views
+from proctoring.serializers import ArchivedEventSessionSerializer
 
 
 class ViewsUITestCase(TestCase):
@@ -225,6 +233,22 @@ class ViewsUITestCase(TestCase):
             exam = Exam.objects.get(pk=self.exam.pk)
             self.assertNotEqual(exam.attempt_status, "submitted")
 
+    @patch('proctoring.api_ui_views.send_cache_bust')
+    def test_poll_status_cache_bust(self, send_cache_bust):
+        factory = APIRequestFactory()
+        data = {'list': [self.exam.exam_code]}
+        with patch(
+            'proctoring.api_ui_views.poll_statuses_attempts_request') as edx_request:
+            edx_request.return_value = {self.exam.exam_code: "started"}
+            request = factory.post('/api/poll_status?result=1', data, format='json')
+            force_authenticate(request, user=self.user)
+            response = api_ui_views.PollStatus.as_view()(request)
+            response.render()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            send_cache_bust.assert_called_once_with([self.exam.exam_code])
+            exam = Exam.objects.get(pk=self.exam.pk)
+            self.assertEqual(exam.attempt_status, "started")
+
     def test_send_review(self):
         factory = APIRequestFactory()
         comment_count = Comment.objects.count()
@@ -573,6 +597,49 @@ class ArchivedEventSessionViewSetTestCase(TestCase):
         data = json.loads(str(response.content, 'utf-8'))
         self.assertEqual(len(data.get('results')), 0)
 
+    def _get_all(self, url):
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=self.user)
+        view = api_ui_views.ArchivedEventSessionAllViewSet.as_view(
+            {'get': 'list'})
+        response = view(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_all(self):
+        self.event.pk = None
+        self.event.hash_key = None
+        self.event.course_event_id = 'other event'
+        self.event.save()
+        response, content = self._get_all('/api/archived_exam_all/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(content)
+        expected = ArchivedEventSessionSerializer(
+            ArchivedEventSession.objects.order_by('-pk'), many=True).data
+        self.assertEqual(data, json.loads(json.dumps(expected)))
+
+        # every query returns one chunk, the last one is empty
+        with patch.object(api_ui_views.ArchivedEventSessionAllViewSet, 'chunk_size', 1), \
+                CaptureQueriesContext(connection) as queries:
+            response, content = self._get_all('/api/archived_exam_all/')
+        self.assertEqual(json.loads(content), data)
+        chunks = [query['sql'] for query in queries if 'FROM "proctoring_eventsession"' in query['sql']]
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(sql.endswith('LIMIT 1') for sql in chunks), chunks)
+
+        response, content = self._get_all('/api/archived_exam_all/?course_event_id=nothing')
+        self.assertEqual(json.loads(content), [])
+
+    def test_all_csv(self):
+        response, content = self._get_all('/api/archived_exam_all/?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['course_id'], self.event.course.display_name)
+        self.assertEqual(rows[0]['proctor'], 'test')
+        self.assertEqual(rows[0]['hash_key'], self.event.hash_key)
+
 
 class CommentViewSetTestCase(TestCase):
     def setUp(self):
@@ -671,6 +738,87 @@ class CommentViewSetTestCase(TestCase):
         )
 
 
+@override_settings(NOTIFICATIONS={'WEB_URL': '/notifications', 'COMMAND_SECRET': 'secret'})
+class NotificationCommandsTestCase(CommentViewSetTestCase):
+    def post_commands(self, commands, token='secret'):
+        factory = APIRequestFactory()
+        request = factory.post('/api/notifications_commands/', data={'commands': commands}, format='json',
+                               HTTP_X_NOTIFICATIONS_TOKEN=token)
+        response = api_ui_views.NotificationCommands.as_view()(request)
+        response.render()
+        return response
+
+    def test_ticket(self):
+        request = APIRequestFactory().get('/api/notifications_ticket/')
+        force_authenticate(request, user=self.user)
+        response = api_ui_views.NotificationsTicket.as_view()(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(verify_ticket('secret', response.data['ticket']), self.user.pk)
+
+    def test_wrong_token(self):
+        response = self.post_commands([], token='wrong')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('proctoring.api_ui_views.send_notification')
+    def test_commands(self, send_notification):
+        stranger = User.objects.create_user('stranger', 'stranger@test.com', 'password')
+        comment = {
+            "comment": "comment text",
+            "event_status": "Suspicious",
+            "event_start": 1521843813,
+            "event_finish": 1521843913,
+            "duration": 198
+        }
+        response = self.post_commands([
+            {'user_id': self.user.pk, 'action': 'comment', 'codes': ['examCode'], 'comment': comment},
+            {'user_id': self.user.pk, 'action': 'ack', 'codes': ['examCode'], 'status': 'started'},
+            {'user_id': self.user.pk, 'action': 'ack', 'codes': ['unknown'], 'status': 'started'},
+            {'user_id': self.user.pk, 'action': 'dance', 'codes': []},
+            {'user_id': stranger.pk, 'action': 'ack', 'codes': ['examCode'], 'status': 'started'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'ok': True},
+            {'ok': True},
+            {'ok': False, 'error': 'Exam not found'},
+            {'ok': False, 'error': 'Invalid command'},
+            {'ok': False, 'error': 'Permission denied'},
+        ])
+        self.assertTrue(Comment.objects.filter(comment='comment text', exam=self.exam).exists())
+        self.assertTrue(Journaling.objects.filter(journaling_type=Journaling.EXAM_STATUS_ACK,
+                                                  exam=self.exam, proctor=self.user, note='started').exists())
+        self.assertEqual([call[1]['action'] for call in send_notification.call_args_list],
+                         ['new_comment', 'status_ack'])
+
+    @patch('proctoring.api_ui_views.send_notification')
+    def test_failed_commands(self, send_notification):
+        comment = {"comment": "bad start", "event_status": "Suspicious", "event_start": "soon",
+                   "event_finish": 1521843913, "duration": 198}
+        with patch('proctoring.api_ui_views._acknowledge_status', side_effect=[DatabaseError('gone'), None]), \
+                self.assertLogs('proctoring.api_ui_views', 'ERROR'):
+            response = self.post_commands([
+                {'user_id': self.user.pk, 'action': 'comment', 'codes': ['examCode'], 'comment': comment},
+                {'user_id': self.user.pk, 'action': 'comment', 'codes': ['examCode', 'unknown'],
+                 'comment': dict(comment, comment='partial', event_start=1521843813)},
+                {'user_id': self.user.pk, 'action': 'ack', 'codes': ['examCode'], 'status': 'started'},
+                {'user_id': self.user.pk, 'action': 'ack', 'codes': ['examCode'], 'status': 'started'},
+                {'user_id': self.user.pk, 'action': 'comment', 'codes': ['examCode'],
+                 'comment': dict(comment, comment='good', event_start=1521843813)},
+            ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'ok': False, 'error': 'Invalid command'},
+            {'ok': False, 'error': 'Exam not found'},
+            {'ok': False, 'error': 'Internal error'},
+            {'ok': True},
+            {'ok': True},
+        ])
+        # comments of the failed commands aren't saved for any exam
+        self.assertFalse(Comment.objects.filter(comment__in=['bad start', 'partial']).exists())
+        self.assertTrue(Comment.objects.filter(comment='good', exam=self.exam).exists())
+        self.assertEqual([call[1]['action'] for call in send_notification.call_args_list], ['new_comment'])
+
+
 class MockResponse:
     def __init__(self, status_code=200, content={"status": "ready_to_start"}):
         self.status_code = status_code
@@ -128,6 +128,42 @@ class JournalingRequestTestCase(TestCase):
             response = edx_api._journaling_request('post', 'test')
             self.assertEqual(response.content, '{"status": "ready_to_start"}')
             self.assertEqual(journaling_count + 1, Journaling.objects.count())
+            journaling = Journaling.objects.latest('pk')
+            self.assertEqual(journaling.journaling_type, Journaling.EDX_API_CALL)
+            self.assertEqual((journaling.endpoint, journaling.http_method, journaling.status_code),
+                             ('test', 'POST', 200))
+            self.assertIsNotNone(journaling.duration_ms)
+            self.assertEqual(json.loads(journaling.payload),
+                             {'sent': None, 'received': {'status': 'ready_to_start'}})
+
+    def test_sent(self):
+        with patch('proctoring.edx_api.requests.put') as requests:
+            requests.return_value = MockResponse(content='{}')
+            edx_api.stop_exam_request('code', 'submit', 1)
+            sent = {'action': 'submit', 'user_id': 1, 'initiator': 'proctor'}
+            self.assertEqual(json.loads(requests.call_args[1]['data']), sent)
+            self.assertEqual(json.loads(Journaling.objects.latest('pk').payload)['sent'], sent)
+
+    def test_endpoint(self):
+        with patch('proctoring.edx_api.requests.put') as requests:
+            requests.return_value = MockResponse(status_code=503, content='Unavailable')
+            edx_api.stop_exam_request('code', 'submit', 1)
+            journaling = Journaling.objects.latest('pk')
+            self.assertEqual(journaling.endpoint, 'api/edx_proctoring/v1/proctored_exam/attempt/')
+            self.assertEqual(journaling.status_code, 503)
+            self.assertEqual(journaling.note, 'PUT api/edx_proctoring/v1/proctored_exam/attempt/code -> 503')
+
+    def test_payload_limit(self):
+        with patch('proctoring.edx_api.requests.post') as requests:
+            requests.return_value = MockResponse(content=json.dumps({'data': 'x' * Journaling.PAYLOAD_LIMIT}))
+            edx_api._journaling_request('post', 'test')
+            edx_api.bulk_update_exams_statuses({'code': 'submitted'})
+            payload = json.loads(Journaling.objects.latest('pk').payload)
+            self.assertTrue(payload['truncated'])
+            # the data was sent as it is
+            self.assertEqual(payload['sent'], '{"attempts": {"code": "submitted"}}')
+            self.assertEqual(len(payload['sent'] + payload['received']), Journaling.PAYLOAD_LIMIT)
+            self.assertTrue(payload['received'].startswith('{"data": "xxx'))
 
     def test_get(self):
         with patch('proctoring.edx_api.requests.get') as requests:
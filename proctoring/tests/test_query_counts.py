@@ -0,0 +1,204 @@
+"""
+Query counts of the API endpoints: every endpoint is called with N rows
+of every model in DB and again with 2N rows, the number of queries must not grow
+"""
+import json
+from unittest.mock import patch
+
+from rest_framework.test import APIClient
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from edx_proctor_webassistant.urls import router
+from journaling.models import Journaling
+from person.models import Permission, Student
+from proctoring import urls as proctoring_urls
+from proctoring.models import (Comment, Course, EventSession, Exam,
+                               InProgressEventSession, UserSession)
+
+from .test_api_ui_views import EdxResponse, MockResponse
+
+ROWS = 3
+
+
+def exam_data(code, course_run):
+    return {
+        'examCode': code,
+        'organization': 'organization',
+        'duration': 1,
+        'reviewedExam': True,
+        'reviewerNotes': 'notes',
+        'examPassword': 'password',
+        'examSponsor': 'sponsor',
+        'examName': 'exam',
+        'ssiProduct': 'product',
+        'orgExtra': json.dumps({
+            'examStartDate': '2015-10-10 11:00',
+            'examEndDate': '2015-10-10 15:00',
+            'noOfStudents': 1,
+            'examID': 'main event',
+            'courseID': course_run,
+            'firstName': 'first',
+            'lastName': 'last',
+            'userID': '1',
+            'email': 'student@test.com',
+            'username': 'student',
+        }),
+    }
+
+
+@override_settings(NOTIFICATIONS={'COMMAND_SECRET': 'secret'})
+@patch('proctoring.api_edx_views.send_notification')
+@patch('proctoring.api_ui_views.send_notification')
+@patch('proctoring.api_ui_views.send_cache_bust')
+class QueryCountsTestCase(TestCase):
+    """
+    Endpoints are listed by url name; payloads are of the constant size,
+    only the rows in DB are added between the calls.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('proctor', 'proctor@test.com', 'password')
+        Permission.objects.create(user=self.user, object_id='*', object_type='*',
+                                  role=Permission.ROLE_PROCTOR)
+        self.course = Course.create_by_course_run('org/course/run')
+        self.student = Student.objects.create(sso_id=1, email='student@test.com')
+        # the hash key is generated on save of the in progress session
+        self.session = InProgressEventSession.objects.create(
+            testing_center='center', course=self.course, course_event_id='main event',
+            proctor=self.user)
+        self.exam = self.create_exam('main', self.session)
+        self.rows = 0
+        self.registered = 0
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # proctored_exams is wrapped by login_required
+        self.client.force_login(self.user)
+
+        edx_patches = {
+            'start_exam_request': MockResponse(),
+            'stop_exam_request': MockResponse(),
+            'send_review_request': MockResponse(),
+            'poll_status': EdxResponse({'status': 'verified'}),
+            'poll_statuses_attempts_request': {'main': 'created'},
+            'get_proctored_exams_request': MockResponse(content={'results': []}),
+        }
+        for name, value in edx_patches.items():
+            patcher = patch('proctoring.api_ui_views.%s' % name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('proctoring.api_ui_views.bulk_start_exams_request', side_effect=list)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_exam(self, code, session, proctor=None):
+        return Exam.objects.create(
+            exam_code=code, organization='org', duration=1, exam_password='password',
+            exam_sponsor='sponsor', exam_name='exam', ssi_product='product',
+            first_name='first', last_name='last', email='student@test.com',
+            course=session.course, student=self.student, event=session, proctor=proctor,
+            attempt_status='created')
+
+    def add_rows(self, count):
+        """
+        Every row is related to its own course and proctor, so the queries
+        per row aren't hidden by the caches of the related objects
+        """
+        for i in range(self.rows, self.rows + count):
+            proctor = User.objects.create_user('proctor%d' % i, 'proctor%d@test.com' % i, 'password')
+            course = Course.create_by_course_run('org%d/course%d/run' % (i, i))
+            Permission.objects.create(user=proctor, object_id='*', object_type='*',
+                                      role=Permission.ROLE_PROCTOR)
+            for session_proctor, session_status in ((self.user, EventSession.IN_PROGRESS),
+                                                    (proctor, EventSession.IN_PROGRESS),
+                                                    (proctor, EventSession.ARCHIVED)):
+                session = EventSession.objects.create(
+                    testing_center='center', course=course, course_event_id='event%d' % i,
+                    proctor=session_proctor, status=session_status)
+            for code, event in (('main%d' % i, self.session), ('exam%d' % i, session)):
+                exam = self.create_exam(code, event, proctor)
+                Comment.objects.create(comment='comment', event_status='Suspicious',
+                                       event_start=1, event_finish=2, duration=1, exam=exam)
+                UserSession.objects.create(exam=exam, session_id='session%d' % i, user_agent='agent',
+                                           browser='browser', os='os', ip_address='127.0.0.1', timestamp=1)
+                Journaling.objects.create(journaling_type=Journaling.EXAM_STATUS_CHANGE,
+                                          proctor=proctor, event=event, exam=exam)
+        self.rows += count
+
+    def endpoints(self):
+        """
+        :return: dict of url name: (method, url, data)
+        """
+        self.registered += 1
+        session_url = '/api/event_session/%d/' % self.session.pk
+        comment = {'comment': 'comment', 'event_status': 'Suspicious', 'event_start': 1,
+                   'event_finish': 2, 'duration': 1}
+        return {
+            'api-root': ('get', '/api/', None),
+            'exam-register-list': ('get', '/api/exam_register/?session=%s' % self.session.hash_key, None),
+            'exam-register-detail': ('get', '/api/exam_register/%d/?session=%s' % (
+                self.exam.pk, self.session.hash_key), None),
+            'exam-register-create': ('post', '/api/exam_register/', exam_data(
+                'registered%d' % self.registered, 'org/course/run')),
+            'event-session-list': ('get', '/api/event_session/', None),
+            'event-session-detail': ('get', session_url, None),
+            'event-session-create': ('post', '/api/event_session/', {
+                'testing_center': 'center', 'course_id': 'org/course/run', 'course_event_id': 'main event',
+                'course_name': 'course'}),
+            'event-session-update': ('patch', session_url, {'status': EventSession.IN_PROGRESS, 'notify': 'notify'}),
+            'archived-event-session-list': ('get', '/api/archived_event_session/', None),
+            'archived-event-session-all-list': ('get', '/api/archived_event_session_all/', None),
+            'journaling-list': ('get', '/api/journaling/', None),
+            'journaling-stats': ('get', '/api/journaling/stats/', None),
+            'journaling-archive-list': ('get', '/api/journaling_archive/?date=2015-12-04', None),
+            'permission-list': ('get', '/api/permission/', None),
+            'start_exam': ('get', '/api/start_exam/main', None),
+            'stop_exam': ('put', '/api/stop_exam/main', {'action': 'submit', 'user_id': 1}),
+            'stop_exams': ('put', '/api/stop_exams/', {
+                'attempts': [{'attempt_code': 'main', 'action': 'submit', 'user_id': 1}]}),
+            'bulk_start_exams': ('post', '/api/bulk_start_exam/', {'list': ['main']}),
+            'poll_status': ('post', '/api/poll_status/?result=1', {'list': ['main']}),
+            'comment': ('post', '/api/comment/', {'codes': ['main'], 'comment': comment}),
+            'notifications_ticket': ('get', '/api/notifications_ticket/', None),
+            'notifications_commands': ('post', '/api/notifications_commands/', {'commands': [
+                {'user_id': self.user.pk, 'action': 'ack', 'codes': ['main'], 'status': 'started'}]}),
+            'review': ('post', '/api/review/', {
+                'examMetaData': {'examCode': 'main'}, 'reviewStatus': 'Clean',
+                'videoReviewLink': 'http://video.url', 'desktopComments': []}),
+            'proctor_exams': ('get', '/api/proctored_exams/', None),
+        }
+
+    def count_queries(self):
+        """
+        :return: dict of url name: number of queries
+        """
+        counts = {}
+        for name, (method, url, data) in self.endpoints().items():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(
+                    url, data, format='json', HTTP_X_NOTIFICATIONS_TOKEN='secret')
+                if response.streaming:
+                    # the queries of the streaming responses run while the content is read
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 300, '%s: %s' % (name, response.status_code))
+            counts[name] = len(queries)
+        return counts
+
+    def test_all_endpoints(self, *mocks):
+        names = {pattern.name for pattern in router.urls + proctoring_urls.urlpatterns}
+        endpoints = set(self.endpoints())
+        # the router names its create and update views as the list and detail ones
+        endpoints -= {'exam-register-create', 'event-session-create', 'event-session-update'}
+        self.assertEqual(names - endpoints, set())
+
+    def test_constant(self, *mocks):
+        self.add_rows(ROWS)
+        # the first calls fill the caches and create the objects found by the next calls
+        self.count_queries()
+        small = self.count_queries()
+        self.add_rows(ROWS)
+        large = self.count_queries()
+        self.assertEqual({name: (small[name], large[name]) for name in small if small[name] != large[name]}, {})
@@ -0,0 +1,112 @@
+"""
+Query plans of the hot queries: every one should use an index on a seeded dataset
+"""
+import re
+from datetime import datetime, timedelta
+from unittest import SkipTest
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from journaling.models import Journaling
+from person.models import Permission, Student
+from proctoring.models import Course, EventSession, Exam, InProgressEventSession
+
+# queries of the notification daemon, see notifications/webapp.py
+DAEMON_COURSE_SQL = "SELECT id FROM proctoring_course WHERE display_name=%s"
+DAEMON_EXAM_SQL = ("SELECT id, attempt_status, attempt_status_updated FROM proctoring_exam"
+                   " WHERE course_id=%s AND exam_code=%s")
+DAEMON_SNAPSHOT_SQL = (
+    "SELECT e.exam_code, e.attempt_status, e.attempt_status_updated, e.actual_end_date,"
+    " (SELECT COUNT(*) FROM proctoring_comment c WHERE c.exam_id=e.id) AS comments"
+    " FROM proctoring_exam e INNER JOIN proctoring_eventsession s ON s.id=e.event_id"
+    " WHERE s.course_event_id=%s AND s.status=%s")
+
+
+def full_scans(sql, params=()):
+    """
+    :return: steps of the query plan which read the whole table
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            steps = [row[-1] for row in cursor.fetchall()]
+            return [step for step in steps if re.match(r'SCAN (TABLE )?\w+( AS \w+)?$', step)]
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            steps = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return ['%s: %s' % (step['table'], step['type']) for step in steps if step['type'] == 'ALL']
+    raise SkipTest('Query plans are checked only for SQLite and MySQL')
+
+
+class QueryPlansTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user('proctor%d' % i, 'proctor%d@test.com' % i, 'password')
+                     for i in range(20)]
+        Permission.objects.bulk_create(
+            Permission(user=user, object_id='*', object_type='*', role=role)
+            for user in cls.users for role in (Permission.ROLE_PROCTOR, Permission.ROLE_INSTRUCTOR))
+        cls.courses = [Course.create_by_course_run('org%d/course%d/run' % (i, i)) for i in range(20)]
+        student = Student.objects.create(sso_id=1, email='student@test.com')
+        EventSession.objects.bulk_create(
+            EventSession(testing_center='center', course=course, course_event_id='event%d-%d' % (i, j),
+                         proctor=cls.users[i], status=EventSession.ARCHIVED if j else EventSession.IN_PROGRESS,
+                         hash_key='hash%d-%d' % (i, j))
+            for i, course in enumerate(cls.courses) for j in range(10))
+        cls.session = EventSession.objects.get(course_event_id='event0-0')
+        sessions = list(EventSession.objects.all())
+        Exam.objects.bulk_create(
+            Exam(exam_code='code%d' % i, organization='org', duration=1, exam_password='password',
+                 exam_sponsor='sponsor', exam_name='exam', ssi_product='product', course=session.course,
+                 student=student, event=session, attempt_status='started' if i % 2 else 'submitted')
+            for i, session in enumerate(sessions * 5))
+        Journaling.objects.bulk_create(
+            Journaling(journaling_type=i % 10 + 1, note='note') for i in range(1000))
+
+    def assertIndexed(self, sql, params=()):
+        scans = full_scans(sql, params)
+        self.assertEqual(scans, [], 'Full scan in the plan of %s' % sql)
+
+    def assertQuerysetIndexed(self, queryset):
+        self.assertIndexed(*queryset.query.sql_with_params())
+
+    def test_session_close(self):
+        self.assertQuerysetIndexed(Exam.objects.filter(event=self.session).exclude(
+            attempt_status__in=settings.FINAL_ATTEMPT_STATUSES))
+
+    def test_session_lookup(self):
+        self.assertQuerysetIndexed(InProgressEventSession.objects.filter(
+            course=self.courses[0], course_event_id='event0-0').order_by('-start_date'))
+
+    def test_course_lookup(self):
+        self.assertQuerysetIndexed(Course.objects.filter(display_name=self.courses[0].display_name))
+        self.assertIndexed(DAEMON_COURSE_SQL, [self.courses[0].display_name])
+
+    def test_daemon_exam(self):
+        self.assertIndexed(DAEMON_EXAM_SQL, [self.courses[0].pk, 'code1'])
+
+    def test_daemon_snapshot(self):
+        self.assertIndexed(DAEMON_SNAPSHOT_SQL, ['event0-0', EventSession.IN_PROGRESS])
+
+    def test_journaling(self):
+        start = datetime.now() - timedelta(days=1)
+        self.assertQuerysetIndexed(Journaling.objects.filter(
+            datetime__gte=start, datetime__lt=start + timedelta(days=1)).order_by('-pk'))
+        self.assertQuerysetIndexed(Journaling.objects.filter(
+            journaling_type=Journaling.EXAM_COMMENT,
+            datetime__gte=start, datetime__lt=start + timedelta(days=1)).order_by('-pk'))
+
+    def test_journaling_http_calls(self):
+        start = datetime.now() - timedelta(days=1)
+        self.assertQuerysetIndexed(Journaling.objects.filter(
+            status_code__gte=500, status_code__lt=600, datetime__gte=start).values('endpoint'))
+        self.assertQuerysetIndexed(Journaling.objects.filter(
+            endpoint='api/edx_proctoring/v1/proctored_exam/attempt/', datetime__gte=start).values('status_code'))
+
+    def test_permissions(self):
+        self.assertQuerysetIndexed(Permission.objects.filter(user=self.users[0], role=Permission.ROLE_PROCTOR))
@@ -18,6 +18,10 @@ urlpatterns = [
         name='poll_status'),
     url(r'comment/$', api_ui_views.Comment.as_view(),
         name='comment'),
+    url(r'notifications_ticket/$', api_ui_views.NotificationsTicket.as_view(),
+        name='notifications_ticket'),
+    url(r'notifications_commands/$', api_ui_views.NotificationCommands.as_view(),
+        name='notifications_commands'),
     url(r'review/$', api_ui_views.Review.as_view(),
         name='review'),
     url(r'proctored_exams/$', login_required(api_ui_views.GetExamsProctored.as_view()),
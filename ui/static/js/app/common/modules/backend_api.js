@@ -122,5 +122,12 @@
                 })
             });
         };
+
+        this.get_notifications_ticket = function(){
+            return generic_api_call({
+                'url': get_url('notifications_ticket'),
+                'method': 'GET'
+            });
+        };
     }]);
 })();
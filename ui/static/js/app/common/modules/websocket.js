@@ -1,6 +1,118 @@
 (function () {
-    angular.module('websocket', []).factory('WS', ['$rootScope', function ($rootScope) {
+    angular.module('websocket', []).factory('WS', ['$rootScope', '$q', '$injector', function ($rootScope, $q, $injector) {
         var sock, sock_params = {}, force_close = false;
+        // proctor commands sent over the socket: id -> deferred waiting for the result
+        var pendingCommands = {}, commandSeq = 0, authenticated = null;
+        // position of the client in the room's messages sequence
+        var room = {channel: null, epoch: null, seq: 0};
+        var ring = null;
+
+        // multiplication modulo 2^32 without losing precision
+        var mul32 = function (a, b) {
+            return ((a & 0xffff) * b + ((((a >>> 16) * b) & 0xffff) << 16)) >>> 0;
+        };
+
+        // the same as ring_hash in notifications/sharding.py
+        var ringHash = function (value) {
+            var hash = 0x811c9dc5;
+            value = String(value);
+            for (var i = 0; i < value.length; i++) {
+                hash = mul32((hash ^ value.charCodeAt(i)) >>> 0, 0x01000193);
+            }
+            hash = mul32((hash ^ (hash >>> 16)) >>> 0, 0x85ebca6b);
+            hash = mul32((hash ^ (hash >>> 13)) >>> 0, 0xc2b2ae35);
+            return (hash ^ (hash >>> 16)) >>> 0;
+        };
+
+        // daemon serving the room in the sharded mode, see HashRing in notifications/sharding.py
+        var shardOf = function (course_event_id) {
+            var shards = window.app.notificationsShards || [];
+            if (!shards.length) {
+                return null;
+            }
+            if (ring === null) {
+                ring = [];
+                angular.forEach(shards, function (shard) {
+                    for (var i = 0; i < 160; i++) {
+                        ring.push([ringHash(shard + '#' + i), shard]);
+                    }
+                });
+                ring.sort(function (a, b) {
+                    return a[0] - b[0] || (a[1] < b[1] ? -1 : (a[1] > b[1] ? 1 : 0));
+                });
+            }
+            var hash = ringHash(course_event_id);
+            for (var j = 0; j < ring.length; j++) {
+                if (ring[j][0] >= hash) {
+                    return ring[j][1];
+                }
+            }
+            return ring[0][1];
+        };
+
+        var notificationsUrl = function (course_event_id) {
+            var shard = shardOf(course_event_id);
+            var url = window.app.notificationsUrl.replace(/\/$/, '');
+            return shard === null ? window.app.notificationsUrl : url + '/' + shard;
+        };
+
+        var resolveCommand = function (id, msg) {
+            var deferred = pendingCommands[id];
+            if (deferred) {
+                delete pendingCommands[id];
+                if (msg.ok) {
+                    deferred.resolve(msg);
+                } else {
+                    deferred.reject(msg);
+                }
+            }
+        };
+
+        var rejectCommands = function () {
+            angular.forEach(pendingCommands, function (deferred) {
+                deferred.reject({ok: false, error: 'Connection closed'});
+            });
+            pendingCommands = {};
+            authenticated = null;
+        };
+
+        // the connection is authenticated once by the ticket from the web assistant
+        var authenticate = function () {
+            if (authenticated === null) {
+                var deferred = $q.defer();
+                authenticated = deferred.promise;
+                $injector.get('Api').get_notifications_ticket().then(function (response) {
+                    if (sock === null) {
+                        return deferred.reject({ok: false, error: 'Connection closed'});
+                    }
+                    pendingCommands.auth = deferred;
+                    sock.send(JSON.stringify({action: 'auth', ticket: response.data.ticket}));
+                }, function () {
+                    deferred.reject({ok: false, error: 'No ticket'});
+                });
+                authenticated.catch(function () {
+                    authenticated = null;
+                });
+            }
+            return authenticated;
+        };
+
+        var canCommand = function () {
+            return !!window.app.notificationsCommands && !!sock && sock.readyState === SockJS.OPEN;
+        };
+
+        var command = function (action, data) {
+            return authenticate().then(function () {
+                if (sock === null) {
+                    return $q.reject({ok: false, error: 'Connection closed'});
+                }
+                var deferred = $q.defer();
+                var id = String(++commandSeq);
+                pendingCommands[id] = deferred;
+                sock.send(JSON.stringify(angular.extend({}, data, {action: action, id: id})));
+                return deferred.promise;
+            });
+        };
 
         var disconnect = function() {
           force_close = true;
@@ -22,11 +134,18 @@
             if (startNew) {
                 force_close = false;
             }
+            if (startNew || room.channel !== course_event_id) {
+                room = {channel: course_event_id, epoch: null, seq: 0};
+            }
 
             sock_params.channel = course_event_id;
             sock_params.callback = callback;
-            var sock_url = document.location.protocol + '//' + $rootScope.apiConf.ioServer + window.app.notificationsUrl +
+            var sock_url = document.location.protocol + '//' + $rootScope.apiConf.ioServer + notificationsUrl(course_event_id) +
                 '?course_event_id=' + course_event_id;
+            if (room.epoch !== null) {
+                // server replays only missed messages
+                sock_url += '&epoch=' + room.epoch + '&last_seq=' + room.seq;
+            }
             sock = new SockJS(sock_url);
 
             sock.onopen = function () {
@@ -34,11 +153,43 @@
                 force_close = false;
             };
             sock.onmessage = function (e) {
-                try {
-                    callback(e.data, onAttemptStatusUpdateCallback, onSessionClose);
-                } catch (err) {
-                    console.log("SockJS onmessage error", err);
+                var msg = e.data;
+                if (msg && (msg.action === 'auth' || msg.action === 'command_result')) {
+                    $rootScope.$apply(function () {
+                        resolveCommand(msg.action === 'auth' ? 'auth' : msg.id, msg);
+                    });
+                    return;
+                }
+                if (msg && (msg.action === 'hello' || msg.action === 'resync')) {
+                    room.epoch = msg.epoch;
+                    room.seq = msg.seq;
+                    var synced = false;
+                    if (msg.exams) {
+                        try {
+                            synced = callback({action: 'snapshot', exams: msg.exams},
+                                onAttemptStatusUpdateCallback, onSessionClose);
+                        } catch (err) {
+                            console.log("SockJS snapshot error", err);
+                        }
+                    }
+                    if (msg.action === 'resync' && !synced && onErrorCloseCallback) {
+                        // missed messages are lost and snapshot isn't enough, full reload is needed
+                        onErrorCloseCallback(function() {});
+                    }
+                    return;
+                }
+                if (msg && msg.seq) {
+                    room.seq = msg.seq;
                 }
+                // server may coalesce several messages into one frame
+                var messages = (msg && msg.action === 'batch') ? msg.messages : [msg];
+                angular.forEach(messages, function (m) {
+                    try {
+                        callback(m, onAttemptStatusUpdateCallback, onSessionClose);
+                    } catch (err) {
+                        console.log("SockJS onmessage error", err);
+                    }
+                });
             };
             sock.onerror = function (e) {
                 console.log('SockJS error:', e);
@@ -46,16 +197,17 @@
             sock.onclose = function () {
                 console.log("SockJS connection closed");
                 sock = null;
+                rejectCommands();
                 if (reconnect !== undefined && reconnect === true && !force_close && $rootScope.sessionPageRunning) {
                     setTimeout(function() {
-                        if (onErrorCloseCallback) {
+                        if (onErrorCloseCallback && room.epoch === null) {
                             onErrorCloseCallback(function() {
                                 init(course_event_id, callback, reconnect,
                                     onAttemptStatusUpdateCallback, onErrorCloseCallback, onSessionClose);
                             });
                         } else {
-                            init(course_event_id, callback, reconnect, onAttemptStatusUpdateCallback, null,
-                                onSessionClose);
+                            init(course_event_id, callback, reconnect, onAttemptStatusUpdateCallback,
+                                onErrorCloseCallback, onSessionClose);
                         }
 
                     }, 3000);
@@ -70,7 +222,9 @@
 
         return {
             init: init,
-            disconnect: disconnect
+            disconnect: disconnect,
+            canCommand: canCommand,
+            command: command
         };
     }]);
 })();
\ No newline at end of file
@@ -196,8 +196,36 @@
                 }
             };
 
+            // apply room snapshot from the notification server
+            // returns false if some attempts or comments are unknown and must be loaded from the server
+            var applySnapshot = function (exams, onAttemptStatusUpdateCallback) {
+                var complete = true;
+                angular.forEach(exams, function (exam, code) {
+                    var item = self.findAttempt(code);
+                    if (!item) {
+                        complete = false;
+                        return;
+                    }
+                    var prevStatus = item.status;
+                    if (exam.end_date && !item.finished_at) {
+                        item.finished_at = moment(exam.end_date).format('HH:mm');
+                    }
+                    if (exam.status && updateStatus(code, exam.status, exam.updated)) {
+                        self.updateCounters(item, prevStatus);
+                        onAttemptStatusUpdateCallback(item, prevStatus, code, exam.status);
+                    }
+                    if (item.comments.length < exam.comments) {
+                        complete = false;
+                    }
+                });
+                return complete;
+            };
+
             this.websocket_callback = function(msg, onAttemptStatusUpdateCallback, onSessionClose) {
                 if (msg) {
+                    if (msg.action === 'snapshot') {
+                        return applySnapshot(msg.exams, onAttemptStatusUpdateCallback);
+                    }
                     if (msg.examCode) {
                         self.addNewAttempt(msg);
                         return;
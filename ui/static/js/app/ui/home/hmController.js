@@ -600,7 +600,7 @@
             }]);
 
     angular.module('proctor').controller('ReviewCtrl', function ($scope, $uibModalInstance, i18n, TestSession, Api,
-                                                                 DateTimeService, params) {
+                                                                 DateTimeService, WS, params) {
         var session = TestSession.getSession();
         var okCallback = params.okCallback;
         var errorCallback = params.errorCallback;
@@ -693,7 +693,11 @@
                     event_type: $scope.comment.type,
                     event_status: $scope.available_statuses_dict[$scope.comment.type]
                 };
-                Api.save_comment(params.attemptCodes, obj).then(
+                // the open notifications connection is cheaper than the separate request
+                var saved = WS.canCommand() ?
+                    WS.command('comment', {codes: params.attemptCodes, comment: obj}) :
+                    Api.save_comment(params.attemptCodes, obj);
+                saved.then(
                     function () {
                         $uibModalInstance.close();
                         if (okCallback) {
@@ -49,6 +49,9 @@ class Index(View):
                 'logo_is_url': settings.LOGO_NAME.startswith('http') if settings.LOGO_NAME else False,
                 'login_url': login_url,
                 'notifications_url': settings.NOTIFICATIONS['WEB_URL'],
+                'notifications_shards': json.dumps(sorted(str(daemon_id) for daemon_id
+                                                          in settings.NOTIFICATIONS.get('SHARDS', {}))),
+                'notifications_commands': bool(settings.NOTIFICATIONS.get('COMMAND_SECRET')),
                 'profile_url': TpBackend.PROFILE_URL,
                 'spa_config': json.dumps(settings.SPA_CONFIG),
                 'suspicious_attempt_sound': settings.SUSPICIOUS_ATTEMPT_SOUND,